@@ -0,0 +1,446 @@
+import os
+import time
+import random
+import asyncio
+import argparse
+import numpy as np
+import pytweening
+from MacroPlayer import MacroPlayer
+from CursorInjector import CursorInjector
+from PlaybackScheduler import PlaybackScheduler
+from MacroCompiler import MOVE_TO, MOVE_PATH, MOVE_LIVE, KEY_PRESS, KEY_RELEASE, MOUSE_PRESS, MOUSE_RELEASE, WAIT_FOR, TAP, CLICK, TYPE
+
+
+class PlaybackAborted(Exception):
+    """Raised inside timelines waiting on a PlaybackControl that has been aborted"""
+
+
+class PlaybackControl:
+    def __init__(self, spin_threshold=0.001):
+        """
+        Pause, resume, skip and abort state shared by the timelines of an AsyncPlayer.
+        Timelines run on a virtual clock, perf_counter less time spent paused, so pausing holds every timeline where it
+        is and resuming carries on with the same gaps between events. Keys and buttons held by the timelines are released
+        while paused and pressed again on resume. Skipping moves each waiting timeline's own clock on to the end of its
+        wait, timelines part way through a move carry on.
+        pause, resume, toggle_pause, skip and abort can be called from any thread, eg a pynput listener,
+        every waiting timeline is woken as soon as the event loop picks the request up.
+        Seconds from each request to the event loop acting on it are kept in self.reactions.
+        --------
+        Args:
+        --spin_threshold: Float, seconds before a deadline where waits stop sleeping in the event loop and yield to it
+            until the deadline instead, the loop's timers are only accurate to about a millisecond
+        """
+        self.spin_threshold = spin_threshold
+        self.loop = None
+        self.wakeup = None
+        self.offset = 0.0
+        self.paused_at = None
+        self.aborted = False
+        # (timeline, virtual time its wait can be skipped to) of every skippable wait, frames of moves are not skippable
+        self.waiting = {}
+        self.timelines = []
+        self.reactions = []
+
+    def attach(self, loop, timelines=()):
+        """
+        Binds control to the running event loop and the timelines it pauses, called by AsyncPlayer before they start
+        """
+        self.loop = loop
+        self.wakeup = loop.create_future()
+        self.timelines = list(timelines)
+
+    def now(self, timeline=None):
+        """
+        Current virtual time, frozen while paused, plus the time skipped by timeline when given
+        """
+        skipped = timeline.skipped if timeline is not None else 0.0
+        return (self.paused_at if self.paused_at is not None else time.perf_counter()) - self.offset + skipped
+
+    def pause(self):
+        self.request("pause")
+
+    def resume(self):
+        self.request("resume")
+
+    def toggle_pause(self):
+        self.request("toggle")
+
+    def skip(self):
+        """
+        Ends the current wait of every timeline waiting for its next event or a checkpoint, the event fires straight away
+        """
+        self.request("skip")
+
+    def abort(self):
+        self.request("abort")
+
+    def request(self, action):
+        """
+        Applies action on the event loop thread, straight away when already on it
+        """
+        requested = time.perf_counter()
+        if self.loop is None:
+            self.apply(action, requested)
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self.apply(action, requested)
+        else:
+            self.loop.call_soon_threadsafe(self.apply, action, requested)
+
+    def apply(self, action, requested):
+        now = time.perf_counter()
+        if action == "toggle":
+            action = "resume" if self.paused_at is not None else "pause"
+        if action == "pause" and self.paused_at is None:
+            self.paused_at = now
+            for timeline in self.timelines:
+                timeline.suspend()
+        elif action == "resume" and self.paused_at is not None:
+            for timeline in self.timelines:
+                timeline.restore()
+            self.offset += now - self.paused_at
+            self.paused_at = None
+        elif action == "skip":
+            for timeline, skip_to in list(self.waiting.values()):
+                timeline.skipped += max(0.0, skip_to - self.now(timeline))
+        elif action == "abort":
+            self.aborted = True
+        self.reactions.append(now - requested)
+        self.wake()
+
+    def wake(self):
+        """
+        Wakes every waiting timeline so it rechecks the clock
+        """
+        if self.wakeup is not None:
+            if not self.wakeup.done():
+                self.wakeup.set_result(None)
+            self.wakeup = self.loop.create_future()
+
+    async def wait_until(self, deadline, timeline=None, skip_to=None):
+        """
+        Waits until timeline's virtual clock reaches deadline, for as long as playback is paused, raises PlaybackAborted
+        on abort. Skipping moves timeline's clock on to skip_to, deadline by default, frames pass False so they are never skipped
+        """
+        key = object()
+        skip_to = deadline if skip_to is None else skip_to
+        try:
+            while True:
+                if self.aborted:
+                    raise PlaybackAborted()
+                remaining = deadline - self.now(timeline)
+                if self.paused_at is None and remaining <= 0:
+                    return
+                if timeline is not None and skip_to is not False:
+                    self.waiting[key] = (timeline, skip_to)
+                if self.paused_at is not None:
+                    await asyncio.wait({self.wakeup})
+                elif remaining > self.spin_threshold:
+                    await asyncio.wait({self.wakeup}, timeout=remaining - self.spin_threshold)
+                else:
+                    await asyncio.sleep(0)
+        finally:
+            self.waiting.pop(key, None)
+
+    def report(self):
+        """
+        Prints how quickly control requests were acted on
+        """
+        if self.reactions:
+            print("Control: {} requests, reaction mean {:.3f} ms, max {:.3f} ms".format(
+                len(self.reactions), sum(self.reactions) / len(self.reactions) * 1000, max(self.reactions) * 1000))
+
+
+class MacroTimeline:
+    def __init__(self, player, name=None, frame_rate=125):
+        """
+        One macro played as a coroutine by AsyncPlayer. The player's compiled plan is dispatched against deadlines on the
+        PlaybackControl clock, never blocking the event loop so other timelines play alongside it.
+        Moves are emitted as frames through the backend's set_position, inputs still held when playback is aborted are released.
+        --------
+        Args:
+        --player: MacroPlayer, macro, settings, trajectory library and backend the timeline plays with
+        --name: String, shown in the report, defaults to the macro file name
+        --frame_rate: Int, frames per second moves are emitted at
+        """
+        self.player = player
+        self.name = name if name is not None else os.path.basename(player.macro_file)
+        self.frame_rate = frame_rate
+        self.backend = player.backend
+        self.scheduler = PlaybackScheduler()
+        self.plan = None
+        self.held = {}
+        self.aborted = False
+        # Seconds this timeline's clock was moved on by skips, and whether held inputs are released for a pause
+        self.skipped = 0.0
+        self.suspended = False
+
+    def prepare(self):
+        """
+        Compiles the plan, done for every timeline before the clock starts as compiling blocks the event loop
+        """
+        seed = self.player.seed if self.player.seed is not None else random.randrange(2 ** 32)
+        self.plan = self.player.get_plan(seed)
+
+    async def play(self, control, start):
+        """
+        Plays the plan number_of_plays times from virtual time start, returns False when aborted
+        """
+        if self.plan is None:
+            self.prepare()
+        play_time = self.plan[-1].time if self.plan else 0.0
+        base = start
+        try:
+            for loop in range(self.player.number_of_plays):
+                for step in self.plan:
+                    base = await self.dispatch(step, base, control)
+                base += play_time
+        except PlaybackAborted:
+            self.aborted = True
+            self.release_held()
+            return False
+        return True
+
+    async def dispatch(self, step, base, control):
+        """
+        Executes a single plan step, same as MacroPlayer.dispatch
+        """
+        start = base + step.time
+        if step.opcode == WAIT_FOR:
+            deadline = start + step.duration
+            return base - (deadline - await self.wait_for(step.value, start, deadline, control))
+        if step.opcode == MOVE_LIVE:
+            deadline = start + step.duration
+            travel = 0.0 if self.player.movement_type == "instant" else min(step.duration, self.player.max_travel)
+            await self.move(step.x, step.y, deadline - travel, travel, pytweening.linear, control)
+        elif step.opcode == MOVE_TO:
+            await self.move(step.x, step.y, start, step.duration, step.value, control)
+        elif step.opcode == MOVE_PATH:
+            # Points are spread evenly so the last lands on the end of the move, as in MacroPlayer.inject_path
+            offsets = step.duration * np.arange(1, len(step.points) + 1) / len(step.points)
+            await self.emit(step.points, start + offsets, control)
+        else:
+            await control.wait_until(start, self)
+            self.scheduler.mark(start, control.now(self))
+            if step.opcode == KEY_PRESS:
+                self.backend.key_press(step.value)
+                self.held[("key", step.value)] = step.value
+            elif step.opcode == KEY_RELEASE:
+                self.backend.key_release(step.value)
+                self.held.pop(("key", step.value), None)
+            elif step.opcode == MOUSE_PRESS:
+                self.backend.mouse_press(step.value)
+                self.held[("button", step.value)] = step.value
+            elif step.opcode == MOUSE_RELEASE:
+                self.backend.mouse_release(step.value)
+                self.held.pop(("button", step.value), None)
+            elif step.opcode == TAP:
+                self.backend.tap(step.value)
+            elif step.opcode == CLICK:
+                self.backend.click(step.value)
+            elif step.opcode == TYPE:
+                self.backend.type_text(step.value)
+        return base
+
+    async def move(self, x, y, start, duration, tween, control):
+        """
+        Moves cursor from wherever it is at start to x, y over duration seconds following tween
+        """
+        await control.wait_until(start, self)
+        if duration <= 0:
+            self.backend.set_position(x, y)
+            return
+        points, offsets = CursorInjector.tween_points(self.backend.position(), x, y, duration, tween, self.frame_rate)
+        await self.emit(points, start + offsets, control)
+
+    async def emit(self, points, times, control):
+        """
+        Sets the cursor to each point at its virtual time, resampled to the frame rate
+        """
+        frame_times, frame_x, frame_y = CursorInjector.frames_of(points, times, self.frame_rate)
+        for frame_time, x, y in zip(frame_times, frame_x, frame_y):
+            await control.wait_until(frame_time, self, False)
+            self.backend.set_position(x, y)
+        self.backend.fail_safe_check()
+
+    async def wait_for(self, checkpoint, start, deadline, control, min_interval=0.005, max_interval=0.05):
+        """
+        Polls a checkpoint from start until it matches or deadline passes, as ScreenCheckpoint.wait but yielding to the
+        other timelines between polls. Returns when the wait ended on the virtual clock
+        """
+        await control.wait_until(start, self)
+        stats = self.player.checkpoint_stats
+        interval = min_interval
+        while True:
+            stats["polls"] += 1
+            if checkpoint.matches(self.backend.grab_region(*checkpoint.region)):
+                matched = control.now(self)
+                stats["matched"] += 1
+                stats["saved"] += max(0.0, deadline - matched)
+                return min(matched, deadline)
+            if control.now(self) >= deadline:
+                stats["timed_out"] += 1
+                return deadline
+            # Skipping gives up on the checkpoint
+            await control.wait_until(min(control.now(self) + interval, deadline), self, deadline)
+            interval = min(interval * 1.5, max_interval)
+
+    def release_held(self):
+        """
+        Releases keys and buttons left pressed by an aborted play
+        """
+        if not self.suspended:
+            self.suspend()
+        self.suspended = False
+        self.held = {}
+
+    def suspend(self):
+        """
+        Releases held keys and buttons for a pause, latest pressed first, they stay in self.held to be pressed again
+        """
+        if self.suspended:
+            return
+        for (kind, _), value in reversed(list(self.held.items())):
+            if kind == "key":
+                self.backend.key_release(value)
+            else:
+                self.backend.mouse_release(value)
+        self.suspended = True
+
+    def restore(self):
+        """
+        Presses the keys and buttons released by suspend again, in the order they were first pressed
+        """
+        if not self.suspended:
+            return
+        for (kind, _), value in self.held.items():
+            if kind == "key":
+                self.backend.key_press(value)
+            else:
+                self.backend.mouse_press(value)
+        self.suspended = False
+
+    def report(self):
+        """
+        Prints lateness statistics of the timeline
+        """
+        print("Timeline {}{}:".format(self.name, " (aborted)" if self.aborted else ""))
+        self.scheduler.report()
+
+
+class AsyncPlayer:
+    def __init__(self, timelines, hotkeys=True, pause_key="f9", skip_key="f10", abort_key="f12"):
+        """
+        Plays several MacroTimelines at once in one asyncio event loop, eg a keyboard only macro alongside a mouse macro.
+        All timelines share one PlaybackControl, when hotkeys is on a pynput listener pauses and resumes, skips the
+        current wait or aborts playback. Hotkeys are pressed by the user, macros containing them will trigger them too.
+        --------
+        Args:
+        --timelines: List, MacroTimelines to play, all start together
+        --hotkeys: Boolean, listens for the hotkeys below, needs a display
+        --pause_key: String, name of the pynput Key that pauses and resumes playback
+        --skip_key: String, name of the pynput Key that skips to the next event
+        --abort_key: String, name of the pynput Key that stops playback, held keys and buttons are released
+        """
+        self.hotkeys = None
+        if hotkeys:
+            from pynput import keyboard
+            for key in (pause_key, skip_key, abort_key):
+                if not hasattr(keyboard.Key, key):
+                    raise ValueError("hotkeys must be pynput Key names such as 'f9', got {!r}.".format(key))
+            self.hotkeys = {getattr(keyboard.Key, pause_key): "toggle", getattr(keyboard.Key, skip_key): "skip",
+                            getattr(keyboard.Key, abort_key): "abort"}
+        self.timelines = list(timelines)
+        self.control = PlaybackControl()
+        self.listener = None
+
+    def run(self):
+        """
+        Plays every timeline to the end or until aborted, returns True when none were aborted
+        """
+        return asyncio.run(self.play())
+
+    async def play(self):
+        self.control.attach(asyncio.get_running_loop(), self.timelines)
+        for timeline in self.timelines:
+            timeline.prepare()
+        self.start_listener()
+        try:
+            start = self.control.now()
+            finished = await asyncio.gather(*(self.play_timeline(timeline, start) for timeline in self.timelines))
+        finally:
+            self.stop_listener()
+        self.report()
+        return all(finished)
+
+    async def play_timeline(self, timeline, start):
+        try:
+            return await timeline.play(self.control, start)
+        except Exception:
+            # One failing timeline stops the rest rather than leaving them playing unattended
+            self.control.abort()
+            timeline.release_held()
+            raise
+
+    def start_listener(self):
+        if self.hotkeys is None:
+            return
+        from pynput.keyboard import Listener as KeyboardListener
+        self.listener = KeyboardListener(on_press=self.on_press)
+        self.listener.start()
+
+    def stop_listener(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    # Runs on the pynput listener thread, the request is handed to the event loop
+    def on_press(self, key):
+        action = self.hotkeys.get(key)
+        if action is not None:
+            self.control.request(action)
+
+    def report(self):
+        """
+        Prints each timeline's timing and the control reaction times
+        """
+        for timeline in self.timelines:
+            timeline.report()
+            timeline.player.report_checkpoints()
+            if timeline.player.index is not None:
+                timeline.player.index.report()
+        self.control.report()
+
+
+def main(macro_files, movement_type, number_of_plays, max_random_px, seed, frame_rate, hotkeys, pause_key, skip_key, abort_key):
+    timelines = []
+    for macro_file in macro_files:
+        save_path, save_file = os.path.split(os.path.abspath(macro_file))
+        player = MacroPlayer(save_path, save_file, movement_type, number_of_plays, max_random_px, precompile=True, seed=seed)
+        timelines.append(MacroTimeline(player, frame_rate=frame_rate))
+    AsyncPlayer(timelines, hotkeys, pause_key, skip_key, abort_key).run()
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("--macro_file", type=str, nargs="+", required=True, help="String - Paths of macro files to play together, one timeline each")
+    argParser.add_argument("--movement_type", type=str, required=False, help="String - Determine mouse movement type must be 'instant','simple' or 'human'")
+    argParser.add_argument("--number_of_plays", type=int, required=False, help="Integer - Number of times each timeline plays its macro")
+    argParser.add_argument("--max_random_px", type=int, required=False, help="Integer - Max distance in pixels a human movement can end from the recorded coords")
+    argParser.add_argument("--seed", type=int, required=False, help="Integer - Seed for all playback randomness so runs are reproducible")
+    argParser.add_argument("--frame_rate", type=int, required=False, help="Integer - Frames per second cursor moves are emitted at")
+    argParser.add_argument('--no_hotkeys', dest='hotkeys', action='store_false', help="Flag - Turns off the pause, skip and abort hotkeys")
+    argParser.add_argument("--pause_key", type=str, required=False, help="String - Key that pauses and resumes playback, eg 'f9'")
+    argParser.add_argument("--skip_key", type=str, required=False, help="String - Key that skips the current wait, eg 'f10'")
+    argParser.add_argument("--abort_key", type=str, required=False, help="String - Key that stops playback, eg 'f12'")
+    argParser.set_defaults(movement_type='human', number_of_plays=1, max_random_px=10, seed=None, frame_rate=125,
+                           hotkeys=True, pause_key='f9', skip_key='f10', abort_key='f12')
+    args = argParser.parse_args()
+
+    main(args.macro_file, args.movement_type, args.number_of_plays, args.max_random_px, args.seed, args.frame_rate,
+         args.hotkeys, args.pause_key, args.skip_key, args.abort_key)
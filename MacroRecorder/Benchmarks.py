@@ -0,0 +1,835 @@
+import io
+import os
+import sys
+import shutil
+import subprocess
+import json
+import contextlib
+import time
+import argparse
+import math
+import random
+import timeit
+import tempfile
+import tracemalloc
+import threading
+import numpy as np
+from BezierCurve import BezierCurve
+from GenerateCurve import GenerateCurve
+from NoiseAndTween import NoiseAndTween
+from MacroReader import MacroReader
+from MacroEvents import MacroEvents
+from BinaryMacro import BinaryMacro, write_binary, write_json
+from SimpleTimer import SimpleTimer
+from EventCapture import EventCapture
+from MacroPlayer import MacroPlayer
+from OutputBackend import RecordingBackend
+from CursorInjector import CursorInjector
+from PlaybackScheduler import PlaybackScheduler
+from ScreenCheckpoint import ScreenCheckpoint
+from MacroRunner import MacroRunner, RunnerJob, XvfbLauncher
+from TrajectoryLibrary import TrajectoryLibrary
+from AsyncPlayer import AsyncPlayer, MacroTimeline
+from PlayerDaemon import PlayerDaemon
+from PlayerClient import PlayerClient
+from MacroOptimizer import MacroOptimizer
+from TimingValidator import TimingValidator
+from MacroIndex import MacroIndex
+from RoutineFolder import RoutineFolder
+from MacroCatalog import MacroCatalog
+
+
+def bench_bezier(repeats=20):
+    """
+    Compares the original pure python bezier loop against the cached numpy basis path
+    over typical screen distances. Point count matches GenerateCurve, one point per pixel.
+    """
+    print("{:>10} {:>14} {:>14} {:>10}".format("distance", "loop (ms)", "numpy (ms)", "speedup"))
+    for distance in (50, 200, 500, 1000, 1500, 2500):
+        coords = [(0, 0), (random.uniform(0, distance), random.uniform(0, distance)),
+                  (random.uniform(0, distance), random.uniform(0, distance)), (distance, distance)]
+
+        def old_path():
+            return [BezierCurve.bernstein_polynomial(coords, i / (distance - 1)) for i in range(distance)]
+
+        def new_path():
+            return BezierCurve.curve_points(distance, coords)
+
+        old_time = min(timeit.repeat(old_path, number=1, repeat=repeats)) * 1000
+        new_time = min(timeit.repeat(new_path, number=1, repeat=repeats)) * 1000
+        print("{:>10} {:>14.3f} {:>14.3f} {:>9.1f}x".format(distance, old_time, new_time, old_time / new_time))
+    print(BezierCurve.bernstein_basis.cache_info())
+
+
+def _random_move():
+    """Returns random start point, end point and tween target points like those seen during human playback"""
+    start = (random.randint(0, 1920), random.randint(0, 1080))
+    end = (random.randint(0, 1920), random.randint(0, 1080))
+    return start, end, random.randint(6, 23)
+
+
+def _sampled_moves(moves, dense, seed):
+    """Generates tweened points for each move using dense or lazy curve sampling, seeding before every move"""
+    results = []
+    for index, (start, end, target_points) in enumerate(moves):
+        random.seed(seed + index)
+        curve = GenerateCurve(end[0], end[1], start=start, dense=dense)
+        if dense:
+            tweened = NoiseAndTween(curve.points, target_points=target_points)
+        else:
+            tweened = NoiseAndTween(curve=curve, target_points=target_points)
+        results.append(np.asarray(tweened.tweened_points, dtype=np.float64))
+    return results
+
+
+def _line_deviation(points):
+    """Perpendicular distance of each point from the straight line between first and last points"""
+    start, end = points[0], points[-1]
+    direction = end - start
+    length = np.hypot(direction[0], direction[1])
+    if length == 0:
+        return np.zeros(len(points))
+    relative = points - start
+    return np.abs(relative[:, 0] * direction[1] - relative[:, 1] * direction[0]) / length
+
+
+def bench_sampling(moves_count=500):
+    """
+    Regression check and benchmark for lazy curve sampling. With the same seed dense and lazy sampling
+    must pick the same points, and across independent seeds the distribution of deviation from a
+    straight line and spacing between points must match.
+    """
+    moves = [_random_move() for _ in range(moves_count)]
+    dense = _sampled_moves(moves, True, 0)
+    lazy = _sampled_moves(moves, False, 0)
+    max_difference = max(float(np.max(np.abs(d - l))) for d, l in zip(dense, lazy))
+    print("same seed max point difference: {:.6f} px".format(max_difference))
+
+    independent = _sampled_moves(moves, False, moves_count)
+    for label, points in (("dense", dense), ("lazy", independent)):
+        deviation = np.concatenate([_line_deviation(p) for p in points])
+        steps = np.concatenate([np.hypot(*np.diff(p, axis=0).T) for p in points])
+        print("{:>6} deviation mean {:8.3f} std {:8.3f} | step mean {:8.3f} std {:8.3f}".format(
+            label, deviation.mean(), deviation.std(), steps.mean(), steps.std()))
+
+    dense_time = min(timeit.repeat(lambda: _sampled_moves(moves[:50], True, 0), number=1, repeat=5)) / 50 * 1000
+    lazy_time = min(timeit.repeat(lambda: _sampled_moves(moves[:50], False, 0), number=1, repeat=5)) / 50 * 1000
+    print("per move: dense {:.3f} ms, lazy {:.3f} ms ({:.1f}x)".format(dense_time, lazy_time, dense_time / lazy_time))
+    if max_difference > 1e-6:
+        raise AssertionError("Lazy sampling does not match dense sampling")
+
+
+def synthetic_events(count, seed=0):
+    """
+    Returns list of count random events in the save format, mostly mouse movement like a recording made with --mouse_movement
+    """
+    rng = random.Random(seed)
+    keys = ["a", "b", "c", "Key.shift", "Key.enter", "Key.space"]
+    events = []
+    for _ in range(count):
+        kind = rng.random()
+        x, y = rng.randint(0, 1920), rng.randint(0, 1080)
+        timer = round(rng.uniform(0.0, 0.3), 2)
+        if kind < 0.6:
+            events.append({"action": "moved", "x": x, "y": y, "timer": timer})
+        elif kind < 0.8:
+            events.append({"action": rng.choice(["pressed_key", "released_key"]), "key": rng.choice(keys),
+                           "x": x, "y": y, "timer": timer})
+        else:
+            events.append({"action": rng.choice(["pressed", "released"]), "button": "Button.left",
+                           "x": x, "y": y, "timer": timer})
+    return events
+
+
+def _timed(function):
+    """Returns seconds taken to call function once"""
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def bench_trajectories(moves_count=2000, distinct_moves=50, variants=(1, 4, 16)):
+    """
+    Replays moves_count human movements drawn from distinct_moves different (start, end, points) moves, as a looping macro would,
+    generating every movement against a TrajectoryLibrary with each number of variants. Reports cost per movement and hit rate.
+    """
+    rng = random.Random(0)
+    distinct = [_random_move() for _ in range(distinct_moves)]
+    moves = [rng.choice(distinct) for _ in range(moves_count)]
+    print("{:>9} {:>16} {:>11}".format("variants", "per move (us)", "hit rate"))
+    generate = _timed(lambda: [TrajectoryLibrary.generate(start, end, points) for start, end, points in moves])
+    print("{:>9} {:>16.2f} {:>11}".format("none", generate / moves_count * 1e6, "-"))
+    for count in variants:
+        library = TrajectoryLibrary(count, seed=0)
+        elapsed = _timed(lambda: [library.points(start, end, points) for start, end, points in moves])
+        print("{:>9} {:>16.2f} {:>10.1f}%".format(count, elapsed / moves_count * 1e6,
+                                                  library.hits / (library.hits + library.misses) * 100))
+
+
+def bench_formats(counts=(10000, 100000, 1000000)):
+    """
+    Compares file size and load time of JSON array, JSON Lines and binary macro files.
+    Binary open is the cost of mapping the file and getting the record view, binary iterate converts every record to an event dict.
+    """
+    print("{:>9} {:>8} {:>12} {:>12} {:>14}".format("events", "format", "size (KB)", "load (ms)", "iterate (ms)"))
+    with tempfile.TemporaryDirectory() as directory:
+        for count in counts:
+            events = synthetic_events(count)
+            json_file = os.path.join(directory, "macro.json")
+            jsonl_file = os.path.join(directory, "macro.jsonl")
+            binary_file = os.path.join(directory, "macro.bin")
+            write_json(events, json_file, "json")
+            write_json(events, jsonl_file, "jsonl")
+            write_binary(events, binary_file)
+            del events
+
+            def load_json():
+                with open(json_file) as macro_file:
+                    json.load(macro_file)
+
+            def open_binary():
+                with BinaryMacro(binary_file) as binary_macro:
+                    binary_macro.records["time_ns"][-1]
+
+            rows = [("json", json_file, load_json, lambda: list(MacroReader(json_file))),
+                    ("jsonl", jsonl_file, lambda: list(MacroReader(jsonl_file)), lambda: list(MacroReader(jsonl_file))),
+                    ("binary", binary_file, open_binary, lambda: list(MacroReader(binary_file)))]
+            for name, path, load, iterate in rows:
+                print("{:>9} {:>8} {:>12.1f} {:>12.3f} {:>14.3f}".format(count, name, os.path.getsize(path) / 1024,
+                                                                        _timed(load) * 1000, _timed(iterate) * 1000))
+
+
+def _allocated(function):
+    """Returns result of function and bytes it left allocated"""
+    tracemalloc.start()
+    result = function()
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, allocated
+
+
+def bench_events(counts=(100000, 1000000)):
+    """
+    Compares memory of a list of event dicts against a MacroEvents store of the same events,
+    and the time to count events by action, find the bounding box and slice the middle half by time
+    with a Python loop over the dicts against the vectorised MacroEvents methods.
+    """
+    print("{:>9} {:>8} {:>14} {:>12} {:>12} {:>12}".format("events", "store", "bytes/event", "count (ms)", "bbox (ms)",
+                                                           "slice (ms)"))
+    for count in counts:
+        events, dict_bytes = _allocated(lambda: synthetic_events(count))
+        store, store_bytes = _allocated(lambda: MacroEvents.from_dicts(events))
+        end = store.duration()
+
+        def dict_count():
+            by_action = {}
+            for event in events:
+                by_action[event["action"]] = by_action.get(event["action"], 0) + 1
+
+        def dict_bbox():
+            xs, ys = [event["x"] for event in events], [event["y"] for event in events]
+            return min(xs), min(ys), max(xs), max(ys)
+
+        def dict_slice():
+            elapsed, kept = 0.0, []
+            for event in events:
+                elapsed += event["timer"]
+                if end / 4 <= elapsed < end * 3 / 4:
+                    kept.append(event)
+
+        rows = [("dicts", dict_bytes, dict_count, dict_bbox, dict_slice),
+                ("columns", store_bytes, store.count_by_action, store.bounding_box,
+                 lambda: store.slice_time(end / 4, end * 3 / 4))]
+        for name, allocated, count_actions, bbox, time_slice in rows:
+            print("{:>9} {:>8} {:>14.1f} {:>12.3f} {:>12.3f} {:>12.3f}".format(
+                count, name, allocated / count, _timed(count_actions) * 1000, _timed(bbox) * 1000,
+                _timed(time_slice) * 1000))
+        del events, store
+
+
+def bench_warp(count=1000000, settings=((2.0, 0.0, 0.0), (1.0, 0.1, 0.0), (4.0, 0.05, 0.01), (1.0, 0.0, 0.1))):
+    """
+    Time warps a synthetic macro of count events with each (speed, max_gap, min_gap) setting, reporting the runtime saved
+    and the time the vectorised warp pass takes
+    """
+    store = MacroEvents.from_dicts(synthetic_events(count))
+    print("{:>7} {:>9} {:>9} {:>13} {:>13} {:>10} {:>11}".format("speed", "max gap", "min gap", "recorded (s)", "warped (s)",
+                                                               "saved (%)", "warp (ms)"))
+    for speed, max_gap, min_gap in settings:
+        warped = store.warp(speed, max_gap, min_gap)
+        saved = (store.duration() - warped.duration()) / store.duration() * 100
+        print("{:>7g} {:>9g} {:>9g} {:>13.1f} {:>13.1f} {:>10.1f} {:>11.3f}".format(
+            speed, max_gap, min_gap, store.duration(), warped.duration(), saved,
+            _timed(lambda: store.warp(speed, max_gap, min_gap)) * 1000))
+
+
+class _FakeMouseController:
+    """Stands in for pynput's mouse controller, the real position query is an OS call and costs more"""
+    position = (100, 200)
+
+
+class _FakeKey:
+    """Stands in for a pynput KeyCode of a letter key"""
+    def __init__(self, char):
+        self.char = char
+
+
+def _legacy_on_press(state, key):
+    """The work a key press callback did on the listener thread before events were pushed to EventCapture"""
+    last_json = state["events"][-1] if state["events"] else None
+    if last_json is not None and last_json["action"] == "pressed_key" and last_json["key"] == key.char:
+        return
+    x_pos, y_pos = state["mouse_controller"].position
+    timer = round(state["timer"].current_time(), 2)
+    state["timer"].stop()
+    state["events"].append({"action": "pressed_key", "key": key.char, "x": x_pos, "y": y_pos, "timer": timer})
+    state["timer"] = SimpleTimer()
+    state["timer"].start()
+
+
+def _legacy_on_click(state, x, y, button, pressed):
+    """The work a click callback did on the listener thread before events were pushed to EventCapture"""
+    current_time = round(state["timer"].current_time(), 2)
+    state["timer"].stop()
+    state["events"].append({"action": "pressed" if pressed else "released", "button": str(button), "x": x, "y": y,
+                            "timer": current_time})
+    state["timer"] = SimpleTimer()
+    state["timer"].start()
+
+
+def _callback_latency(callback, calls):
+    """Returns median and 99th percentile time of a callback call in microseconds"""
+    samples = []
+    for i in range(calls):
+        start = time.perf_counter_ns()
+        callback(i)
+        samples.append(time.perf_counter_ns() - start)
+    samples.sort()
+    return samples[len(samples) // 2] / 1000, samples[int(len(samples) * 0.99)] / 1000
+
+
+def bench_capture(calls=100000):
+    """
+    Measures time spent on the listener thread per callback, before (dict, position query, round and a new SimpleTimer
+    per event) and after (position query for keys and push of a tuple to EventCapture). The worker is not started so only callback cost is measured.
+    """
+    # Imported here as pynput needs a display, the other suites run headless
+    from MacroRecorder import MacroRecorder
+    state = {"events": [], "mouse_controller": _FakeMouseController(), "timer": SimpleTimer()}
+    state["timer"].start()
+    recorder = MacroRecorder(tempfile.gettempdir(), "capture_benchmark", mouse_movement=True)
+    recorder.capture = EventCapture(recorder.process_event)
+    recorder.mouse_controller = _FakeMouseController()
+    keys = [_FakeKey("a"), _FakeKey("b")]
+    rows = [("key press", lambda i: _legacy_on_press(state, keys[i % 2]), lambda i: recorder.on_press(keys[i % 2])),
+            ("click", lambda i: _legacy_on_click(state, i, i, "Button.left", i % 2 == 0),
+             lambda i: recorder.on_click(i, i, "Button.left", i % 2 == 0)),
+            ("move", lambda i: _legacy_on_click(state, i, i, None, False), lambda i: recorder.on_move(i, i))]
+    print("{:>10} {:>16} {:>16} {:>16} {:>16}".format("callback", "before p50 (us)", "before p99 (us)",
+                                                    "after p50 (us)", "after p99 (us)"))
+    for name, legacy, current in rows:
+        before = _callback_latency(legacy, calls)
+        after = _callback_latency(current, calls)
+        recorder.capture.events.clear()
+        print("{:>10} {:>16.3f} {:>16.3f} {:>16.3f} {:>16.3f}".format(name, before[0], before[1], after[0], after[1]))
+
+
+def synthetic_macro(kind, count, timer, seed=0):
+    """
+    Returns list of count events of one kind, "keys" types letters at a fixed position, "clicks" clicks at random
+    positions and "moves" is mouse movement with a click every 20 events. Every event has the same timer.
+    """
+    rng = random.Random(seed)
+    events = []
+    while len(events) < count:
+        x, y = rng.randint(0, 1920), rng.randint(0, 1080)
+        if kind == "keys":
+            key = rng.choice("abcdefghijklmnopqrstuvwxyz")
+            events.append({"action": "pressed_key", "key": key, "x": 500, "y": 500, "timer": timer})
+            events.append({"action": "released_key", "key": key, "x": 500, "y": 500, "timer": timer})
+        elif kind == "clicks":
+            events.append({"action": "pressed", "button": "Button.left", "x": x, "y": y, "timer": timer})
+            events.append({"action": "released", "button": "Button.left", "x": x, "y": y, "timer": timer})
+        elif len(events) % 20 == 19:
+            events.append({"action": "pressed", "button": "Button.left", "x": x, "y": y, "timer": timer})
+        else:
+            events.append({"action": "moved", "x": x, "y": y, "timer": timer})
+    return events[:count]
+
+
+def _play_headless(directory, events, movement_type, simulate_duration, trace=None):
+    """Plays events through a RecordingBackend with absolute timing, returns player, backend and wall time"""
+    write_json(events, os.path.join(directory, "macro.txt"), "jsonl")
+    backend = RecordingBackend(simulate_duration=simulate_duration)
+    player = MacroPlayer(directory, "macro.txt", movement_type, timing="absolute", backend=backend, trace=trace)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        player.run()
+    return player, backend, time.perf_counter() - start
+
+
+def bench_playback(events_count=10000, fidelity_events=100, fidelity_timer=0.2):
+    """
+    Replays synthetic macros through the headless RecordingBackend under each movement type.
+    Throughput plays events_count events with no waits. Compute cost and timing error play fidelity_events events
+    fidelity_timer apart with move durations simulated, compute is wall time not spent waiting on the scheduler
+    or in simulated moves and timing error is how late events fired against the recorded schedule.
+    """
+    print("{:>7} {:>9} {:>13} {:>14} {:>12} {:>12} {:>12}".format(
+        "macro", "movement", "events/s", "compute (us)", "p50 (ms)", "p95 (ms)", "max (ms)"))
+    with tempfile.TemporaryDirectory() as directory:
+        for kind in ("keys", "clicks", "moves"):
+            for movement_type in ("instant", "simple", "human"):
+                _, _, wall = _play_headless(directory, synthetic_macro(kind, events_count, 0.0), movement_type, False)
+                player, backend, fidelity_wall = _play_headless(
+                    directory, synthetic_macro(kind, fidelity_events, fidelity_timer), movement_type, True)
+                stats = player.scheduler.statistics()
+                compute = (fidelity_wall - player.scheduler.waited - backend.simulated) / fidelity_events * 1e6
+                print("{:>7} {:>9} {:>13.0f} {:>14.1f} {:>12.3f} {:>12.3f} {:>12.3f}".format(
+                    kind, movement_type, events_count / wall, compute, stats["p50_ms"], stats["p95_ms"], stats["max_ms"]))
+
+
+def bench_injection(duration=1.0):
+    """
+    Emits a human movement trajectory lasting duration seconds through CursorInjector at 125, 250 and 500 Hz
+    on the headless RecordingBackend, reporting achieved frame rate and overhead per frame.
+    """
+    curve = GenerateCurve(1500, 900, start=(100, 100), dense=False)
+    points = NoiseAndTween(curve=curve, target_points=23).tweened_points
+    print("{:>10} {:>8} {:>14} {:>20}".format("target Hz", "frames", "achieved Hz", "overhead (us/frame)"))
+    for frame_rate in (125, 250, 500):
+        scheduler = PlaybackScheduler()
+        injector = CursorInjector(RecordingBackend(), scheduler, frame_rate)
+        injector.inject_path(points, time.perf_counter() + np.linspace(0.0, duration, len(points)))
+        print("{:>10} {:>8} {:>14.1f} {:>20.2f}".format(frame_rate, injector.frames, injector.frames / injector.elapsed,
+                                                       injector.overhead / injector.frames * 1e6))
+
+
+def bench_checkpoint(sizes=(16, 32, 64), delays=(0.05, 0.2, 1.0), recorded_wait=2.0):
+    """
+    Measures the cost of one checkpoint poll, capture plus comparison, on the headless RecordingBackend for matching
+    and non matching regions of each size. Then simulates an app responding after each delay to a checkpoint
+    recorded with a recorded_wait second wait, reporting how soon the match was seen and how many polls it took.
+    """
+    backend = RecordingBackend(simulate_duration=False)
+    print("{:>6} {:>14} {:>17}".format("size", "match (us)", "mismatch (us)"))
+    for size in sizes:
+        backend.screen[:] = 0
+        checkpoint = ScreenCheckpoint.capture(500, 500, size, grab=backend.grab_region, screen=backend.screen_size())
+        match = _timed(lambda: checkpoint.matches(backend.grab_region(*checkpoint.region)))
+        backend.screen[:] = 255
+        mismatch = _timed(lambda: checkpoint.matches(backend.grab_region(*checkpoint.region)))
+        print("{:>6} {:>14.2f} {:>17.2f}".format(size, match * 1e6, mismatch * 1e6))
+
+    print("{:>10} {:>12} {:>12} {:>8} {:>11}".format("delay (s)", "waited (s)", "late (ms)", "polls", "saved (s)"))
+    # The app's response turns the screen white
+    backend.screen[:] = 255
+    checkpoint = ScreenCheckpoint.capture(500, 500, 32, grab=backend.grab_region, screen=backend.screen_size())
+    for delay in delays:
+        backend.screen[:] = 0
+        respond = threading.Timer(delay, lambda: backend.screen.fill(255))
+        start = time.perf_counter()
+        respond.start()
+        matched, polls = checkpoint.wait(backend.grab_region, start + recorded_wait)
+        respond.join()
+        waited = (matched if matched is not None else time.perf_counter()) - start
+        print("{:>10g} {:>12.3f} {:>12.2f} {:>8} {:>11.3f}".format(delay, waited, (waited - delay) * 1000, polls,
+                                                                 recorded_wait - waited))
+
+
+def bench_runner(jobs_count=4, events_count=100, timer=0.01, processes=(1, 2, 4), xvfb_displays=2):
+    """
+    Plays jobs_count headless macros of events_count clicks timer seconds apart through MacroRunner with each number
+    of worker processes, reporting wall time and speed up over one process. Wall time includes starting the workers.
+    When Xvfb is installed the jobs are then played on xvfb_displays virtual displays launched by XvfbLauncher.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        jobs = []
+        for index in range(jobs_count):
+            macro_file = os.path.join(directory, "macro{}.txt".format(index))
+            write_json(synthetic_macro("clicks", events_count, timer, seed=index), macro_file, "jsonl")
+            jobs.append(RunnerJob(macro_file, None, 1))
+        print("{:>10} {:>10} {:>10} {:>10}".format("processes", "wall (s)", "events/s", "speed up"))
+        single = None
+        for count in processes:
+            runner = MacroRunner(jobs, count, "simple")
+            runner.run()
+            failures = [result["error"] for result in runner.results if result["error"] is not None]
+            if failures:
+                raise Exception("Runner jobs failed: {}".format(failures))
+            single = single or runner.wall
+            print("{:>10} {:>10.3f} {:>10.0f} {:>10.2f}".format(count, runner.wall, jobs_count * events_count / runner.wall,
+                                                              single / runner.wall))
+
+        # Plays the same jobs on Xvfb displays through the real backend, checking jobs sharing a display never overlap
+        if shutil.which("Xvfb") is None:
+            print("Xvfb not found, runs on virtual displays were not measured")
+            return
+        with XvfbLauncher(xvfb_displays) as launcher:
+            display_jobs = [job._replace(display=launcher.displays[index % xvfb_displays]) for index, job in enumerate(jobs)]
+            runner = MacroRunner(display_jobs, None, "simple")
+            runner.run()
+        failures = [result["error"] for result in runner.results if result["error"] is not None]
+        if failures:
+            raise Exception("Runner jobs failed on Xvfb: {}".format(failures))
+        for display in sorted({job.display for job in display_jobs}):
+            played = sorted((result["started"], result["finished"]) for result in runner.results if result["display"] == display)
+            if any(started < finished for (_, finished), (started, _) in zip(played, played[1:])):
+                raise Exception("Jobs overlapped on display {}".format(display))
+        print("{} jobs on {} Xvfb displays in {:.3f} s, {:.0f} events/s, no jobs overlapped on a display".format(
+            jobs_count, xvfb_displays, runner.wall, jobs_count * events_count / runner.wall))
+
+
+def bench_trace(events_count=10000):
+    """
+    Plays events_count mouse movement events with no waits through the headless RecordingBackend under each movement
+    type with instrumentation off and on, reporting throughput and the cost tracing adds per event.
+    """
+    print("{:>9} {:>15} {:>15} {:>21} {:>14}".format("movement", "off (events/s)", "on (events/s)",
+                                                     "overhead (us/event)", "trace (bytes)"))
+    with tempfile.TemporaryDirectory() as directory:
+        trace_file = os.path.join(directory, "macro.trace")
+        events = synthetic_macro("moves", events_count, 0.0)
+        for movement_type in ("instant", "simple", "human"):
+            _, _, off = _play_headless(directory, events, movement_type, False)
+            _, _, on = _play_headless(directory, events, movement_type, False, trace_file)
+            print("{:>9} {:>15.0f} {:>15.0f} {:>21.2f} {:>14}".format(
+                movement_type, events_count / off, events_count / on, (on - off) / events_count * 1e6,
+                os.path.getsize(trace_file)))
+
+
+def bench_async(events_count=200, timer=0.01, requests=50):
+    """
+    Plays a keyboard only macro alongside a mouse macro in one AsyncPlayer on the headless RecordingBackend, twice.
+    The first play pauses and resumes playback requests times from another thread, like the hotkey listener does,
+    reporting lateness per timeline and how quickly requests were acted on. The second aborts half way through,
+    reporting how long the abort took to stop playback.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        write_json(synthetic_macro("keys", events_count, timer), os.path.join(directory, "keys.txt"), "jsonl")
+        write_json(synthetic_macro("moves", events_count, timer), os.path.join(directory, "moves.txt"), "jsonl")
+
+        def player():
+            timelines = [MacroTimeline(MacroPlayer(directory, name, movement_type, precompile=True, seed=0,
+                                                   backend=RecordingBackend(simulate_duration=False)))
+                         for name, movement_type in (("keys.txt", "instant"), ("moves.txt", "human"))]
+            return AsyncPlayer(timelines, hotkeys=False)
+
+        def press(async_player, actions, interval, requested):
+            for action in actions:
+                time.sleep(interval)
+                requested.append(time.perf_counter())
+                async_player.control.request(action)
+
+        print("{:>9} {:>9} {:>12} {:>12} {:>12}".format("timeline", "events", "p50 (ms)", "p95 (ms)", "max (ms)"))
+        async_player = player()
+        play_time = events_count * timer
+        hotkeys = threading.Thread(target=press, args=(async_player, ["toggle"] * requests, play_time / (requests + 1), []))
+        hotkeys.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            async_player.run()
+        hotkeys.join()
+        for timeline in async_player.timelines:
+            stats = timeline.scheduler.statistics()
+            print("{:>9} {:>9} {:>12.3f} {:>12.3f} {:>12.3f}".format(timeline.name[:-4], stats["events"], stats["p50_ms"],
+                                                                   stats["p95_ms"], stats["max_ms"]))
+        reactions = np.array(async_player.control.reactions) * 1000
+        print("{} pause and resume requests, reaction p50 {:.3f} ms, p99 {:.3f} ms, max {:.3f} ms".format(
+            len(reactions), np.percentile(reactions, 50), np.percentile(reactions, 99), reactions.max()))
+
+        async_player = player()
+        requested = []
+        hotkeys = threading.Thread(target=press, args=(async_player, ["abort"], play_time / 2, requested))
+        hotkeys.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            async_player.run()
+        stopped = time.perf_counter()
+        hotkeys.join()
+        print("abort: reaction {:.3f} ms, playback stopped {:.3f} ms after the request".format(
+            async_player.control.reactions[0] * 1000, (stopped - requested[0]) * 1000))
+
+
+# Plays a macro headless in a new interpreter and prints the perf_counter time of its first input
+COLD_PLAY = """
+import sys
+from MacroPlayer import MacroPlayer
+from OutputBackend import RecordingBackend
+backend = RecordingBackend(simulate_duration=False)
+MacroPlayer(sys.argv[1], sys.argv[2], "instant", timing="absolute", backend=backend).run()
+print(backend.log[0][0])
+"""
+
+
+def bench_daemon(runs=5, warm_runs=50, events_count=20, timer=0.01):
+    """
+    Trigger to first event latency of a short macro played headless three ways: a new interpreter per run as
+    MacroPlayer.py is run today, a PlayerClient.py process per run asking a running PlayerDaemon, and requests sent to
+    the daemon from an already running process. Times are perf_counter, which is system wide on Linux.
+    The headless backend skips importing pyautogui and pynput so the cold start here is a lower bound.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as directory:
+        write_json(synthetic_macro("clicks", events_count, timer), os.path.join(directory, "macro.txt"), "jsonl")
+        cold = []
+        for run in range(runs):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, "-c", COLD_PLAY, directory, "macro.txt"], cwd=here, check=True,
+                                    capture_output=True, text=True).stdout
+            cold.append(float(output.split()[-1]) - start)
+
+        backend = RecordingBackend(simulate_duration=False)
+        socket_path = os.path.join(directory, "player.sock")
+        daemon = PlayerDaemon(socket_path, backend)
+        server = threading.Thread(target=daemon.serve_forever, daemon=True)
+        server.start()
+        while not os.path.exists(socket_path):
+            time.sleep(0.001)
+        client = PlayerClient(socket_path)
+        macro_file = os.path.join(directory, "macro.txt")
+        options = {"movement_type": "instant", "timing": "absolute"}
+        client_process = []
+        for run in range(runs):
+            first = len(backend.log)
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "PlayerClient.py", "--socket", socket_path, "--macro_file", macro_file,
+                            "--movement_type", "instant", "--timing", "absolute"], cwd=here, check=True, capture_output=True)
+            client_process.append(backend.log[first][0] - start)
+        warm = []
+        for run in range(warm_runs):
+            for message in client.play(macro_file, **options):
+                if message["status"] == "finished":
+                    warm.append(message["trigger_ms"] / 1000)
+        client.shutdown()
+        server.join()
+
+    print("{:>16} {:>6} {:>10} {:>10} {:>10}".format("trigger", "runs", "p50 (ms)", "p95 (ms)", "max (ms)"))
+    for name, latencies in (("new process", cold), ("client process", client_process), ("daemon request", warm)):
+        latencies = np.array(latencies) * 1000
+        print("{:>16} {:>6} {:>10.2f} {:>10.2f} {:>10.2f}".format(name, len(latencies), np.percentile(latencies, 50),
+                                                                  np.percentile(latencies, 95), latencies.max()))
+
+
+def synthetic_session(rounds, seed=0):
+    """
+    Returns list of events like a recorded session, each round types a word, drags the cursor round an arc,
+    clicks where it stopped and moves back
+    """
+    rng = random.Random(seed)
+    events = []
+    for _ in range(rounds):
+        for char in rng.choice(["hello", "world", "macro", "type this"]):
+            key = "Key.space" if char == " " else char
+            events.append({"action": "pressed_key", "key": key, "x": 500, "y": 500, "timer": 0.06})
+            events.append({"action": "released_key", "key": key, "x": 500, "y": 500, "timer": 0.03})
+        for step in range(40):
+            events.append({"action": "moved", "x": int(500 + 200 * math.cos(step / 10)),
+                           "y": int(500 + 200 * math.sin(step / 10)), "timer": 0.01})
+        x, y = events[-1]["x"], events[-1]["y"]
+        events.append({"action": "moved", "x": x, "y": y, "timer": 0.01})
+        events.append({"action": "pressed", "button": "Button.left", "x": x, "y": y, "timer": 0.1})
+        events.append({"action": "released", "button": "Button.left", "x": x, "y": y, "timer": 0.05})
+        events.append({"action": "moved", "x": 500, "y": 500, "timer": 0.2})
+    return events
+
+
+def overrunning_session(repeats=4):
+    """
+    Returns list of events repeating one run of 5 events, the first repeat ending slower than the others within the
+    fold tolerance, and a move 10 ms after the last repeat. A call played with the first repeat's timing would end
+    after that move
+    """
+    events = []
+    for repeat in range(repeats):
+        events.append({"action": "moved", "x": 100, "y": 100, "timer": 0.5})
+        events.append({"action": "pressed", "button": "Button.left", "x": 100, "y": 100, "timer": 0.01})
+        events.append({"action": "released", "button": "Button.left", "x": 100, "y": 100, "timer": 0.01})
+        events.append({"action": "moved", "x": 120, "y": 100, "timer": 0.01})
+        events.append({"action": "moved", "x": 140, "y": 100, "timer": 0.05 if repeat == 0 else 0.01})
+    events.append({"action": "moved", "x": 300, "y": 300, "timer": 0.01})
+    return events
+
+
+def wandering_session(polylines, seed=0):
+    """
+    Returns list of events where the cursor wanders between random points and clicks, every run of moves a different
+    path so each becomes a distinct polyline
+    """
+    rng = random.Random(seed)
+    events = []
+    for _ in range(polylines):
+        for _ in range(3):
+            events.append({"action": "moved", "x": rng.randrange(1920), "y": rng.randrange(1080), "timer": 0.02})
+        x, y = events[-1]["x"], events[-1]["y"]
+        events.append({"action": "pressed", "button": "Button.left", "x": x, "y": y, "timer": 0.1})
+        events.append({"action": "released", "button": "Button.left", "x": x, "y": y, "timer": 0.05})
+    return events
+
+
+def bench_optimize(rounds=(10, 100, 1000), polylines=70000):
+    """
+    Optimizes synthetic recorded sessions and reports events removed, time taken to optimize and the backend calls
+    and CPU time of playing the macro headless with every wait removed before and after. The last session wanders
+    the cursor so optimizing it writes more distinct polylines than 16 bit name indexes could number
+    """
+    print("{:>9} {:>9} {:>14} {:>22} {:>24}".format("events", "after", "optimize (ms)", "backend calls", "playback CPU (ms)"))
+    with tempfile.TemporaryDirectory() as directory:
+        for events in [synthetic_session(count) for count in rounds] + [wandering_session(polylines)]:
+            optimizer = MacroOptimizer()
+            start = time.perf_counter()
+            optimized = optimizer.optimize(events)
+            seconds = time.perf_counter() - start
+            write_binary(events, os.path.join(directory, "recorded.bin"))
+            write_binary(optimized, os.path.join(directory, "optimized.bin"))
+            before_cpu, before_calls = MacroOptimizer.playback_cost(os.path.join(directory, "recorded.bin"))
+            after_cpu, after_calls = MacroOptimizer.playback_cost(os.path.join(directory, "optimized.bin"))
+            print("{:>9} {:>9} {:>14.1f} {:>22} {:>24}".format(
+                len(events), len(optimized), seconds * 1000, "{} -> {}".format(before_calls, after_calls),
+                "{:.1f} -> {:.1f}".format(before_cpu * 1000, after_cpu * 1000)))
+
+
+def bench_timing(counts=(1000, 10000, 100000), mean_gap=0.15, play_events=400, play_gap=0.005):
+    """
+    Compares the cumulative timing error of recordings saved as absolute ns times against the deltas rounded to
+    10 ms older recorders saved, then plays a short recording headless in both timing modes and reports how far
+    each injected input is from its recorded time
+    """
+    validator = TimingValidator()
+    rng = np.random.default_rng(0)
+    print("{:>9} {:>12} {:>22} {:>22} {:>20}".format("events", "length (s)", "rounded final (ms)", "rounded max (ms)",
+                                                     "absolute max (ms)"))
+    for count in counts:
+        times_ns = np.cumsum(rng.exponential(mean_gap * 1e9, count).astype(np.int64))
+        drift = validator.summary(validator.delta_drift(times_ns))
+        print("{:>9} {:>12.0f} {:>22.1f} {:>22.1f} {:>20.1f}".format(count, times_ns[-1] / 1e9, drift["final_ms"],
+                                                                     drift["max_ms"], 0.0))
+
+    print("{:>9} {:>9} {:>14} {:>14} {:>16}".format("timing", "inputs", "mean (ms)", "max (ms)", "last input (ms)"))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "recorded.txt")
+        times_ns = np.cumsum(rng.exponential(play_gap * 1e9, play_events).astype(np.int64)).tolist()
+        events = [{"action": "pressed_key" if index % 2 == 0 else "released_key", "key": "a", "x": 500, "y": 500,
+                   "time_ns": time_ns} for index, time_ns in enumerate(times_ns)]
+        write_json(events, path, "jsonl")
+        for timing in ("relative", "absolute"):
+            stats = validator.summary(validator.playback_error(path, "instant", timing))
+            print("{:>9} {:>9} {:>14.3f} {:>14.3f} {:>16.3f}".format(timing, stats["events"], stats["mean_ms"],
+                                                                    stats["max_ms"], stats["final_ms"]))
+
+
+def bench_seek(counts=(100000, 1000000), window=1000, positions=(0.5, 0.9)):
+    """
+    Compares loading a whole macro file to play a window of it against seeking to the window through its sidecar index,
+    for JSON Lines and binary files. Index build time is the one off cost paid the first time a file is seeked
+    """
+    print("{:>9} {:>8} {:>14} {:>16} {:>12} {:>10} {:>16}".format("events", "format", "full load (ms)", "index build (ms)",
+                                                                  "index (KB)", "position", "window (ms)"))
+    with tempfile.TemporaryDirectory() as directory:
+        for count in counts:
+            events = synthetic_events(count)
+            for output_format in ("jsonl", "binary"):
+                path = os.path.join(directory, "macro_{}.{}".format(count, output_format))
+                if output_format == "binary":
+                    write_binary(events, path)
+                else:
+                    write_json(events, path, output_format)
+                full = _timed(lambda: MacroEvents.load(path))
+                build = _timed(lambda: MacroIndex.open(path))
+                index = MacroIndex.open(path)
+                for position in positions:
+                    first = int(count * position)
+                    seconds = _timed(lambda: index.window("#{}".format(first), "#{}".format(first + window)))
+                    print("{:>9} {:>8} {:>14.1f} {:>16.1f} {:>12.1f} {:>10} {:>16.2f}".format(
+                        count, output_format, full * 1000, build * 1000, os.path.getsize(index.path) / 1024,
+                        "#{}".format(first), seconds * 1000))
+
+
+def bench_fold(rounds=(100, 1000, 10000), random_count=200000):
+    """
+    Folds synthetic recorded sessions, where every round repeats one of a few runs of events, into routines and reports
+    events stored, time taken to fold, file sizes and the time and memory of loading the macro for playback before and
+    after. Random events, with no repeats to find, give the cost of searching a macro that does not fold
+    """
+    print("{:>9} {:>9} {:>9} {:>10} {:>22} {:>22} {:>24}".format("events", "stored", "routines", "fold (ms)", "JSON Lines (KB)",
+                                                                 "load (ms)", "loaded (KB)"))
+    with tempfile.TemporaryDirectory() as directory:
+        recorded, folded = os.path.join(directory, "recorded.txt"), os.path.join(directory, "folded.txt")
+        for count in rounds:
+            events = synthetic_session(count)
+            write_json(events, recorded, "jsonl")
+            folder = RoutineFolder()
+            write_json(folder.fold(MacroEvents.load(recorded)), folded, "jsonl")
+            stats = folder.stats
+            before_seconds, before_bytes = RoutineFolder.load_cost(recorded)
+            after_seconds, after_bytes = RoutineFolder.load_cost(folded)
+            print("{:>9} {:>9} {:>9} {:>10.1f} {:>22} {:>22} {:>24}".format(
+                len(events), stats["events_out"] + stats["routine_events"], stats["routines"], stats["seconds"] * 1000,
+                "{:.0f} -> {:.0f}".format(os.path.getsize(recorded) / 1024, os.path.getsize(folded) / 1024),
+                "{:.1f} -> {:.1f}".format(before_seconds * 1000, after_seconds * 1000),
+                "{:.0f} -> {:.0f}".format(before_bytes / 1024, after_bytes / 1024)))
+        # Folding must never leave an event waiting a negative time after a call
+        write_json(RoutineFolder().fold(MacroEvents.from_dicts(overrunning_session())), folded, "jsonl")
+        expanded = list(MacroEvents.load(folded))
+        if len(expanded) != len(overrunning_session()) or min(event.timer for event in expanded) < 0:
+            raise ValueError("Folded macro plays events out of order.")
+    folder = RoutineFolder()
+    folder.fold(MacroEvents.from_dicts(synthetic_events(random_count)))
+    print("{:>9} {:>9} {:>9} {:>10.1f} (random events)".format(random_count, folder.stats["events_out"],
+                                                                folder.stats["routines"], folder.stats["seconds"] * 1000))
+
+
+def bench_catalog(counts=(1000, 10000), events_count=200, changed=0.01, min_duration=32.0):
+    """
+    Compares finding macros by opening every file in a save directory against the catalog: a cold rescan reading
+    every macro, a warm rescan with nothing changed, a warm rescan after a share of the macros were re-recorded and
+    a query for macros pressing a key and lasting a range of time answered from the catalog alone
+    """
+    print("{:>8} {:>18} {:>12} {:>12} {:>16} {:>11} {:>7}".format("macros", "open every (ms)", "cold (ms)", "warm (ms)",
+                                                                 "{:.0%} changed (ms)".format(changed), "query (ms)", "found"))
+    for count in counts:
+        with tempfile.TemporaryDirectory() as directory:
+            for number in range(count):
+                write_json(synthetic_events(events_count, seed=number), os.path.join(directory, "macro_{}.txt".format(number)), "jsonl")
+            start = time.perf_counter()
+            found = []
+            for entry in os.scandir(directory):
+                store = MacroEvents.load(entry.path)
+                if store.duration() >= min_duration and "Key.enter" in store.names:
+                    found.append(entry.name)
+            scan = time.perf_counter() - start
+            catalog = MacroCatalog(directory)
+            cold = catalog.rescan()["seconds"]
+            warm = catalog.rescan()["seconds"]
+            for number in range(0, count, max(1, int(1 / changed))):
+                write_json(synthetic_events(events_count, seed=count + number),
+                           os.path.join(directory, "macro_{}.txt".format(number)), "jsonl")
+            rescanned = catalog.rescan()["seconds"]
+            start = time.perf_counter()
+            macros = catalog.query(min_duration=min_duration, keys=["Key.enter"])
+            query = time.perf_counter() - start
+            catalog.close()
+            print("{:>8} {:>18.1f} {:>12.1f} {:>12.1f} {:>16.1f} {:>11.2f} {:>7}".format(
+                count, scan * 1000, cold * 1000, warm * 1000, rescanned * 1000, query * 1000, len(macros)))
+
+
+SUITES = {"bezier": bench_bezier, "sampling": bench_sampling, "trajectories": bench_trajectories, "formats": bench_formats,
+          "events": bench_events, "warp": bench_warp, "checkpoint": bench_checkpoint, "capture": bench_capture,
+          "playback": bench_playback, "injection": bench_injection, "runner": bench_runner,
+          "trace": bench_trace, "async": bench_async, "daemon": bench_daemon,
+          "optimize": bench_optimize, "timing": bench_timing,
+          "seek": bench_seek, "fold": bench_fold, "catalog": bench_catalog}
+
+
+def main(suites):
+    for name in suites:
+        print("== {}".format(name))
+        SUITES[name]()
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("--suite", type=str, nargs="+", choices=sorted(SUITES), required=False,
+                           help="String - Benchmark suites to run, all suites are run by default")
+    argParser.set_defaults(suite=sorted(SUITES))
+    args = argParser.parse_args()
+
+    main(args.suite)
@@ -1,4 +1,6 @@
 import math
+from functools import lru_cache
+import numpy as np
 class BezierCurve:
     @staticmethod
     def bernstein_polynomial_point(x, k, n):
@@ -23,14 +25,54 @@ class BezierCurve:
             point_y += coord[1] * bern
         return point_x, point_y
 
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def binomial_coefficients(degree):
+        """Returns read only numpy array of the binomial coefficients for the given degree"""
+        coefficients = np.array([math.comb(degree, k) for k in range(degree + 1)], dtype=np.float64)
+        coefficients.setflags(write=False)
+        return coefficients
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def bernstein_basis(n, degree):
+        """
+        Returns a read only (n, degree + 1) matrix of Bernstein basis values for n evenly
+        spaced points between 0 and 1. Matrices are kept in a bounded LRU cache so repeated
+        moves of similar length reuse them.
+        """
+        t = np.linspace(0.0, 1.0, n)[:, None]
+        k = np.arange(degree + 1)
+        basis = BezierCurve.binomial_coefficients(degree) * (t ** k) * ((1 - t) ** (degree - k))
+        basis.setflags(write=False)
+        return basis
+
+    @staticmethod
+    def curve_points(n, coords):
+        """
+        Vectorised version of curve_coords, given number of points and list of control coords,
+        returns an (n, 2) numpy array of points on the bezier curve.
+        """
+        coords = np.asarray(coords, dtype=np.float64)
+        return BezierCurve.bernstein_basis(int(n), len(coords) - 1) @ coords
+
+    @staticmethod
+    def points_at(progress, coords):
+        """
+        Given a sequence of progress values between 0 and 1 and list of control coords,
+        returns an (len(progress), 2) numpy array with only those points on the bezier curve.
+        """
+        coords = np.asarray(coords, dtype=np.float64)
+        degree = len(coords) - 1
+        t = np.asarray(progress, dtype=np.float64)[:, None]
+        k = np.arange(degree + 1)
+        return (BezierCurve.binomial_coefficients(degree) * (t ** k) * ((1 - t) ** (degree - k))) @ coords
+
     @staticmethod
     def curve_coords(n, coords):
         """
         Given list of normal coords and current progress along curve,
         returns coords that match bezier curve.
+        Kept for compatibility, points are calculated by curve_points and returned as list of tuples.
         """
-        curvecoords = []
-        for i in range(n):
-            x = i / (n - 1)
-            curvecoords.append(BezierCurve.bernstein_polynomial(coords, x))
-        return curvecoords
\ No newline at end of file
+        return [tuple(point) for point in BezierCurve.curve_points(n, coords).tolist()]
@@ -0,0 +1,224 @@
+import mmap
+import json
+import struct
+import numpy as np
+
+# Header: magic, version, record count, record offset, string table offset
+MAGIC = b"MRBIN\x00"
+VERSION = 2
+HEADER = struct.Struct("<6sHQQQ")
+
+# Each record is fixed width, 21 bytes packed with no padding: opcode, index into string table (NO_STRING when unused), x, y,
+# time in ns from start of macro. "key" is the one u4 index shared by every action naming something, keys and buttons as
+# well as the checkpoints, text, points and routines of actions added later, so it has to number every distinct payload
+RECORD_DTYPE = np.dtype([("opcode", "<u1"), ("key", "<u4"), ("x", "<i4"), ("y", "<i4"), ("time_ns", "<i8")])
+NO_STRING = 0xFFFFFFFF
+
+# "tap", "click", "type" and "polyline" are compact primitives written by MacroOptimizer, "define" and "call" are
+# subroutines written by RoutineFolder. New actions go on the end so existing opcodes keep their meaning
+ACTIONS = ["pressed_key", "released_key", "pressed", "released", "moved", "wait_for", "tap", "click", "type", "polyline",
+           "define", "call"]
+OPCODES = {action: opcode for opcode, action in enumerate(ACTIONS)}
+
+# "wait_for" events store their checkpoint dict in the string table as this prefix followed by its JSON
+CHECKPOINT_PREFIX = "Checkpoint."
+# "type" events store their text and "polyline" events the JSON of their [x, y, seconds after the previous event] points
+TEXT_PREFIX = "Text."
+POLYLINE_PREFIX = "Polyline."
+# "define" events store the JSON of their routine number and [action, name, x, y, time_ns] events relative to the call,
+# "call" events the number of the routine they play
+ROUTINE_PREFIX = "Routine."
+CALL_PREFIX = "Call."
+
+
+def event_name(event):
+    """
+    Returns the string interned for an event dict, its key, button, encoded checkpoint, text, points or routine,
+    None for movements
+    """
+    action = event["action"]
+    if action == "wait_for":
+        return CHECKPOINT_PREFIX + json.dumps(event["checkpoint"], sort_keys=True)
+    if action == "type":
+        return TEXT_PREFIX + event["text"]
+    if action == "polyline":
+        return POLYLINE_PREFIX + json.dumps(event["points"], separators=(",", ":"))
+    if action == "define":
+        return ROUTINE_PREFIX + json.dumps({"routine": event["routine"], "events": event["events"]}, separators=(",", ":"))
+    if action == "call":
+        return CALL_PREFIX + str(event["routine"])
+    return event.get("key", event.get("button"))
+
+
+def name_fields(action, name):
+    """
+    Returns the event dict fields an interned string stands for, the reverse of event_name
+    """
+    if action == "wait_for":
+        return {"checkpoint": json.loads(name[len(CHECKPOINT_PREFIX):])}
+    if action == "type":
+        return {"text": name[len(TEXT_PREFIX):]}
+    if action == "polyline":
+        return {"points": json.loads(name[len(POLYLINE_PREFIX):])}
+    if action == "define":
+        return json.loads(name[len(ROUTINE_PREFIX):])
+    if action == "call":
+        return {"routine": int(name[len(CALL_PREFIX):])}
+    return {"key" if action.endswith("_key") or action == "tap" else "button": name}
+
+
+def timed_events(events):
+    """
+    Yields (time in ns from start of macro, event) for an iterable of event dicts. Events recorded with their absolute
+    "time_ns" use it as is, older events holding only the "timer" delta are summed up
+    """
+    time_ns = 0
+    for event in events:
+        if "time_ns" in event:
+            time_ns = event["time_ns"]
+        else:
+            time_ns += round(event["timer"] * 1e9)
+        yield time_ns, event
+
+
+def exported_events(events):
+    """
+    Yields copies of event dicts with "timer" set to the seconds since the previous event and "time_ns" to the time from
+    start of macro
+    """
+    previous_ns = 0
+    for time_ns, event in timed_events(events):
+        event = dict(event)
+        event["timer"] = (time_ns - previous_ns) / 1e9
+        event["time_ns"] = time_ns
+        previous_ns = time_ns
+        yield event
+
+
+class BinaryMacro:
+    def __init__(self, path):
+        """
+        Memory maps a binary macro file, self.records is a zero-copy numpy view of the packed records
+        and self.strings the interned key/button names they index. Use close() or a with block when done.
+        --------
+        Args:
+        --path: String, path to binary macro file
+        """
+        self.path = path
+        self.file = open(path, "rb")
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, records_offset, strings_offset = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            raise ValueError("{} is not a binary macro file".format(path))
+        if version != VERSION:
+            raise ValueError("Unsupported binary macro version {}".format(version))
+        self.records_offset = records_offset
+        self.records = np.frombuffer(self.mmap, dtype=RECORD_DTYPE, count=count, offset=records_offset)
+        self.strings = json.loads(self.mmap[strings_offset:].decode("utf-8"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.records)
+
+    def close(self):
+        """
+        Releases the record view and unmaps the file
+        """
+        self.records = None
+        self.mmap.close()
+        self.file.close()
+
+    @staticmethod
+    def is_binary(path):
+        """
+        Checks file starts with the binary macro magic bytes
+        """
+        with open(path, "rb") as macro_file:
+            return macro_file.read(len(MAGIC)) == MAGIC
+
+    def iter_events(self, chunk_size=65536, first=0):
+        """
+        Yields records as event dicts in the JSON save format from record number first, converting a chunk of records
+        at a time. Events hold both their absolute "time_ns" and the "timer" delta derived from it
+        """
+        previous_ns = int(self.records["time_ns"][first - 1]) if first > 0 else 0
+        for start in range(first, len(self.records), chunk_size):
+            chunk = self.records[start:start + chunk_size]
+            for opcode, key, x, y, time_ns in zip(chunk["opcode"].tolist(), chunk["key"].tolist(), chunk["x"].tolist(),
+                                                  chunk["y"].tolist(), chunk["time_ns"].tolist()):
+                action = ACTIONS[opcode]
+                event = {"action": action}
+                if key != NO_STRING:
+                    event.update(name_fields(action, self.strings[key]))
+                event["x"] = x
+                event["y"] = y
+                event["timer"] = (time_ns - previous_ns) / 1e9
+                event["time_ns"] = time_ns
+                previous_ns = time_ns
+                yield event
+
+
+    def iter_offsets(self, offset=None, chunk_size=4096):
+        """
+        Yields (byte offset, event dict) of each record from the record at byte offset, the first when None.
+        Chunks are smaller than iter_events' default as callers seeking usually stop after a few records
+        """
+        first = 0 if offset is None else (offset - self.records_offset) // RECORD_DTYPE.itemsize
+        for index, event in enumerate(self.iter_events(chunk_size, first), first):
+            yield self.records_offset + index * RECORD_DTYPE.itemsize, event
+
+
+def write_binary(events, path, chunk_size=65536):
+    """
+    Writes iterable of event dicts to a binary macro file in one pass. Records are written in chunks
+    and the string table after them, the header is filled in once the record count is known.
+    """
+    strings = []
+    string_index = {}
+    count = 0
+    chunk = np.zeros(chunk_size, dtype=RECORD_DTYPE)
+    filled = 0
+    with open(path, "wb") as macro_file:
+        macro_file.write(b"\x00" * HEADER.size)
+        for time_ns, event in timed_events(events):
+            name = event_name(event)
+            if name is None:
+                index = NO_STRING
+            else:
+                index = string_index.get(name)
+                if index is None:
+                    if len(strings) >= NO_STRING:
+                        raise ValueError("Binary macro files support at most {} distinct names".format(NO_STRING))
+                    index = string_index[name] = len(strings)
+                    strings.append(name)
+            chunk[filled] = (OPCODES[event["action"]], index, event["x"], event["y"], time_ns)
+            filled += 1
+            count += 1
+            if filled == chunk_size:
+                macro_file.write(chunk.tobytes())
+                filled = 0
+        macro_file.write(chunk[:filled].tobytes())
+        strings_offset = macro_file.tell()
+        macro_file.write(json.dumps(strings).encode("utf-8"))
+        macro_file.seek(0)
+        macro_file.write(HEADER.pack(MAGIC, VERSION, count, HEADER.size, strings_offset))
+
+
+def write_json(events, path, output_format="jsonl"):
+    """
+    Writes iterable of event dicts as JSON Lines or a single JSON array. Each event is written with its absolute
+    "time_ns" and the "timer" delta derived from it, so older players can still read exported files
+    """
+    events = exported_events(events)
+    with open(path, "w") as macro_file:
+        if output_format == "jsonl":
+            for event in events:
+                macro_file.write(json.dumps(event) + "\n")
+        else:
+            json.dump(list(events), macro_file)
+
@@ -0,0 +1,29 @@
+import os
+import argparse
+from MacroReader import MacroReader
+from BinaryMacro import write_binary, write_json
+
+
+def main(input_file, output_file, output_format):
+    """
+    Converts a macro file of any supported format to the given output format
+    """
+    reader = MacroReader(input_file)
+    if output_format == "binary":
+        write_binary(reader, output_file)
+    else:
+        write_json(reader, output_file, output_format)
+    print("{} ({}, {} bytes) -> {} ({}, {} bytes)".format(input_file, reader.format, os.path.getsize(input_file),
+                                                          output_file, output_format, os.path.getsize(output_file)))
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("--input_file", type=str, required=True, help="String - Path to macro file to convert, any format")
+    argParser.add_argument("--output_file", type=str, required=True, help="String - Path to write converted macro to")
+    argParser.add_argument("--output_format", type=str, required=False, choices=["binary", "jsonl", "json"],
+                           help="String - Format to convert to must be 'binary', 'jsonl' or 'json'")
+    argParser.set_defaults(output_format="binary")
+    args = argParser.parse_args()
+
+    main(args.input_file, args.output_file, args.output_format)
@@ -0,0 +1,91 @@
+import math
+import time
+import numpy as np
+import pytweening
+
+
+class CursorInjector:
+    def __init__(self, backend, scheduler, frame_rate=250, fail_safe_interval=0.05):
+        """
+        Emits whole precomputed cursor trajectories through the backend's low level set_position at a fixed frame rate,
+        instead of one pyautogui moveTo per point with its own fail safe check, position query and pause.
+        Fail safe is checked at most once per fail_safe_interval seconds. Frames, time spent injecting and
+        time spent inside set_position are counted so achieved frame rate and per frame overhead can be reported.
+        --------
+        Args:
+        --backend: OutputBackend, cursor positions are set through this
+        --scheduler: PlaybackScheduler, used to wait for each frame
+        --frame_rate: Int, frames per second trajectories are emitted at, eg 125, 250 or 500
+        --fail_safe_interval: Float, min seconds between fail safe checks
+        """
+        self.backend = backend
+        self.scheduler = scheduler
+        self.frame_rate = frame_rate
+        self.fail_safe_interval = fail_safe_interval
+        self.last_fail_safe_check = 0.0
+        self.frames = 0
+        self.elapsed = 0.0
+        self.overhead = 0.0
+
+    @staticmethod
+    def frames_of(points, times, frame_rate):
+        """
+        Resamples points reached at times to one frame every 1 / frame_rate seconds, the last point is always included.
+        Returns lists of frame times and whole pixel x and y
+        """
+        points = np.asarray(points, dtype=np.float64)
+        times = np.asarray(times, dtype=np.float64)
+        frame_times = np.append(np.arange(times[0], times[-1], 1.0 / frame_rate), times[-1])
+        frame_x = np.rint(np.interp(frame_times, times, points[:, 0])).astype(int).tolist()
+        frame_y = np.rint(np.interp(frame_times, times, points[:, 1])).astype(int).tolist()
+        return frame_times.tolist(), frame_x, frame_y
+
+    @staticmethod
+    def tween_points(start, x, y, duration, tween, frame_rate):
+        """
+        Returns (points, offsets) of a move from start to x, y following tween, offsets are seconds from the move's start
+        """
+        frames = max(1, math.ceil(duration * frame_rate))
+        progress = np.array([tween(frame / frames) for frame in range(frames + 1)])
+        points = np.column_stack((start[0] + (x - start[0]) * progress, start[1] + (y - start[1]) * progress))
+        return points, np.linspace(0.0, duration, frames + 1)
+
+    def inject_path(self, points, times):
+        """
+        Moves cursor along points, reaching each at its perf_counter time in times.
+        The path is resampled to one frame every 1 / frame_rate seconds, the last point is always emitted.
+        """
+        frame_times, frame_x, frame_y = self.frames_of(points, times, self.frame_rate)
+        start = time.perf_counter()
+        for frame_time, x, y in zip(frame_times, frame_x, frame_y):
+            self.scheduler.wait_until(frame_time)
+            frame_start = time.perf_counter()
+            self.backend.set_position(x, y)
+            if frame_start - self.last_fail_safe_check >= self.fail_safe_interval:
+                self.backend.fail_safe_check()
+                self.last_fail_safe_check = frame_start
+            self.overhead += time.perf_counter() - frame_start
+        self.frames += len(frame_x)
+        self.elapsed += time.perf_counter() - start
+
+    def inject_move(self, x, y, duration, tween=pytweening.linear):
+        """
+        Moves cursor from its current position to x, y over duration seconds following tween
+        """
+        start = self.backend.position()
+        now = time.perf_counter()
+        if duration <= 0:
+            self.inject_path([(x, y)], [now])
+            return
+        points, offsets = self.tween_points(start, x, y, duration, tween, self.frame_rate)
+        self.inject_path(points, now + offsets)
+
+    def report(self):
+        """
+        Prints achieved frame rate and overhead per frame
+        """
+        if self.frames == 0:
+            return
+        achieved = self.frames / self.elapsed if self.elapsed > 0 else float("inf")
+        print("Injection: {} frames, achieved {:.0f} Hz of {} Hz, overhead {:.1f} us per frame".format(
+            self.frames, achieved, self.frame_rate, self.overhead / self.frames * 1e6))
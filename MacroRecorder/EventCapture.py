@@ -0,0 +1,51 @@
+import time
+import threading
+from collections import deque
+
+
+class EventCapture:
+    def __init__(self, handler, poll_interval=0.002):
+        """
+        Moves event processing off the input listener threads. Listener callbacks only push small tuples with push(),
+        a deque append which is atomic so it never takes a lock, and a worker thread passes them to handler in order.
+        --------
+        Args:
+        --handler: Function, called on the worker thread with each pushed tuple
+        --poll_interval: Float, seconds the worker sleeps when there are no events waiting
+        """
+        self.handler = handler
+        self.poll_interval = poll_interval
+        self.events = deque()
+        self.push = self.events.append
+        self.running = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        """
+        Starts worker thread
+        """
+        self.running = True
+        self.thread.start()
+
+    def run(self):
+        """
+        Worker thread, handles events until stopped and the deque is drained
+        """
+        popleft = self.events.popleft
+        while True:
+            try:
+                event = popleft()
+            except IndexError:
+                if not self.running:
+                    return
+                time.sleep(self.poll_interval)
+                continue
+            self.handler(event)
+
+    def stop(self):
+        """
+        Handles any events still waiting then stops worker thread
+        """
+        self.running = False
+        if self.thread is not threading.current_thread():
+            self.thread.join()
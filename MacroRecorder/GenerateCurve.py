@@ -1,21 +1,29 @@
-import pyautogui as pg
 import numpy as np
 import random
 from BezierCurve import BezierCurve
 class GenerateCurve:
 
-    def __init__(self, end_x, end_y, max_distance=10):
+    def __init__(self, end_x, end_y, max_distance=10, start=None, dense=True):
         """
         Generates a human-like set of points on a curve starting at given source point and finishing in a given destination point
         Control points are points which the curves bends towards, creating the more human shape, as opposed to straight lines between points.
         self.points holds the final points generated
+        start: optional (x, y) tuple for the source point, defaults to the current cursor position
+        dense: when False only the control points are generated and self.points is None,
+        points are then evaluated on demand with sample_points
         """
-        self.start_x = pg.position()[0]
-        self.start_y = pg.position()[1]
+        if start is None:
+            # Imported here as pyautogui needs a display, callers with a known start point can run headless
+            import pyautogui as pg
+            start = pg.position()
+        self.start_x = start[0]
+        self.start_y = start[1]
         self.end_x = end_x
         self.end_y = end_y
         self.max_distance = max_distance
+        self.dense = dense
         self.distance = np.sqrt((self.start_x - end_x) ** 2 + (self.start_y - end_y) ** 2)
+        self.points_count = max(abs(self.start_x - self.end_x), abs(self.start_y - self.end_y), 2)
         self.control_points_number = self.calculate_control_points(self.start_x, self.start_y, self.end_x, self.end_y)
         self.points = self.generate_curve(self.control_points_number)
 
@@ -35,6 +43,9 @@ class GenerateCurve:
         passed, the default value is used.
         """
         internal_control_points = self.control_point_coords(control_points_number)
+        self.control_points = [(self.start_x, self.start_y)] + internal_control_points + [(self.end_x, self.end_y)]
+        if not self.dense:
+            return None
         points = self.generate_points(internal_control_points)
         return points
 
@@ -94,9 +105,14 @@ class GenerateCurve:
     def generate_points(self, control_points):
         """
         Generates the points on bezier curve based on pre generated control points passed in.
+        Points are returned as an (n, 2) numpy array.
         """
-        x = abs(self.start_x - self.end_x)
-        y = abs(self.start_y - self.end_y)
-        midPtsCnt = max(x, y, 2)
         control_points = [(self.start_x, self.start_y)] + control_points + [(self.end_x, self.end_y)]
-        return BezierCurve.curve_coords(midPtsCnt, control_points)
\ No newline at end of file
+        return BezierCurve.curve_points(self.points_count, control_points)
+
+    def sample_points(self, progress):
+        """
+        Evaluates only the points at the given progress values between 0 and 1 along the curve,
+        used instead of self.points when the curve is not dense.
+        """
+        return BezierCurve.points_at(progress, self.control_points)
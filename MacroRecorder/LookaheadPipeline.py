@@ -0,0 +1,92 @@
+import time
+import queue
+import threading
+
+
+class LookaheadPipeline:
+    def __init__(self, compiler, number_of_plays=1, depth=8):
+        """
+        Producer/consumer playback pipeline. A background thread compiles the steps of the next events while
+        the injecting thread waits on the current one, so trajectories are ready by the time they are needed.
+        Each play starts from the predicted end position of the previous play rather than a live pg.position().
+        --------
+        Args:
+        --compiler: MacroCompiler, used to generate the steps of each event
+        --number_of_plays: Int, plays to produce steps for
+        --depth: Int, max events compiled ahead of playback, bounds memory on long macros
+        """
+        self.compiler = compiler
+        self.number_of_plays = number_of_plays
+        self.queue = queue.Queue(maxsize=max(1, depth))
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.produce, daemon=True)
+        self.stalls = 0
+        self.stall_time = 0.0
+
+    def start(self):
+        """
+        Starts producer thread
+        """
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops producer thread, safe to call when playback ended early
+        """
+        self.stopped.set()
+        self.thread.join()
+
+    def produce(self):
+        """
+        Producer thread, puts (play offset, event steps) items on queue, then None when done.
+        Errors are passed on the queue so they are raised in the playback thread.
+        """
+        try:
+            position = None
+            offset = 0.0
+            for loop in range(self.number_of_plays):
+                for steps in self.compiler.iter_steps(position):
+                    if not self.put((offset, steps)):
+                        return
+                position = self.compiler.position
+                offset += self.compiler.play_time
+            self.put(None)
+        except Exception as error:
+            self.put(error)
+
+    def put(self, item):
+        """
+        Blocks until there is room on the queue, returns False if the pipeline was stopped whilst waiting
+        """
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __iter__(self):
+        """
+        Yields (play offset, event steps) in order, counting how often playback had to wait on the producer
+        """
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                self.stalls += 1
+                stall_start = time.perf_counter()
+                item = self.queue.get()
+                self.stall_time += time.perf_counter() - stall_start
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def report(self):
+        """
+        Prints how often and for how long playback waited on the producer
+        """
+        print("Lookahead: playback waited on trajectory generation {} times, {:.3f} ms in total".format(
+            self.stalls, self.stall_time * 1000))
@@ -0,0 +1,250 @@
+import os
+import time
+import sqlite3
+import argparse
+import numpy as np
+from MacroEvents import MacroEvents
+from MacroReader import MacroReader
+from BinaryMacro import ACTIONS, OPCODES, TEXT_PREFIX
+
+# Catalog database kept in the save directory, rebuilt when its schema version changes
+CATALOG_FILE = "macro_catalog.sqlite"
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS macros (file TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, format TEXT, events INTEGER,
+                                   stored_events INTEGER, duration REAL, min_x INTEGER, min_y INTEGER, max_x INTEGER,
+                                   max_y INTEGER, moves INTEGER, checkpoints INTEGER, routines INTEGER);
+CREATE INDEX IF NOT EXISTS macros_duration ON macros (duration);
+CREATE INDEX IF NOT EXISTS macros_events ON macros (events);
+CREATE TABLE IF NOT EXISTS inputs (name TEXT, kind TEXT, file TEXT, count INTEGER, PRIMARY KEY (name, kind, file)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS inputs_file ON inputs (file);
+CREATE TABLE IF NOT EXISTS unreadable (file TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER);
+"""
+# Files in the save directory that are never macros: the catalog, its journal and MacroIndex sidecars
+SKIPPED_SUFFIXES = (".sqlite", ".sqlite-journal", ".sqlite-wal", ".sqlite-shm", ".idx")
+# Opcodes whose name is a key and those whose name is a mouse button, looked up by opcode
+KEY_OPCODES = np.isin(np.arange(len(ACTIONS)), [OPCODES["pressed_key"], OPCODES["tap"]])
+BUTTON_OPCODES = np.isin(np.arange(len(ACTIONS)), [OPCODES["pressed"], OPCODES["click"]])
+SORT_COLUMNS = ("file", "duration", "events")
+
+
+class MacroCatalog:
+    def __init__(self, save_path, catalog_file=None):
+        """
+        SQLite catalog of the statistics of every macro in a save directory, its duration, event count, keys and buttons
+        used and screen bounding box, so macros can be found without opening each file.
+        The catalog is updated for one macro when MacroRecorder saves it and by rescan(), which only reads files whose
+        size or modification time changed since they were catalogued and drops files that are gone.
+        --------
+        Args:
+        --save_path: String, path to directory holding the macros
+        --catalog_file: String, path to the catalog database. Default is macro_catalog.sqlite in save_path
+        """
+        self.save_path = save_path
+        self.path = catalog_file if catalog_file is not None else os.path.join(save_path, CATALOG_FILE)
+        self.connection = sqlite3.connect(self.path, timeout=10)
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            with self.connection:
+                for table in ("macros", "inputs", "unreadable"):
+                    self.connection.execute("DROP TABLE IF EXISTS {}".format(table))
+            self.connection.executescript(SCHEMA)
+            self.connection.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+        self.scan_stats = None
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def statistics(store):
+        """
+        Returns (dict of macros columns, list of (name, kind, count) inputs) for a MacroEvents store
+        """
+        if store.routines:
+            # Positions in routines are relative to their calls, so folded macros are flattened to measure them
+            store = MacroEvents.from_dicts(store.iter_dicts())
+        count = store.count
+        actions = store.count_by_action()
+        box = store.bounding_box() or (None, None, None, None)
+        row = {"events": count, "stored_events": count, "duration": store.duration(), "min_x": box[0], "min_y": box[1],
+               "max_x": box[2], "max_y": box[3], "moves": actions["moved"] + actions["polyline"],
+               "checkpoints": actions["wait_for"], "routines": 0}
+        opcodes, names = store.opcode[:count], store.name[:count]
+        inputs = {}
+        for kind, kind_opcodes in (("key", KEY_OPCODES), ("button", BUTTON_OPCODES)):
+            selected = names[kind_opcodes[opcodes]]
+            for name_index, name_count in zip(*np.unique(selected, return_counts=True)):
+                inputs[(store.names[name_index], kind)] = int(name_count)
+        # Characters of typed strings count as presses of their keys
+        for name_index in np.unique(names[opcodes == OPCODES["type"]]).tolist():
+            for char in store.names[name_index][len(TEXT_PREFIX):]:
+                key = (("Key.space" if char == " " else char), "key")
+                inputs[key] = inputs.get(key, 0) + 1
+        return row, [(name, kind, name_count) for (name, kind), name_count in inputs.items()]
+
+    def write(self, file_name, size, mtime_ns, file_format, store):
+        """
+        Writes the catalog rows of one macro, replacing any it had
+        """
+        row, inputs = self.statistics(store)
+        row.update(file=file_name, size=size, mtime_ns=mtime_ns, format=file_format, stored_events=store.count,
+                   routines=len(store.routines))
+        self.connection.execute("DELETE FROM inputs WHERE file = ?", (file_name,))
+        self.connection.execute("DELETE FROM unreadable WHERE file = ?", (file_name,))
+        self.connection.execute("INSERT OR REPLACE INTO macros ({}) VALUES ({})".format(
+            ", ".join(row), ", ".join("?" * len(row))), list(row.values()))
+        self.connection.executemany("INSERT INTO inputs (name, kind, file, count) VALUES (?, ?, ?, ?)",
+                                    [(name, kind, file_name, name_count) for name, kind, name_count in inputs])
+
+    def remove(self, file_name):
+        """
+        Drops a macro from the catalog
+        """
+        for table in ("macros", "inputs", "unreadable"):
+            self.connection.execute("DELETE FROM {} WHERE file = ?".format(table), (file_name,))
+
+    def update(self, file_name, events=None):
+        """
+        Catalogs one macro file of the save directory, events is the macro already loaded as MacroEvents to skip reading it
+        """
+        path = os.path.join(self.save_path, file_name)
+        stat = os.stat(path)
+        with self.connection:
+            self.write(file_name, stat.st_size, stat.st_mtime_ns, MacroReader.detect_format(path),
+                       events if events is not None else MacroEvents.load(path))
+
+    def rescan(self):
+        """
+        Brings the catalog up to date with the save directory. Only new files and those whose size or modification time
+        changed are read, files that cannot be read as macros are remembered so they are not read again until they change
+        """
+        start = time.perf_counter()
+        known = {file_name: (size, mtime_ns) for file_name, size, mtime_ns in
+                 self.connection.execute("SELECT file, size, mtime_ns FROM macros UNION ALL "
+                                         "SELECT file, size, mtime_ns FROM unreadable")}
+        stats = {"files": 0, "added": 0, "updated": 0, "removed": 0, "unchanged": 0, "unreadable": 0}
+        with self.connection:
+            with os.scandir(self.save_path) as entries:
+                for entry in entries:
+                    if not entry.is_file() or entry.name.endswith(SKIPPED_SUFFIXES):
+                        continue
+                    stats["files"] += 1
+                    stat = entry.stat()
+                    key = (stat.st_size, stat.st_mtime_ns)
+                    previous = known.pop(entry.name, None)
+                    if previous == key:
+                        stats["unchanged"] += 1
+                        continue
+                    try:
+                        store = MacroEvents.load(entry.path)
+                        file_format = MacroReader.detect_format(entry.path)
+                    except (ValueError, KeyError, TypeError, AttributeError, UnicodeDecodeError):
+                        self.remove(entry.name)
+                        self.connection.execute("INSERT INTO unreadable (file, size, mtime_ns) VALUES (?, ?, ?)",
+                                                (entry.name,) + key)
+                        stats["unreadable"] += 1
+                        continue
+                    self.write(entry.name, stat.st_size, stat.st_mtime_ns, file_format, store)
+                    stats["added" if previous is None else "updated"] += 1
+            for file_name in known:
+                self.remove(file_name)
+                stats["removed"] += 1
+        stats["seconds"] = time.perf_counter() - start
+        self.scan_stats = stats
+        return stats
+
+    def query(self, min_duration=None, max_duration=None, min_events=None, max_events=None, keys=(), buttons=(),
+              within=None, sort="file", limit=None):
+        """
+        Returns list of dicts of the catalogued macros matching every filter given, answered from the catalog alone.
+        Durations are in seconds, keys and buttons must all be used and within is (min x, min y, max x, max y) the
+        bounding box of the macro must lie inside
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError("sort must be one of {}.".format(", ".join(SORT_COLUMNS)))
+        clauses, parameters = [], []
+        for column, operator, value in (("duration", ">=", min_duration), ("duration", "<=", max_duration),
+                                        ("events", ">=", min_events), ("events", "<=", max_events)):
+            if value is not None:
+                clauses.append("{} {} ?".format(column, operator))
+                parameters.append(value)
+        for kind, names in (("key", keys), ("button", buttons)):
+            for name in names:
+                clauses.append("file IN (SELECT file FROM inputs WHERE name = ? AND kind = ?)")
+                parameters.extend((name, kind))
+        if within is not None:
+            clauses.append("min_x >= ? AND min_y >= ? AND max_x <= ? AND max_y <= ?")
+            parameters.extend(within)
+        sql = "SELECT * FROM macros"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY {}".format(sort)
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+        cursor = self.connection.execute(sql, parameters)
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def inputs(self, file_name):
+        """
+        Returns dict of (name, kind) to number of times a catalogued macro presses each key and button
+        """
+        return {(name, kind): count for name, kind, count in
+                self.connection.execute("SELECT name, kind, count FROM inputs WHERE file = ?", (file_name,))}
+
+    def report(self):
+        """
+        Prints what the last rescan read
+        """
+        stats = self.scan_stats
+        if stats is None:
+            return
+        print("Rescanned {files} files in {:.1f} ms: {added} added, {updated} updated, {removed} removed, {unchanged} "
+              "unchanged, {unreadable} unreadable".format(stats["seconds"] * 1000, **stats))
+
+
+def parse_box(value):
+    """
+    Returns (min x, min y, max x, max y) of a box written "x1,y1,x2,y2"
+    """
+    box = [int(part) for part in value.split(",")]
+    if len(box) != 4:
+        raise ValueError("within must be written x1,y1,x2,y2.")
+    return min(box[0], box[2]), min(box[1], box[3]), max(box[0], box[2]), max(box[1], box[3])
+
+
+def main(save_path, rescan, min_duration, max_duration, min_events, max_events, keys, buttons, within, sort, limit):
+    catalog = MacroCatalog(save_path)
+    if rescan:
+        catalog.rescan()
+        catalog.report()
+    start = time.perf_counter()
+    macros = catalog.query(min_duration, max_duration, min_events, max_events, keys, buttons,
+                           parse_box(within) if within is not None else None, sort, limit)
+    seconds = time.perf_counter() - start
+    for macro in macros:
+        box = (macro["min_x"], macro["min_y"], macro["max_x"], macro["max_y"]) if macro["min_x"] is not None else None
+        print("{file}: {events} events over {duration:.2f} s, bounding box {box}, {format}".format(box=box, **macro))
+    print("{} macros found in {:.2f} ms".format(len(macros), seconds * 1000))
+    catalog.close()
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("--save_path", type=str, required=True, help="String - File path to save directory of the macros")
+    argParser.add_argument('--rescan', action='store_true', help="Flag - Updates the catalog with macros added, changed or removed since it was last updated")
+    argParser.add_argument("--min_duration", type=float, required=False, help="Float - Fewest seconds a macro lasts")
+    argParser.add_argument("--max_duration", type=float, required=False, help="Float - Most seconds a macro lasts")
+    argParser.add_argument("--min_events", type=int, required=False, help="Integer - Fewest events in a macro")
+    argParser.add_argument("--max_events", type=int, required=False, help="Integer - Most events in a macro")
+    argParser.add_argument("--keys", type=str, nargs="+", required=False, help="String - Keys a macro presses, all must be used, eg 'a' 'Key.enter'")
+    argParser.add_argument("--buttons", type=str, nargs="+", required=False, help="String - Mouse buttons a macro presses, all must be used, eg 'Button.left'")
+    argParser.add_argument("--within", type=str, required=False, help="String - Screen box 'x1,y1,x2,y2' every event of a macro is inside")
+    argParser.add_argument("--sort", type=str, required=False, choices=SORT_COLUMNS, help="String - Order macros are listed in must be 'file', 'duration' or 'events'")
+    argParser.add_argument("--limit", type=int, required=False, help="Integer - Most macros listed")
+    argParser.set_defaults(rescan=False, min_duration=None, max_duration=None, min_events=None, max_events=None, keys=[],
+                           buttons=[], within=None, sort="file", limit=None)
+    args = argParser.parse_args()
+
+    main(args.save_path, args.rescan, args.min_duration, args.max_duration, args.min_events, args.max_events, args.keys,
+         args.buttons, args.within, args.sort, args.limit)
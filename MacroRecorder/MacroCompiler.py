@@ -0,0 +1,247 @@
+import os
+import math
+import pickle
+import random
+import hashlib
+from collections import namedtuple, OrderedDict
+import numpy as np
+import pytweening
+from TrajectoryLibrary import TrajectoryLibrary
+
+# Opcodes of a compiled plan. Moves start at their time and take duration seconds, all other opcodes fire at their time.
+# WAIT_FOR polls its checkpoint from its time for up to duration seconds, a match moves the rest of the plan earlier.
+MOVE_TO = 0
+MOVE_PATH = 1
+MOVE_LIVE = 2
+KEY_PRESS = 3
+KEY_RELEASE = 4
+MOUSE_PRESS = 5
+MOUSE_RELEASE = 6
+WAIT = 7
+WAIT_FOR = 8
+TAP = 9
+CLICK = 10
+TYPE = 11
+
+# Bump when the plan layout or the compile logic changes so old cached plans are not reused
+PLAN_VERSION = 6
+
+# time: seconds from start of play, duration: seconds a move takes, x/y: move destination,
+# value: resolved key, button or text for input opcodes, tween function for MOVE_TO and ScreenCheckpoint for WAIT_FOR,
+# points: (n, 2) array for MOVE_PATH
+PlanStep = namedtuple("PlanStep", ["opcode", "time", "duration", "x", "y", "value", "points"])
+
+
+class MacroCompiler:
+    def __init__(self, data, movement_type, max_random_px, backend, max_travel=0.7, library=None):
+        """
+        Compiles macro events into a flat plan of PlanSteps so playback only has to dispatch inputs.
+        Key and button names are resolved through the output backend and every movement trajectory is generated up front.
+        --------
+        Args:
+        --data: MacroEvents, macro events as loaded from save file, iterated once per compiled play
+        --movement_type: String, "instant", "simple" or "human", see MacroPlayer
+        --max_random_px: Int, max distance from recorded coords a human movement can end
+        --backend: OutputBackend, resolves recorded key and button names to the values it injects
+        --max_travel: Float, max seconds a human movement takes, shortened by MacroPlayer when playback is sped up
+        --library: TrajectoryLibrary, human movements are taken from it when given instead of generated for every move
+        """
+        self.data = data
+        self.movement_type = movement_type
+        self.max_random_px = max_random_px
+        self.backend = backend
+        self.max_travel = max_travel
+        self.library = library
+
+    def compile(self, seed):
+        """
+        Returns plan for one play of the macro. All randomness is drawn from the given seed,
+        the global random states are restored afterwards.
+        """
+        random_state = random.getstate()
+        np_random_state = np.random.get_state()
+        random.seed(seed)
+        np.random.seed(seed % 2 ** 32)
+        try:
+            return self.compile_steps()
+        finally:
+            random.setstate(random_state)
+            np.random.set_state(np_random_state)
+
+    def compile_steps(self):
+        """
+        Returns plan for one play using the current random state
+        """
+        plan = []
+        for steps in self.iter_steps():
+            plan.extend(steps)
+        return plan
+
+    def iter_steps(self, position=None):
+        """
+        Walks the events once yielding the steps of each event, predicting where the cursor is after each one instead of asking pg.position().
+        position is the predicted cursor position at the start of the play, when unknown the first movement is left to be generated live.
+        self.position and self.play_time hold the predicted end position and length of the play once walked.
+        """
+        self.position = position
+        self.play_time = 0.0
+        # Each interned key and button name is resolved once rather than for every event
+        resolved = self.data.resolve(self.backend)
+        for event in self.data:
+            action, timer, x, y = event.action, event.timer, event.x, event.y
+            event_time = event.time
+            start_time = event_time - timer
+            self.play_time = event_time
+
+            # Checkpoints do not move the cursor, playback starts polling as soon as the previous event has fired
+            if action == "wait_for":
+                yield [PlanStep(WAIT_FOR, start_time, timer, x, y, resolved[event.name_index], None)]
+                continue
+
+            # Polylines hold their own absolute points so never need the cursor position
+            if action == "polyline":
+                path = self.polyline_path(resolved[event.name_index], timer)
+                self.position = (x, y)
+                yield [PlanStep(MOVE_PATH, start_time, timer, x, y, None, path),
+                       PlanStep(WAIT, event_time, 0.0, x, y, None, None)]
+                continue
+
+            steps = []
+
+            if self.position is None:
+                steps.append(PlanStep(MOVE_LIVE, start_time, timer, x, y, action, None))
+                self.position = (x, y)
+            elif (x, y) != self.position:
+                if action == "moved" or self.movement_type == "simple":
+                    steps.append(self.simple_step(x, y, start_time, timer))
+                elif self.movement_type == "instant":
+                    steps.append(PlanStep(MOVE_TO, start_time, 0.0, x, y, pytweening.linear, None))
+                else:
+                    if self.max_random_px > 0:
+                        x += random.randint(-self.max_random_px, self.max_random_px)
+                        y += random.randint(-self.max_random_px, self.max_random_px)
+                    steps.append(self.human_step(self.position, x, y, event_time, timer, self.max_travel,
+                                                    self.library))
+                self.position = (x, y)
+
+            steps.append(self.action_step(event, event_time, resolved))
+            yield steps
+
+    @staticmethod
+    def simple_step(x, y, start_time, timer):
+        """
+        Straight line move taking up to the time before the event, long waits get a random travel time
+        """
+        travel_time = timer if timer < 0.7 else random.uniform(0.3, 0.7)
+        return PlanStep(MOVE_TO, start_time, max(travel_time, 0.001), x, y, pytweening.linear, None)
+
+    @staticmethod
+    def human_step(start, x, y, event_time, timer, max_travel=0.7, library=None):
+        """
+        Human move over the last max_travel seconds before the event, same as MacroPlayer.paced_human_movement.
+        The number of points follows the travel time so shorter moves get fewer points.
+        """
+        travel_time = min(timer, max_travel)
+        number_of_points = math.floor(travel_time / 0.03)
+        if number_of_points > 5:
+            if library is not None:
+                points = library.points(start, (x, y), number_of_points)
+            else:
+                points = TrajectoryLibrary.generate(start, (x, y), number_of_points)
+            return PlanStep(MOVE_PATH, event_time - travel_time, travel_time, x, y, None, points)
+        return PlanStep(MOVE_TO, event_time - travel_time, max(travel_time, 0.0), x, y, pytweening.easeOutQuad, None)
+
+    @staticmethod
+    def polyline_path(points, timer, interval=0.01):
+        """
+        Returns (n, 2) array of a polyline's points resampled to one every interval seconds, or its own points when
+        there are more, evenly spread over timer seconds like every MOVE_PATH. points is the (n, 3) array of x, y and
+        seconds after the previous event from MacroEvents.resolve, its times are stretched to timer so a warped
+        macro's polylines follow the warped gap.
+        """
+        offsets = points[:, 2]
+        if offsets[-1] > 0:
+            offsets = offsets * (timer / offsets[-1])
+        number_of_points = max(len(points), math.ceil(timer / interval))
+        times = timer * np.arange(1, number_of_points + 1) / number_of_points
+        return np.column_stack((np.interp(times, offsets, points[:, 0]), np.interp(times, offsets, points[:, 1])))
+
+    @staticmethod
+    def action_step(event, event_time, resolved):
+        """
+        Returns step for the input of an event with its opcode and backend key or button, resolved is from MacroEvents.resolve
+        """
+        action = event.action
+        if action == "pressed_key" or action == "released_key":
+            opcode = KEY_PRESS if action == "pressed_key" else KEY_RELEASE
+            return PlanStep(opcode, event_time, 0.0, event.x, event.y, resolved[event.name_index], None)
+        if action == "pressed" or action == "released":
+            opcode = MOUSE_PRESS if action == "pressed" else MOUSE_RELEASE
+            return PlanStep(opcode, event_time, 0.0, event.x, event.y, resolved[event.name_index], None)
+        if action == "tap" or action == "click" or action == "type":
+            opcode = TAP if action == "tap" else CLICK if action == "click" else TYPE
+            return PlanStep(opcode, event_time, 0.0, event.x, event.y, resolved[event.name_index], None)
+        return PlanStep(WAIT, event_time, 0.0, event.x, event.y, None, None)
+
+
+class PlanCache:
+    def __init__(self, cache_path, memory_size=0):
+        """
+        Stores compiled plans on disk keyed by macro file, its modification time and size, playback settings and seed.
+        Other settings the plan depends on, such as time warp, are passed as a settings tuple and are part of the key.
+        --------
+        Args:
+        --cache_path: String, directory plans are written to, created when missing
+        --memory_size: Int, number of recently used plans also kept in memory so long running players skip unpickling them
+        """
+        self.cache_path = cache_path
+        self.memory_size = memory_size
+        self.memory = OrderedDict()
+
+    def plan_file(self, macro_file, movement_type, max_random_px, seed, settings=()):
+        """
+        Returns path of the cached plan for the given macro file, settings and seed
+        """
+        stat = os.stat(macro_file)
+        key = repr((os.path.abspath(macro_file), stat.st_mtime_ns, stat.st_size, movement_type, max_random_px, seed,
+                    tuple(settings), PLAN_VERSION))
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_path, "{}.{}.{}.plan".format(os.path.basename(macro_file), seed, digest))
+
+    def load(self, macro_file, movement_type, max_random_px, seed, settings=()):
+        """
+        Returns cached plan or None when there is no plan for these settings
+        """
+        path = self.plan_file(macro_file, movement_type, max_random_px, seed, settings)
+        plan = self.memory.get(path)
+        if plan is not None:
+            self.memory.move_to_end(path)
+            return plan
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as plan_file:
+            plan = pickle.load(plan_file)
+        self.remember(path, plan)
+        return plan
+
+    def save(self, plan, macro_file, movement_type, max_random_px, seed, settings=()):
+        """
+        Writes plan to cache, through a temporary file so a killed run never leaves a partial plan
+        """
+        os.makedirs(self.cache_path, exist_ok=True)
+        path = self.plan_file(macro_file, movement_type, max_random_px, seed, settings)
+        with open(path + ".tmp", "wb") as plan_file:
+            pickle.dump(plan, plan_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+        self.remember(path, plan)
+
+    def remember(self, path, plan):
+        """
+        Keeps plan in memory, evicting the least recently used past memory_size
+        """
+        if self.memory_size <= 0:
+            return
+        self.memory[path] = plan
+        self.memory.move_to_end(path)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
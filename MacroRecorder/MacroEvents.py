@@ -0,0 +1,370 @@
+import numpy as np
+from MacroReader import MacroReader
+from BinaryMacro import BinaryMacro, ACTIONS, OPCODES, NO_STRING, CHECKPOINT_PREFIX, TEXT_PREFIX, POLYLINE_PREFIX, ROUTINE_PREFIX, CALL_PREFIX, event_name, name_fields, timed_events
+from ScreenCheckpoint import ScreenCheckpoint
+
+
+class MacroEvent:
+    """
+    Lightweight view of one event in a MacroEvents store, attributes are read from the store's columns when created.
+    name is the key or button name or encoded checkpoint, None for movements, and timer the seconds since the previous event.
+    """
+    __slots__ = ("index", "opcode", "name_index", "x", "y", "time_ns", "timer", "events")
+
+    def __init__(self, events, index):
+        self.events = events
+        self.index = index
+        self.opcode = int(events.opcode[index])
+        self.name_index = int(events.name[index])
+        self.x = int(events.x[index])
+        self.y = int(events.y[index])
+        self.time_ns = int(events.time_ns[index])
+        self.timer = (self.time_ns - (int(events.time_ns[index - 1]) if index > 0 else 0)) / 1e9
+
+    @property
+    def action(self):
+        return ACTIONS[self.opcode]
+
+    @property
+    def name(self):
+        return self.events.names[self.name_index] if self.name_index != NO_STRING else None
+
+    @property
+    def time(self):
+        """Seconds from the start of the macro"""
+        return self.time_ns / 1e9
+
+    def to_dict(self):
+        """Returns event in the JSON save format, with the timer derived from its absolute time"""
+        event = {"action": self.action}
+        if self.name_index != NO_STRING:
+            event.update(name_fields(self.action, self.name))
+        event["x"] = self.x
+        event["y"] = self.y
+        event["timer"] = self.timer
+        event["time_ns"] = self.time_ns
+        return event
+
+
+class MacroEvents:
+    def __init__(self, capacity=1024):
+        """
+        Columnar in-memory store of macro events shared by the recorder and the player.
+        Each column is a typed numpy array (opcode, interned name index, x, y, time in ns from start of macro)
+        and key/button names are interned in self.names, so an event costs 21 bytes instead of a dict of strings.
+        Columns grow by doubling, only the first len(self) entries of each are valid.
+        Routines folded by RoutineFolder are kept once in self.routines and "call" events are stored in the columns,
+        iterating expands each call into its routine's events as it comes up so the flat macro is never held in memory.
+        --------
+        Args:
+        --capacity: Int, number of events room is allocated for up front
+        """
+        capacity = max(1, capacity)
+        self.opcode = np.empty(capacity, dtype=np.uint8)
+        self.name = np.empty(capacity, dtype=np.uint32)
+        self.x = np.empty(capacity, dtype=np.int32)
+        self.y = np.empty(capacity, dtype=np.int32)
+        self.time_ns = np.empty(capacity, dtype=np.int64)
+        self.count = 0
+        self.names = []
+        self.name_indexes = {}
+        # Call name to MacroEvents of the routine's events, positions relative to the call and times from it
+        self.routines = {}
+
+    @staticmethod
+    def from_dicts(events):
+        """
+        Builds store from an iterable of event dicts in the JSON save format in one pass
+        """
+        store = MacroEvents()
+        for time_ns, event in timed_events(events):
+            store.append(event["action"], event_name(event), event["x"], event["y"], time_ns)
+        return store
+
+    @staticmethod
+    def from_binary(binary_macro):
+        """
+        Builds store from an open BinaryMacro, copying each column out of the memory mapped records in one operation
+        """
+        store = MacroEvents(len(binary_macro))
+        records = binary_macro.records
+        store.opcode[:len(records)] = records["opcode"]
+        store.name[:len(records)] = records["key"]
+        store.x[:len(records)] = records["x"]
+        store.y[:len(records)] = records["y"]
+        store.time_ns[:len(records)] = records["time_ns"]
+        store.count = len(records)
+        store.names = list(binary_macro.strings)
+        store.name_indexes = {name: index for index, name in enumerate(store.names)}
+        defines = store.opcode[:store.count] == OPCODES["define"]
+        if defines.any():
+            for name_index in store.name[:store.count][defines].tolist():
+                store.define(store.names[name_index])
+            keep = ~defines
+            for column in ("opcode", "name", "x", "y", "time_ns"):
+                kept = getattr(store, column)[:store.count][keep]
+                getattr(store, column)[:len(kept)] = kept
+            store.count = int(keep.sum())
+        return store
+
+    @staticmethod
+    def load(path):
+        """
+        Loads a macro file of any supported format, JSON files are streamed so no list of dicts is ever held
+        """
+        reader = MacroReader(path)
+        if reader.format == "binary":
+            with BinaryMacro(path) as binary_macro:
+                return MacroEvents.from_binary(binary_macro)
+        return MacroEvents.from_dicts(reader)
+
+    def intern(self, name):
+        """
+        Returns index of name in the names table, adding it if new
+        """
+        if name is None:
+            return NO_STRING
+        index = self.name_indexes.get(name)
+        if index is None:
+            if len(self.names) >= NO_STRING:
+                raise ValueError("MacroEvents supports at most {} distinct names".format(NO_STRING))
+            index = self.name_indexes[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def append(self, action, name, x, y, time_ns):
+        """
+        Adds event, time_ns is the time from start of macro and must not be before the previous event.
+        A "define" event adds its routine instead
+        """
+        if action == "define":
+            self.define(name)
+            return
+        if self.count == len(self.opcode):
+            capacity = len(self.opcode) * 2
+            for column in ("opcode", "name", "x", "y", "time_ns"):
+                grown = np.empty(capacity, dtype=getattr(self, column).dtype)
+                grown[:self.count] = getattr(self, column)[:self.count]
+                setattr(self, column, grown)
+        index = self.count
+        self.opcode[index] = OPCODES[action]
+        self.name[index] = self.intern(name)
+        self.x[index] = round(x)
+        self.y[index] = round(y)
+        self.time_ns[index] = time_ns
+        self.count += 1
+
+    def define(self, name):
+        """
+        Adds the routine encoded in a "define" event's name. Its events share this store's names table
+        """
+        fields = name_fields("define", name)
+        routine = MacroEvents(len(fields["events"]))
+        routine.names = self.names
+        routine.name_indexes = self.name_indexes
+        for action, called_name, x, y, time_ns in fields["events"]:
+            routine.append(action, called_name, x, y, time_ns)
+        self.routines[CALL_PREFIX + str(fields["routine"])] = routine
+
+    def routine_durations(self):
+        """
+        Returns array of ns each stored event lasts, the length of its routine for calls and 0 for other events
+        """
+        durations = np.zeros(self.count, dtype=np.int64)
+        if self.routines:
+            for name, routine in self.routines.items():
+                if name in self.name_indexes:
+                    durations[self.name[:self.count] == self.name_indexes[name]] = routine.duration_ns()
+        return durations
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("event index out of range")
+        return MacroEvent(self, index)
+
+    def __iter__(self):
+        """
+        Yields view of each event, calls are expanded into views of their routine's events moved to the call's position and time
+        """
+        if not self.routines:
+            for index in range(self.count):
+                yield MacroEvent(self, index)
+            return
+        call = OPCODES["call"]
+        previous_ns = 0
+        for index in range(self.count):
+            event = MacroEvent(self, index)
+            if event.opcode != call:
+                # After a call the gap is from the routine's last event, not the call. Routines keep the timing of one
+                # repeat, events never fire before the end of a call played that way
+                event.time_ns = max(event.time_ns, previous_ns)
+                event.timer = (event.time_ns - previous_ns) / 1e9
+                previous_ns = event.time_ns
+                yield event
+                continue
+            routine = self.routines[event.name]
+            for routine_index in range(routine.count):
+                called = MacroEvent(routine, routine_index)
+                called.x += event.x
+                called.y += event.y
+                called.time_ns = max(called.time_ns + event.time_ns, previous_ns)
+                called.timer = (called.time_ns - previous_ns) / 1e9
+                previous_ns = called.time_ns
+                yield called
+
+    def expanded_count(self):
+        """
+        Number of events iterating yields, with every call expanded
+        """
+        if not self.routines:
+            return self.count
+        lengths = {self.name_indexes[name]: routine.count for name, routine in self.routines.items() if name in self.name_indexes}
+        calls = self.opcode[:self.count] == OPCODES["call"]
+        names = self.name[:self.count][calls]
+        return self.count - int(calls.sum()) + sum(lengths[name] for name in names.tolist())
+
+    def last(self):
+        """
+        Returns view of the last event or None when empty
+        """
+        return self[-1] if self.count else None
+
+    def iter_dicts(self):
+        """
+        Yields events as dicts in the JSON save format
+        """
+        for event in self:
+            yield event.to_dict()
+
+    def resolve(self, backend):
+        """
+        Returns list resolving each interned name through the backend once, index it with MacroEvent.name_index.
+        Checkpoints resolve to ScreenCheckpoint objects, typed text to the string and polylines to (n, 3) arrays
+        of x, y and seconds after the previous event. Routines and calls are never played so resolve to None.
+        """
+        resolved = []
+        for name in self.names:
+            if name.startswith(ROUTINE_PREFIX) or name.startswith(CALL_PREFIX):
+                resolved.append(None)
+            elif name.startswith(CHECKPOINT_PREFIX):
+                resolved.append(ScreenCheckpoint.from_dict(name_fields("wait_for", name)["checkpoint"]))
+            elif name.startswith(TEXT_PREFIX):
+                resolved.append(name_fields("type", name)["text"])
+            elif name.startswith(POLYLINE_PREFIX):
+                resolved.append(np.array(name_fields("polyline", name)["points"], dtype=np.float64).reshape(-1, 3))
+            elif name.startswith("Button."):
+                resolved.append(backend.resolve_button(name))
+            else:
+                resolved.append(backend.resolve_key(name))
+        return resolved
+
+    def slice_time(self, start, end):
+        """
+        Returns new store holding events from start up to but not including end seconds, found by binary search.
+        Times stay relative to the start of the original macro.
+        """
+        times = self.time_ns[:self.count]
+        first = int(np.searchsorted(times, round(start * 1e9), side="left"))
+        last = int(np.searchsorted(times, round(end * 1e9), side="left"))
+        return self.copy(first, last)
+
+    def copy(self, first=0, last=None):
+        """
+        Returns new store holding a copy of the events from index first up to last, all events by default
+        """
+        last = self.count if last is None else last
+        store = MacroEvents(last - first)
+        for column in ("opcode", "name", "x", "y", "time_ns"):
+            getattr(store, column)[:last - first] = getattr(self, column)[first:last]
+        store.count = last - first
+        store.names = list(self.names)
+        store.name_indexes = dict(self.name_indexes)
+        store.routines = dict(self.routines)
+        return store
+
+    def warp(self, speed=1.0, max_gap=0.0, min_gap=0.0):
+        """
+        Returns copy with event times rescaled in one vectorised pass over the gaps between events.
+        Each gap is divided by speed and then clamped to at most max_gap and at least min_gap seconds, 0 turns a limit off.
+        Routines are warped the same way, the gap before a call is from the end of the event or call before it, and an
+        event after a call ending later than it is moved to the end of the call as when iterating.
+        """
+        if speed <= 0:
+            raise ValueError("speed must be above 0")
+
+        def warped(gaps):
+            gaps = gaps / speed
+            if max_gap > 0:
+                np.minimum(gaps, max_gap * 1e9, out=gaps)
+            if min_gap > 0:
+                np.maximum(gaps, min_gap * 1e9, out=gaps)
+            return np.rint(gaps).astype(np.int64)
+
+        store = self.copy()
+        for name, routine in self.routines.items():
+            # A routine's first event is at its call, only the gaps after it are warped
+            warped_routine = routine.copy()
+            warped_routine.names, warped_routine.name_indexes = routine.names, routine.name_indexes
+            warped_routine.time_ns[1:routine.count] = np.cumsum(warped(np.diff(routine.time_ns[:routine.count])))
+            store.routines[name] = warped_routine
+        times = self.time_ns[:self.count]
+        durations = self.routine_durations()
+        gaps = warped(np.maximum(times - np.concatenate(([0], (times + durations)[:-1])), 0))
+        warped_durations = store.routine_durations()
+        store.time_ns[:self.count] = np.cumsum(gaps + np.concatenate(([0], warped_durations[:-1])))
+        return store
+
+    def count_by_action(self):
+        """
+        Returns dict of number of events per action
+        """
+        counts = np.bincount(self.opcode[:self.count], minlength=len(ACTIONS))
+        return {action: int(counts[opcode]) for opcode, action in enumerate(ACTIONS)}
+
+    def bounding_box(self):
+        """
+        Returns (min x, min y, max x, max y) of all event positions, None when empty
+        """
+        if self.count == 0:
+            return None
+        x, y = self.x[:self.count], self.y[:self.count]
+        return int(x.min()), int(y.min()), int(x.max()), int(y.max())
+
+    def duration(self):
+        """
+        Seconds from start of macro to the last event
+        """
+        return self.duration_ns() / 1e9
+
+    def duration_ns(self):
+        """
+        ns from start of macro to the last event, the end of its routine when the last event is a call
+        """
+        if self.count == 0:
+            return 0
+        last = self.count - 1
+        if self.routines and self.opcode[last] == OPCODES["call"]:
+            return int(self.time_ns[last]) + self.routines[self.names[int(self.name[last])]].duration_ns()
+        return int(self.time_ns[last])
+
+    def nbytes(self):
+        """
+        Bytes used by the valid part of the columns
+        """
+        return sum(getattr(self, column)[:self.count].nbytes for column in ("opcode", "name", "x", "y", "time_ns"))
+
+    def summary(self):
+        """
+        Returns one line description of the events
+        """
+        counts = ", ".join("{} {}".format(count, action) for action, count in self.count_by_action().items() if count)
+        line = "{} events over {:.2f} s ({}), bounding box {}".format(self.count, self.duration(), counts or "none",
+                                                                 self.bounding_box())
+        if self.routines:
+            line += ", {} routines expanding to {} events".format(len(self.routines), self.expanded_count())
+        return line
@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import struct
+import argparse
+import numpy as np
+from MacroReader import MacroReader
+from MacroEvents import MacroEvents
+from BinaryMacro import event_name
+
+# Index file: magic, version, sample count, offset of the JSON metadata written after the samples
+MAGIC = b"MRINDEX\x00"
+VERSION = 1
+HEADER = struct.Struct("<8sHQQ")
+
+# One sample every stride events: event number, its time and the time of the event before it in ns from start of macro,
+# byte offset of the event in the macro file, cursor position and index of the held keys and buttons before it
+SAMPLE_DTYPE = np.dtype([("event", "<u8"), ("time_ns", "<i8"), ("previous_ns", "<i8"), ("offset", "<u8"),
+                         ("x", "<i4"), ("y", "<i4"), ("held", "<u4")])
+# Cursor position of samples before the first event, when it is not known yet
+NO_POSITION = -2 ** 31
+
+RELEASES = {"pressed_key": "released_key", "pressed": "released"}
+
+
+def parse_position(value):
+    """
+    Returns ("event", number) for a position written "#N", otherwise ("time", ns from start of macro) for seconds
+    given as a number or "[[hours:]minutes:]seconds"
+    """
+    if isinstance(value, str) and value.startswith("#"):
+        kind, value = "event", int(value[1:])
+    else:
+        seconds = 0.0
+        for part in str(value).split(":"):
+            seconds = seconds * 60 + float(part)
+        kind, value = "time", round(seconds * 1e9)
+    if value < 0:
+        raise ValueError("positions must not be negative.")
+    return kind, value
+
+
+class MacroIndex:
+    def __init__(self, macro_file, stride=256):
+        """
+        Sidecar index of a JSON Lines or binary macro file, saved next to it as [macro file].idx, so playback can start
+        and end anywhere in a long recording without parsing the rest of the file. Every stride events it samples the
+        event number, time, byte offset in the file, cursor position and the keys and buttons held down at that point.
+        Finding a position is a binary search over the samples, then at most stride events are read to reach it.
+        The index is built in one streaming pass and rebuilt when the macro file's size or modification time changes.
+        --------
+        Args:
+        --macro_file: String, path to macro file
+        --stride: Int, number of events between samples
+        """
+        if stride < 1:
+            raise ValueError("stride must be at least 1.")
+        self.macro_file = macro_file
+        self.path = macro_file + ".idx"
+        self.stride = int(stride)
+        self.reader = MacroReader(macro_file)
+        self.samples = np.zeros(0, dtype=SAMPLE_DTYPE)
+        self.held = []
+        self.info = {}
+        self.window_stats = None
+
+    @staticmethod
+    def open(macro_file, stride=256):
+        """
+        Returns index of a macro file, loaded from its sidecar or built and saved when that is missing or stale
+        """
+        index = MacroIndex(macro_file, stride)
+        if not index.load():
+            index.build()
+            index.save()
+        return index
+
+    def file_key(self):
+        """
+        Returns (size, modification time in ns) of the macro file, an index built for another key is stale
+        """
+        stat = os.stat(self.macro_file)
+        return stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    def track(held, event):
+        """
+        Updates dict of held (press action, name) in press order with an event
+        """
+        action = event["action"]
+        if action in RELEASES:
+            held[(action, event_name(event))] = None
+        elif action in ("released_key", "released"):
+            held.pop(("pressed_key" if action == "released_key" else "pressed", event_name(event)), None)
+
+    def stream(self, offset=None, previous_ns=0):
+        """
+        Yields (byte offset, time in ns from start of macro, event) from the event at byte offset, previous_ns is
+        the time of the event before it for files holding only timer deltas
+        """
+        time_ns = previous_ns
+        for offset, event in self.reader.iter_from(offset):
+            time_ns = event["time_ns"] if "time_ns" in event else time_ns + round(event["timer"] * 1e9)
+            yield offset, time_ns, event
+
+    def build(self):
+        """
+        Samples the macro file in one pass
+        """
+        start = time.perf_counter()
+        size, mtime_ns = self.file_key()
+        samples = []
+        held = {}
+        held_indexes = {}
+        self.held = []
+        position = (NO_POSITION, NO_POSITION)
+        previous_ns = 0
+        count = 0
+        for offset, time_ns, event in self.stream():
+            if event["action"] == "define":
+                raise ValueError("{} holds routines, folded macros cannot be indexed.".format(self.macro_file))
+            if count % self.stride == 0:
+                snapshot = json.dumps(list(held))
+                if snapshot not in held_indexes:
+                    held_indexes[snapshot] = len(self.held)
+                    self.held.append([list(pressed) for pressed in held])
+                samples.append((count, time_ns, previous_ns, offset, position[0], position[1], held_indexes[snapshot]))
+            self.track(held, event)
+            # The player moves the cursor to every event but checkpoints
+            if event["action"] != "wait_for":
+                position = (event["x"], event["y"])
+            previous_ns = time_ns
+            count += 1
+        self.samples = np.array(samples, dtype=SAMPLE_DTYPE)
+        self.info = {"size": size, "mtime_ns": mtime_ns, "format": self.reader.format, "stride": self.stride,
+                     "events": count, "duration_ns": previous_ns, "build_ms": (time.perf_counter() - start) * 1000}
+
+    def save(self):
+        """
+        Writes the index next to the macro file
+        """
+        with open(self.path, "wb") as index_file:
+            metadata_offset = HEADER.size + self.samples.nbytes
+            index_file.write(HEADER.pack(MAGIC, VERSION, len(self.samples), metadata_offset))
+            index_file.write(self.samples.tobytes())
+            index_file.write(json.dumps(dict(self.info, held=self.held)).encode("utf-8"))
+
+    def load(self):
+        """
+        Loads the saved index, returns False when there is none or it is stale, of another version or stride
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "rb") as index_file:
+            data = index_file.read()
+        if len(data) < HEADER.size:
+            return False
+        magic, version, count, metadata_offset = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            return False
+        info = json.loads(data[metadata_offset:].decode("utf-8"))
+        if (info["size"], info["mtime_ns"]) != self.file_key() or info["stride"] != self.stride:
+            return False
+        self.held = info.pop("held")
+        self.info = info
+        self.samples = np.frombuffer(data, dtype=SAMPLE_DTYPE, count=count, offset=HEADER.size)
+        return True
+
+    def locate(self, position):
+        """
+        Returns number of the last sample at or before a parse_position() position, found by binary search
+        """
+        kind, value = position
+        if kind == "event":
+            found = np.searchsorted(self.samples["event"], value, side="right")
+        else:
+            # Events can share a time, so the search stops at the last sample strictly before it
+            found = np.searchsorted(self.samples["time_ns"], value, side="left")
+        return max(0, int(found) - 1)
+
+    @staticmethod
+    def reached(position, number, time_ns):
+        """
+        Checks an event, given its number and time, is at or past a parse_position() position
+        """
+        kind, value = position
+        return number >= value if kind == "event" else time_ns >= value
+
+    def window(self, start_at=None, end_at=None):
+        """
+        Returns MacroEvents of the events from start_at up to but not including end_at, read from the macro file
+        starting at the nearest sample. Positions are seconds or "#N" event numbers, see parse_position().
+        Times are moved so start_at is 0. The window starts by moving the cursor to where it was and pressing the
+        keys and buttons held at start_at, and ends by releasing those still held after its last event.
+        """
+        start = parse_position(start_at) if start_at is not None else ("event", 0)
+        end = parse_position(end_at) if end_at is not None else None
+        if len(self.samples) == 0:
+            raise ValueError("{} holds no events".format(self.macro_file))
+        sample = self.samples[self.locate(start)]
+        held = {tuple(pressed): None for pressed in self.held[int(sample["held"])]}
+        position = (int(sample["x"]), int(sample["y"]))
+        store = MacroEvents()
+        base_ns = None
+        first = last = None
+        restored = 0
+        for number, (offset, time_ns, event) in enumerate(self.stream(int(sample["offset"]), int(sample["previous_ns"])),
+                                                          int(sample["event"])):
+            if base_ns is None:
+                if not self.reached(start, number, time_ns):
+                    self.track(held, event)
+                    if event["action"] != "wait_for":
+                        position = (event["x"], event["y"])
+                    continue
+                base_ns = start[1] if start[0] == "time" else time_ns
+                first = number
+                if position[0] != NO_POSITION:
+                    store.append("moved", None, position[0], position[1], 0)
+                    for action, name in held:
+                        store.append(action, name, position[0], position[1], 0)
+                    restored = len(held)
+            if end is not None and self.reached(end, number, time_ns):
+                break
+            store.append(event["action"], event_name(event), event["x"], event["y"], time_ns - base_ns)
+            self.track(held, event)
+            if event["action"] != "wait_for":
+                position = (event["x"], event["y"])
+            last = number
+        if last is None:
+            raise ValueError("no events between start_at {} and end_at {}.".format(start_at, end_at))
+        end_ns = int(store.time_ns[store.count - 1])
+        for action, name in reversed(list(held)):
+            store.append(RELEASES[action], name, position[0], position[1], end_ns)
+        self.window_stats = {"first": first, "last": last, "start": base_ns / 1e9, "end": base_ns / 1e9 + end_ns / 1e9,
+                             "restored": restored, "released": len(held), "events": self.info["events"]}
+        return store
+
+    def report(self):
+        """
+        Prints the last window played and the state restored for it
+        """
+        stats = self.window_stats
+        if stats is None:
+            return
+        print("Window: events {first} to {last} of {events}, {start:.2f} s to {end:.2f} s, {restored} held keys and "
+              "buttons restored, {released} released at the end".format(**stats))
+
+
+def main(macro_file, stride):
+    index = MacroIndex(macro_file, stride)
+    index.build()
+    index.save()
+    info = index.info
+    print("Indexed {} events over {:.2f} s in {:.1f} ms, {} samples, {} bytes written to {}".format(
+        info["events"], info["duration_ns"] / 1e9, info["build_ms"], len(index.samples), os.path.getsize(index.path),
+        index.path))
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("--macro_file", type=str, required=True, help="String - Path to JSON Lines or binary macro file to index")
+    argParser.add_argument("--stride", type=int, required=False, help="Integer - Number of events between index samples")
+    argParser.set_defaults(stride=256)
+    args = argParser.parse_args()
+
+    main(args.macro_file, args.stride)
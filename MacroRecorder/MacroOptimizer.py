@@ -0,0 +1,235 @@
+import io
+import os
+import time
+import argparse
+import contextlib
+import numpy as np
+from MacroReader import MacroReader
+from MacroEvents import MacroEvents
+from PathSimplifier import PathSimplifier
+from BinaryMacro import write_binary, write_json, timed_events, exported_events
+
+
+def typed_char(key):
+    """
+    Returns the character a key types when it can be part of a typed string, otherwise None
+    """
+    if key == "Key.space":
+        return " "
+    return key if len(key) == 1 else None
+
+
+class MacroOptimizer:
+    def __init__(self, tap_tolerance=0.05, type_tolerance=0.5, path_tolerance=2.0, time_tolerance=0.05):
+        """
+        Offline pass rewriting a recorded event list into fewer, compact primitives the player injects in batched calls.
+        Every event that is kept fires at its recorded time, the time of removed events moves onto the next one.
+            --"moved" events to where the cursor already is are dropped
+            --Runs of "moved" events become one "polyline" holding the points needed to stay within path_tolerance
+            pixels and time_tolerance seconds of the recorded path
+            --A key or mouse button press directly followed by its release at the same position within tap_tolerance
+            seconds becomes a "tap" or "click"
+            --Runs of taps of plain characters at the same position spanning at most type_tolerance seconds become one
+            "type" of the whole string
+        --------
+        Args:
+        --tap_tolerance: Float, max seconds a key or button can be held for its press and release to become one tap
+        --type_tolerance: Float, max seconds between the first and last tap of a typed string, later characters are typed
+            up to this early
+        --path_tolerance: Float, max pixels a dropped move can be from its polyline
+        --time_tolerance: Float, max seconds a polyline can pass a dropped move early or late
+        """
+        self.tap_tolerance = tap_tolerance
+        self.type_tolerance = type_tolerance
+        self.simplifier = PathSimplifier(path_tolerance, time_tolerance)
+        self.stats = {"events_in": 0, "events_out": 0, "dropped_moves": 0, "polylines": 0, "polyline_moves": 0,
+                      "taps": 0, "clicks": 0, "typed": 0, "typed_chars": 0}
+
+    def optimize(self, events):
+        """
+        Returns list of optimised event dicts for an iterable of event dicts in the JSON save format
+        """
+        # Folding works on (time in ns from start of macro, event) pairs so kept events keep their exact times
+        timed = list(timed_events(events))
+        self.stats["events_in"] += len(timed)
+        timed = self.fold_typing(self.fold_taps(self.fold_moves(timed)))
+        self.stats["events_out"] += len(timed)
+
+        return list(exported_events(dict(event, time_ns=time_ns) for time_ns, event in timed))
+
+    def fold_moves(self, timed):
+        """
+        Drops moves to the current cursor position and folds runs of moves into polylines
+        """
+        folded = []
+        run = []
+        position = None
+        for time_ns, event in timed:
+            action, point = event["action"], (event["x"], event["y"])
+            if action == "moved":
+                if point == position:
+                    self.stats["dropped_moves"] += 1
+                    continue
+                if not run:
+                    # The run's path starts where the cursor was when the event before it fired
+                    start = (folded[-1][0] if folded else 0, position)
+                run.append((time_ns, event))
+                position = point
+                continue
+            if run:
+                folded.append(self.polyline(run, *start))
+                run = []
+            folded.append((time_ns, event))
+            # The player moves the cursor to every event but checkpoints
+            if action != "wait_for":
+                position = point
+        if run:
+            folded.append(self.polyline(run, *start))
+        return folded
+
+    def polyline(self, run, start_ns, start_position):
+        """
+        Returns (time, event) of a run of moves, a "polyline" of the simplified path or the single move when one is enough
+        """
+        if len(run) == 1:
+            return run[0]
+        points = [(event["x"], event["y"], time_ns) for time_ns, event in run]
+        if start_position is not None:
+            points.insert(0, (start_position[0], start_position[1], start_ns))
+        keep = self.simplifier.simplify(np.array(points, dtype=np.float64)) if len(points) >= 3 else [True] * len(points)
+        kept = [point for point, is_kept in zip(points, keep) if is_kept]
+        if start_position is not None:
+            kept = kept[1:]
+        time_ns, last = run[-1]
+        self.stats["polyline_moves"] += len(run)
+        if len(kept) == 1:
+            return time_ns, last
+        self.stats["polylines"] += 1
+        polyline = {"action": "polyline", "points": [[x, y, round((t - start_ns) / 1e9, 4)] for x, y, t in kept],
+                    "x": last["x"], "y": last["y"]}
+        return time_ns, polyline
+
+    def fold_taps(self, timed):
+        """
+        Folds presses directly followed by their release into taps and clicks
+        """
+        folded = []
+        index = 0
+        while index < len(timed):
+            time_ns, event = timed[index]
+            if index + 1 < len(timed) and event["action"] in ("pressed_key", "pressed"):
+                release_ns, release = timed[index + 1]
+                is_key = event["action"] == "pressed_key"
+                field = "key" if is_key else "button"
+                if (release["action"] == ("released_key" if is_key else "released") and release[field] == event[field]
+                        and (release["x"], release["y"]) == (event["x"], event["y"])
+                        and release_ns - time_ns <= self.tap_tolerance * 1e9):
+                    folded.append((time_ns, {"action": "tap" if is_key else "click", field: event[field],
+                                             "x": event["x"], "y": event["y"]}))
+                    self.stats["taps" if is_key else "clicks"] += 1
+                    index += 2
+                    continue
+            folded.append((time_ns, event))
+            index += 1
+        return folded
+
+    def fold_typing(self, timed):
+        """
+        Folds runs of taps of plain characters into typed strings
+        """
+        folded = []
+        run = []
+
+        def flush():
+            if len(run) > 1:
+                first_ns, first = run[0]
+                text = "".join(typed_char(event["key"]) for _, event in run)
+                folded.append((first_ns, {"action": "type", "text": text, "x": first["x"], "y": first["y"]}))
+                self.stats["taps"] -= len(run)
+                self.stats["typed"] += 1
+                self.stats["typed_chars"] += len(run)
+            else:
+                folded.extend(run)
+            run.clear()
+
+        for time_ns, event in timed:
+            if event["action"] == "tap" and typed_char(event["key"]) is not None:
+                if run and ((event["x"], event["y"]) != (run[0][1]["x"], run[0][1]["y"])
+                            or time_ns - run[0][0] > self.type_tolerance * 1e9):
+                    flush()
+                run.append((time_ns, event))
+                continue
+            flush()
+            folded.append((time_ns, event))
+        flush()
+        return folded
+
+    def report(self):
+        """
+        Prints how many events were removed and what they became
+        """
+        stats = self.stats
+        removed = stats["events_in"] - stats["events_out"]
+        percent = removed / stats["events_in"] * 100 if stats["events_in"] else 0.0
+        print("Optimized {events_in} events to {events_out}".format(**stats) + ", removed {} ({:.1f}%)".format(removed, percent))
+        print("  {dropped_moves} moves to the same position dropped, {polyline_moves} moves folded into {polylines} polylines, "
+              "{taps} taps, {clicks} clicks, {typed_chars} characters typed as {typed} strings".format(**stats))
+
+    @staticmethod
+    def playback_cost(path, movement_type="instant"):
+        """
+        Plays a macro headless with every wait removed and returns (CPU seconds, backend calls), the cost of
+        injecting it with no time spent waiting
+        """
+        # Imported here so optimising files does not load the player
+        from MacroPlayer import MacroPlayer
+        from OutputBackend import RecordingBackend
+        backend = RecordingBackend(simulate_duration=False)
+        save_path, save_file = os.path.split(os.path.abspath(path))
+        player = MacroPlayer(save_path, save_file, movement_type, timing="absolute", backend=backend, speed=1e6)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.process_time()
+            player.run()
+            cpu = time.process_time() - start
+        return cpu, len(backend.log)
+
+
+def main(input_file, output_file, output_format, tap_tolerance, type_tolerance, path_tolerance, time_tolerance, measure):
+    """
+    Optimises a macro file of any supported format, written in the input's format unless output_format is given
+    """
+    reader = MacroReader(input_file)
+    optimizer = MacroOptimizer(tap_tolerance, type_tolerance, path_tolerance, time_tolerance)
+    # Routines of folded macros are expanded so their events are optimised too
+    events = optimizer.optimize(MacroEvents.load(input_file).iter_dicts())
+    output_format = output_format if output_format is not None else reader.format
+    if output_format == "binary":
+        write_binary(events, output_file)
+    else:
+        write_json(events, output_file, output_format)
+    optimizer.report()
+    if measure:
+        before_cpu, before_calls = MacroOptimizer.playback_cost(input_file)
+        after_cpu, after_calls = MacroOptimizer.playback_cost(output_file)
+        change = (after_cpu - before_cpu) / before_cpu * 100 if before_cpu > 0 else 0.0
+        print("Playback: {} -> {} backend calls, CPU {:.1f} ms -> {:.1f} ms ({:+.1f}%)".format(
+            before_calls, after_calls, before_cpu * 1000, after_cpu * 1000, change))
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("--input_file", type=str, required=True, help="String - Path to macro file to optimize, any format")
+    argParser.add_argument("--output_file", type=str, required=True, help="String - Path to write optimized macro to")
+    argParser.add_argument("--output_format", type=str, required=False, choices=["binary", "jsonl", "json"],
+                           help="String - Format to write must be 'binary', 'jsonl' or 'json', defaults to the input's format")
+    argParser.add_argument("--tap_tolerance", type=float, required=False, help="Float - Max seconds a key or button is held for its press and release to become a tap")
+    argParser.add_argument("--type_tolerance", type=float, required=False, help="Float - Max seconds from the first to the last character of a typed string")
+    argParser.add_argument("--path_tolerance", type=float, required=False, help="Float - Max pixels a polyline can be from the recorded moves")
+    argParser.add_argument("--time_tolerance", type=float, required=False, help="Float - Max seconds a polyline can reach a recorded move early or late")
+    argParser.add_argument('--measure', action='store_true', help="Flag - Plays both macros headless and prints the change in backend calls and CPU time")
+    argParser.set_defaults(output_format=None, tap_tolerance=0.05, type_tolerance=0.5, path_tolerance=2.0,
+                           time_tolerance=0.05, measure=False)
+    args = argParser.parse_args()
+
+    main(args.input_file, args.output_file, args.output_format, args.tap_tolerance, args.type_tolerance,
+         args.path_tolerance, args.time_tolerance, args.measure)
@@ -1,17 +1,30 @@
-import json
+import os
 import random
 import time
 import math
 import argparse
-from pynput.mouse import Button, Controller as MouseController
-from pynput.keyboard import Key, Controller as KeyboardController
-import pyautogui as pg
-from GenerateCurve import GenerateCurve
-from NoiseAndTween import NoiseAndTween
+import pytweening
+import numpy as np
+from TrajectoryLibrary import TrajectoryLibrary
+from PlaybackTrace import PlaybackTrace, TracingBackend
+from PlaybackScheduler import PlaybackScheduler
+from MacroEvents import MacroEvents
+from MacroIndex import MacroIndex
+from LookaheadPipeline import LookaheadPipeline
+from OutputBackend import PyAutoGuiBackend
+from CursorInjector import CursorInjector
+from MacroCompiler import MacroCompiler, PlanCache, MOVE_TO, MOVE_PATH, MOVE_LIVE, KEY_PRESS, KEY_RELEASE, MOUSE_PRESS, MOUSE_RELEASE, WAIT, WAIT_FOR, TAP, CLICK, TYPE
+
+# Actions plan steps are traced as, moves are all "plan_move"
+STEP_ACTIONS = {KEY_PRESS: "pressed_key", KEY_RELEASE: "released_key", MOUSE_PRESS: "pressed", MOUSE_RELEASE: "released",
+                WAIT: "moved", WAIT_FOR: "wait_for", TAP: "tap", CLICK: "click", TYPE: "type"}
 
 
 class MacroPlayer:
-    def __init__(self, save_path, save_file, movement_type="human", number_of_plays=1, max_random_px=10, fail_safe=True):
+    def __init__(self, save_path, save_file, movement_type="human", number_of_plays=1, max_random_px=10, fail_safe=True, timing="relative",
+                 precompile=False, seed=None, plan_cache=None, lookahead=0, backend=None,
+                 frame_rate=0, speed=1.0, max_gap=0.0, min_gap=0.0, trajectory_variants=0, trajectory_file=None, trace=None,
+                 events=None, start_at=None, end_at=None):
         """
         Class plays back keyboard and mouse macros recorded using accompanying recorder
         Args:
@@ -24,140 +37,531 @@ class MacroPlayer:
         --number_of_plays: Int, the macro will be repeated this many times
         --max_random_px: Int, Used when doing human movement type to determine the max distance from actual x and y coords a press can be.
         --fail_safe: Boolean, Will keep standard fail safes for pyautogui, this includes moving mouse to corner of screen and ctrl alt delete to stop running
+        --timing: String, how recorded timers are waited on. Values are, "relative", "absolute"
+            --Relative timing sleeps for each timer in turn, subtracting estimated overheads
+            --Absolute timing turns timers into deadlines from the start of playback, movements fit in the time left before each deadline
+        --precompile: Boolean, compiles the macro into a plan with all trajectories generated before playback starts, implies absolute timing
+        --seed: Int, seed for all randomness of playback so every run of the macro moves exactly the same,
+            a precompiled plan uses a random seed when not given
+        --plan_cache: String, directory compiled plans are cached in, only used when a seed is given. Default is "plan_cache" in save_path.
+            A PlanCache can be given instead to share one between players
+        --lookahead: Int, when above 0 a background thread generates movements this many events ahead of playback, implies absolute timing
+        --backend: OutputBackend, inputs are injected through this, defaults to PyAutoGuiBackend which drives the desktop
+        --frame_rate: Int, when above 0 timed movements are emitted as whole trajectories at this many frames per second
+            through the backend's low level cursor control rather than a pyautogui moveTo per point. Needs a deadline so only
+            applies with absolute timing, precompile or lookahead
+        --speed: Float, recorded timers are divided by this, 2 plays twice as fast. Human movements get at most 0.7 / speed
+            seconds of travel so their number of points shrinks with the warped time
+        --max_gap: Float, seconds any wait between events is capped at after the speed is applied, 0 turns it off
+        --min_gap: Float, seconds any wait between events is raised to after the speed is applied, 0 turns it off
+        --trajectory_variants: Int, when above 0 human movements come from a TrajectoryLibrary keeping this many
+            variants of each move, so moves repeated on every play are generated once
+        --trajectory_file: String, file the trajectory library is loaded from and saved to after playback, None keeps it in memory
+        --trace: String, when given every event's lateness and time per stage is recorded to this trace file
+            and a summary per movement type is printed after playback, see PlaybackTrace. Off by default
+        --events: MacroEvents, the macro already loaded from save_file, used instead of reading it again
+        --start_at: String, plays from this position, seconds as a number or "[[hours:]minutes:]seconds", or "#N" for
+            event number N counting from 0. Only the window played is read from the file, found through a sidecar MacroIndex,
+            and the cursor position and keys and buttons held at that point are restored first. Not for JSON array files
+        --end_at: String, plays up to but not including this position, same formats as start_at.
+            Keys and buttons still held at the end of the window are released
         """
-        pg.FAILSAFE = fail_safe
-
         valid_movement_type = {"instant", "simple", "human"}
         if movement_type not in valid_movement_type:
             raise ValueError("results: status must be one of %r." % valid_movement_type)
 
-        with open(save_path + '\\' + save_file, "r+") as json_file:
-            self.data = json.load(json_file)
-
-        self.mouse = MouseController()
-        self.keyboard = KeyboardController()
-        self.special_keys = {"Key.shift": Key.shift, "Key.shift_l": Key.shift_r,
-                             "Key.tab": Key.tab, "Key.caps_lock": Key.caps_lock, "Key.ctrl_l": Key.ctrl_l,
-                             "Key.ctrl_r": Key.ctrl_r, "Key.ctrl": Key.ctrl, "Key.alt": Key.alt, "Key.alt_l": Key.alt_l,
-                             "Key.alt_r": Key.alt_r, "Key.cmd": Key.cmd, "Key.cmd_r": Key.cmd_r, "Key.cmd_l": Key.cmd_l,
-                             "Key.enter": Key.enter, "Key.backspace": Key.backspace, "Key.f20": Key.f20,
-                             "Key.f19": Key.f19, "Key.f18": Key.f18, "Key.f17": Key.f17, "Key.f16": Key.f16,
-                             "Key.f15": Key.f15, "Key.f14": Key.f14, "Key.f13": Key.f13, "Key.f12": Key.f12,
-                             "Key.f11": Key.f11, "Key.f10": Key.f10, "Key.f9": Key.f9, "Key.f8": Key.f8,
-                             "Key.f7": Key.f7, "Key.f6": Key.f6, "Key.f5": Key.f5, "Key.f4": Key.f4, "Key.f3": Key.f3,
-                             "Key.f2": Key.f2, "Key.f1": Key.f1, "Key.media_volume_up": Key.media_volume_up,
-                             "Key.media_volume_down": Key.media_volume_down,
-                             "Key.media_volume_mute": Key.media_volume_mute,
-                             "Key.media_play_pause": Key.media_play_pause, "Key.right": Key.right, "Key.down": Key.down, "Key.left": Key.left, "Key.up": Key.up,
-                             "Key.page_up": Key.page_up, "Key.page_down": Key.page_down, "Key.home": Key.home,
-                             "Key.end": Key.end, "Key.delete": Key.delete, "Key.space": Key.space}
+        valid_timing = {"relative", "absolute"}
+        if timing not in valid_timing:
+            raise ValueError("timing must be one of %r." % valid_timing)
+
+        if speed <= 0:
+            raise ValueError("speed must be above 0.")
+        if 0 < max_gap < min_gap:
+            raise ValueError("max_gap must not be below min_gap.")
+
+        self.backend = backend if backend is not None else PyAutoGuiBackend(fail_safe)
+        self.trace = None
+        if trace is not None:
+            self.trace = PlaybackTrace(trace)
+            self.backend = TracingBackend(self.backend, self.trace)
+        self.macro_file = os.path.join(save_path, save_file)
+        # Events are loaded once into typed columns, key and button names are interned so each is resolved only once
+        self.index = None
+        if start_at is not None or end_at is not None:
+            self.index = MacroIndex.open(self.macro_file)
+            self.data = self.index.window(start_at, end_at)
+        else:
+            self.data = events if events is not None else MacroEvents.load(self.macro_file)
+        self.recorded_duration = self.data.duration()
+        self.warp = (float(speed), float(max_gap), float(min_gap))
+        if self.warp != (1.0, 0.0, 0.0):
+            self.data = self.data.warp(speed, max_gap, min_gap)
+        # Longest human movement, with a floor so the relative timing overhead below still fits
+        self.max_travel = max(0.1, 0.7 / speed)
+
         self.number_of_plays = number_of_plays
         self.movement_type = movement_type
         self.max_random_px = int(max_random_px)
+        self.precompile = precompile
+        self.seed = seed
+        self.library = None
+        if trajectory_variants > 0:
+            self.library = TrajectoryLibrary(trajectory_variants, seed=seed, path=trajectory_file)
+        # Settings besides movement type, max_random_px and seed that change a compiled plan, plans hold keys and
+        # buttons resolved by the backend so one compiled for another backend is never reused
+        self.plan_settings = (self.warp, int(trajectory_variants), start_at, end_at, self.backend.cache_id)
+        if isinstance(plan_cache, PlanCache):
+            self.plan_cache = plan_cache
+        else:
+            self.plan_cache = PlanCache(plan_cache if plan_cache is not None else os.path.join(save_path, "plan_cache"))
+        self.lookahead = int(lookahead)
+        self.scheduler = PlaybackScheduler() if timing == "absolute" or precompile or self.lookahead > 0 else None
+        if self.scheduler is not None:
+            self.scheduler.trace = self.trace
+        self.checkpoint_stats = {"matched": 0, "timed_out": 0, "polls": 0, "saved": 0.0}
+        self.injector = None
+        if frame_rate > 0 and self.scheduler is not None:
+            self.injector = CursorInjector(self.backend, self.scheduler, frame_rate)
 
     def run(self):
         """
         Main Loop for running macro
         """
+        if self.index is not None:
+            self.index.report()
+        if self.warp != (1.0, 0.0, 0.0):
+            self.warp_report()
+        if self.seed is not None:
+            # Compiled plans seed themselves and restore the global state, this covers movements generated live
+            random.seed(self.seed)
+            np.random.seed(self.seed % 2 ** 32)
+        if self.precompile:
+            self.run_plan()
+        elif self.lookahead > 0:
+            self.run_pipeline()
+        else:
+            self.run_live()
+        if self.library is not None:
+            self.library.save()
+        if self.trace is not None:
+            self.trace.close()
+            self.trace.report()
+
+    def run_live(self):
+        """
+        Plays the macro generating each movement as its event comes up
+        """
+        resolved = self.data.resolve(self.backend)
+        trace = self.trace
+        if self.scheduler is not None:
+            self.scheduler.start()
         for loop in range(self.number_of_plays):
-            for index, obj in enumerate(self.data):
-                action, timer, x, y = obj['action'], obj['timer'], obj['x'], obj['y']
+            play_start = time.perf_counter()
+            for event in self.data:
+                action, timer, x, y = event.action, event.timer, event.x, event.y
+                if trace is not None:
+                    trace.begin(loop, action)
 
-                # If cursor hasn't moved we just sleep until action
-                if x == pg.position()[0] and y == pg.position()[1]:
-                    time.sleep(timer)
+                # With absolute timing the timer becomes the time left before this event's deadline
+                deadline = None
+                if self.scheduler is not None:
+                    deadline = self.scheduler.next_deadline(timer)
+                    timer = self.scheduler.time_left(deadline)
 
-                # If we have a "moved" action we just use simple movement
-                elif action == "moved":
-                    self.simple_movement(x, y, timer)
+                # Checkpoints wait for their screen region instead of the recorded timer, which is only the timeout
+                if action == "wait_for":
+                    timeout = deadline if deadline is not None else time.perf_counter() + timer
+                    end = self.wait_for(resolved[event.name_index], timeout)
+                    if self.scheduler is not None:
+                        self.scheduler.resync(end)
+                    if trace is not None:
+                        trace.end("none", end)
+                    continue
 
-                # For all other actions we use inputted movement type
+                if action == "polyline":
+                    movement = "polyline"
+                    self.polyline_movement(resolved[event.name_index], timer, deadline)
                 else:
-                    if self.movement_type == "instant":
-                        self.instant_movement(x, y, timer)
-                    if self.movement_type == "simple":
-                        self.simple_movement(x, y, timer)
-                    if self.movement_type == "human":
-                        # Add randomness for human like movements start and end points
-                        if self.max_random_px > 0:
-                            x_randomness = random.randint(-self.max_random_px, self.max_random_px)
-                            y_randomness = random.randint(-self.max_random_px, self.max_random_px)
-                            self.human_movement(x + x_randomness, y + y_randomness, timer)
-                        else:
-                            self.human_movement(x, y, timer)
+                    movement = self.move_for_event(action, x, y, timer, deadline)
+
+                if deadline is not None:
+                    self.scheduler.wait_until(deadline)
+                    self.scheduler.mark(deadline)
 
                 # Keys presses from keyboard
                 if action == "pressed_key" or action == "released_key":
-                    key = obj['key'] if 'Key.' not in obj['key'] else self.special_keys[obj['key']]
+                    key = resolved[event.name_index]
 
                     if action == "pressed_key":
-                        self.keyboard.press(key)
+                        self.backend.key_press(key)
                     else:
-                        self.keyboard.release(key)
+                        self.backend.key_release(key)
 
                 # Mouse actions, press and release
                 if action == "pressed" or action == "released":
-                    button = obj['button']
-                    split = button.split(".")
-                    button_enum = getattr(Button, split[1])
+                    button_enum = resolved[event.name_index]
 
                     if action == "pressed":
-                        self.mouse.press(button_enum)
+                        self.backend.mouse_press(button_enum)
                     if action == "released":
-                        self.mouse.release(button_enum)
-    @staticmethod
-    def instant_movement(x, y, timer):
+                        self.backend.mouse_release(button_enum)
+
+                # Batched primitives written by MacroOptimizer, each is one backend call
+                if action == "tap":
+                    self.backend.tap(resolved[event.name_index])
+                elif action == "click":
+                    self.backend.click(resolved[event.name_index])
+                elif action == "type":
+                    self.backend.type_text(resolved[event.name_index])
+
+                if trace is not None:
+                    trace.end(movement, deadline if deadline is not None else play_start + event.time)
+
+        self.report()
+
+    def report(self):
+        """
+        Prints timing statistics of the run
+        """
+        if self.scheduler is not None:
+            self.scheduler.report()
+        if self.injector is not None:
+            self.injector.report()
+        if self.library is not None:
+            self.library.report()
+        self.report_checkpoints()
+
+    def report_checkpoints(self):
+        """
+        Prints checkpoint statistics when the macro had any
+        """
+        stats = self.checkpoint_stats
+        if stats["matched"] or stats["timed_out"]:
+            print("Checkpoints: {matched} matched, {timed_out} timed out, {polls} polls, {saved:.2f} s saved "
+                  "against the recorded waits".format(**stats))
+
+    def wait_for(self, checkpoint, deadline):
+        """
+        Waits until a checkpoint's screen region matches, the recorded wait ending at deadline is the timeout.
+        Returns when the wait ended, the match time or deadline on timeout
+        """
+        matched, polls = checkpoint.wait(self.backend.grab_region, deadline)
+        self.checkpoint_stats["polls"] += polls
+        if matched is None:
+            self.checkpoint_stats["timed_out"] += 1
+            return deadline
+        self.checkpoint_stats["matched"] += 1
+        self.checkpoint_stats["saved"] += max(0.0, deadline - matched)
+        return min(matched, deadline)
+
+    def warp_report(self):
+        """
+        Prints the time warp settings and the runtime they save over all plays
+        """
+        warped_duration = self.data.duration()
+        saved = (self.recorded_duration - warped_duration) * self.number_of_plays
+        percent = saved / (self.recorded_duration * self.number_of_plays) * 100 if self.recorded_duration > 0 else 0.0
+        print("Time warp: speed {:g}x, max gap {:g} s, min gap {:g} s, runtime per play {:.2f} s -> {:.2f} s, "
+              "saved {:.2f} s ({:.1f}%) over {} plays".format(self.warp[0], self.warp[1], self.warp[2], self.recorded_duration,
+                                                             warped_duration, saved, percent, self.number_of_plays))
+
+    def move_for_event(self, action, x, y, timer, deadline=None):
+        """
+        Moves cursor to the coords of an event using the inputted movement type.
+        Returns the movement used, "none" when the cursor was already there
+        """
+        # If cursor hasn't moved we just sleep until action
+        current_x, current_y = self.backend.position()
+        if x == current_x and y == current_y:
+            if deadline is None:
+                self.sleep(timer)
+            return "none"
+
+        # If we have a "moved" action we just use simple movement
+        if action == "moved":
+            self.simple_movement(x, y, timer, deadline)
+            return "simple"
+
+        # For all other actions we use inputted movement type
+        else:
+            if self.movement_type == "instant":
+                self.instant_movement(x, y, timer, deadline)
+            if self.movement_type == "simple":
+                self.simple_movement(x, y, timer, deadline)
+            if self.movement_type == "human":
+                # Add randomness for human like movements start and end points
+                if self.max_random_px > 0:
+                    x_randomness = random.randint(-self.max_random_px, self.max_random_px)
+                    y_randomness = random.randint(-self.max_random_px, self.max_random_px)
+                    self.human_movement(x + x_randomness, y + y_randomness, timer, deadline)
+                else:
+                    self.human_movement(x, y, timer, deadline)
+        return self.movement_type
+
+    def sleep(self, seconds):
+        """
+        time.sleep, recording the oversleep when tracing
+        """
+        if self.trace is None:
+            time.sleep(seconds)
+            return
+        start = time.perf_counter()
+        time.sleep(seconds)
+        self.trace.slept(seconds, time.perf_counter() - start)
+
+    def get_plan(self, seed):
+        """
+        Returns compiled plan for seed, from the plan cache when the seed was given by the user
+        """
+        if self.seed is not None:
+            plan = self.plan_cache.load(self.macro_file, self.movement_type, self.max_random_px, seed, self.plan_settings)
+            if plan is not None:
+                return plan
+        compiler = MacroCompiler(self.data, self.movement_type, self.max_random_px, self.backend, self.max_travel,
+                                 self.library)
+        plan = compiler.compile(seed)
+        if self.seed is not None:
+            self.plan_cache.save(plan, self.macro_file, self.movement_type, self.max_random_px, seed, self.plan_settings)
+        return plan
+
+    def run_plan(self):
+        """
+        Plays the macro from a precompiled plan, the plan is compiled once and reused for every play
+        """
+        seed = self.seed if self.seed is not None else random.randrange(2 ** 32)
+        plan = self.get_plan(seed)
+        play_time = plan[-1].time if plan else 0.0
+        self.scheduler.start()
+        base = self.scheduler.deadline
+        for loop in range(self.number_of_plays):
+            for step in plan:
+                base = self.dispatch(step, base) if self.trace is None else self.traced_dispatch(step, base, loop)
+            base += play_time
+        self.report()
+
+    def run_pipeline(self):
+        """
+        Plays the macro whilst a LookaheadPipeline generates the movements of upcoming events in the background
+        """
+        compiler = MacroCompiler(self.data, self.movement_type, self.max_random_px, self.backend, self.max_travel,
+                                 self.library)
+        pipeline = LookaheadPipeline(compiler, self.number_of_plays, self.lookahead)
+        pipeline.start()
+        self.scheduler.start()
+        base = self.scheduler.deadline
+        # Offsets only change when a new play starts, counted for trace records
+        play, last_offset = 0, 0.0
+        try:
+            for offset, steps in pipeline:
+                if offset != last_offset:
+                    play, last_offset = play + 1, offset
+                for step in steps:
+                    if self.trace is None:
+                        base = self.dispatch(step, base + offset) - offset
+                    else:
+                        base = self.traced_dispatch(step, base + offset, play) - offset
+        finally:
+            pipeline.stop()
+        self.report()
+        pipeline.report()
+
+    def dispatch(self, step, base):
+        """
+        Executes a single plan step, base is the perf_counter time the current play started at.
+        Returns base for the following steps, moved earlier when a checkpoint matched before its timeout
+        """
+        start = base + step.time
+        if step.opcode == WAIT_FOR:
+            deadline = start + step.duration
+            return base - (deadline - self.wait_for(step.value, deadline))
+        if step.opcode == MOVE_LIVE:
+            deadline = start + step.duration
+            self.move_for_event(step.value, step.x, step.y, PlaybackScheduler.time_left(deadline), deadline)
+            return base
+
+        self.scheduler.wait_until(start)
+        if step.opcode == MOVE_TO:
+            # A move starting late is shortened so it still ends on time and lateness does not carry over
+            duration = max(0.0, min(step.duration, PlaybackScheduler.time_left(start + step.duration)))
+            self.timed_move(step.x, step.y, duration, step.value)
+        elif step.opcode == MOVE_PATH:
+            self.backend.pause = 0.00
+            self.inject_path(step.points, start + step.duration)
+        else:
+            self.scheduler.mark(start)
+            if step.opcode == KEY_PRESS:
+                self.backend.key_press(step.value)
+            elif step.opcode == KEY_RELEASE:
+                self.backend.key_release(step.value)
+            elif step.opcode == MOUSE_PRESS:
+                self.backend.mouse_press(step.value)
+            elif step.opcode == MOUSE_RELEASE:
+                self.backend.mouse_release(step.value)
+            elif step.opcode == TAP:
+                self.backend.tap(step.value)
+            elif step.opcode == CLICK:
+                self.backend.click(step.value)
+            elif step.opcode == TYPE:
+                self.backend.type_text(step.value)
+        return base
+
+    def traced_dispatch(self, step, base, play):
+        """
+        dispatch recording a trace record for the step
+        """
+        action = STEP_ACTIONS.get(step.opcode, "plan_move")
+        self.trace.begin(play, action)
+        next_base = self.dispatch(step, base)
+        if action == "plan_move":
+            self.trace.end(self.movement_type, base + step.time + step.duration)
+        elif action == "wait_for":
+            self.trace.end("none", base + step.time + step.duration - (base - next_base))
+        else:
+            self.trace.end("none", base + step.time)
+        return next_base
+
+    def inject_path(self, points, deadline):
+        """
+        Moves cursor through points spread evenly over the time left before deadline, the last point lands on the deadline
+        """
+        step = PlaybackScheduler.time_left(deadline) / len(points)
+        if self.injector is not None:
+            self.injector.inject_path(points, time.perf_counter() + step * np.arange(len(points)))
+            return
+        for index, point in enumerate(points):
+            self.backend.move_to(point[0], point[1])
+            self.scheduler.wait_until(deadline - step * (len(points) - index - 1))
+
+    def timed_move(self, x, y, duration, tween=pytweening.linear):
+        """
+        Moves cursor to x, y over duration seconds, through the injector when a frame rate is set
+        """
+        if self.injector is not None:
+            self.injector.inject_move(x, y, duration, tween)
+            return
+        self.backend.pause = 0.00
+        self.backend.move_to(x, y, duration, tween)
+
+    def instant_movement(self, x, y, timer, deadline=None):
         """
         Instant movement function, we take 0.2 seconds of sleep timer for processing overhead to keep us more consistent.
+        With a deadline the scheduler does the waiting so no overhead is needed.
         """
-        pg.PAUSE = 0.00
-        pg.moveTo(x, y)
+        self.backend.pause = 0.00
+        self.backend.move_to(x, y)
+        if deadline is not None:
+            return
         overhead = 0.2
         if timer - overhead > 0:
-            time.sleep(timer - overhead)
+            self.sleep(timer - overhead)
         else:
             pass
 
-    @staticmethod
-    def simple_movement(x, y, timer):
+    def simple_movement(self, x, y, timer, deadline=None):
         """
         Simple movement function, Quick movements are done with minimal travel time.
+        With a deadline the travel takes up to the time left and the scheduler waits out the rest.
         """
-        pg.PAUSE = 0.00
-        if timer > 0.2:
+        self.backend.pause = 0.00
+        if deadline is not None:
+            travel_time = timer if timer < 0.7 else random.uniform(0.3, 0.7)
+            self.timed_move(x, y, max(travel_time, 0.001))
+        elif timer > 0.2:
             if timer < 0.7:
-                pg.moveTo(x, y, (timer - 0.2))
+                self.backend.move_to(x, y, (timer - 0.2))
             else:
                 travel_time = random.uniform(0.3, 0.7)
                 wait_time = timer - travel_time
-                pg.moveTo(x, y, travel_time)
-                time.sleep(wait_time)
+                self.backend.move_to(x, y, travel_time)
+                self.sleep(wait_time)
         else:
-            pg.moveTo(x, y, 0.001)
+            self.backend.move_to(x, y, 0.001)
 
-    @staticmethod
-    def human_movement(x, y, timer):
+    def human_movement(self, x, y, timer, deadline=None):
         """
         Human movement function, uses bezier curve and noise/tween generating classes to achieve movement points.
+        With a deadline the points are paced by the scheduler so the last point lands on the deadline.
+        """
+        if deadline is not None:
+            self.paced_human_movement(x, y, timer, deadline)
+            return
+        if timer > self.max_travel:
+            self.sleep(timer - (self.max_travel - 0.1))
+            timer = self.max_travel
+        number_of_points = math.floor(timer / 0.03)
+
+        if number_of_points > 5:
+            for point in self.trajectory(x, y, number_of_points):
+                self.backend.pause = 0.02
+                self.backend.move_to(point[0], point[1])
+        else:
+            self.backend.move_to(x, y, timer, pytweening.easeOutQuad)
+
+    def trajectory(self, x, y, number_of_points):
+        """
+        Returns points of a human movement from the cursor to x, y, taken from the trajectory library when there is one
+        """
+        start = self.backend.position()
+        if self.library is None:
+            return TrajectoryLibrary.generate(start, (x, y), number_of_points, self.trace)
+        if self.trace is None:
+            return self.library.points(start, (x, y), number_of_points)
+        started = time.perf_counter()
+        points = self.library.points(start, (x, y), number_of_points)
+        self.trace.add("curve", time.perf_counter() - started)
+        return points
+
+    def polyline_movement(self, points, timer, deadline=None):
+        """
+        Moves cursor along a polyline written by MacroOptimizer, its points spread evenly over the timer,
+        against the deadline when there is one
+        """
+        path = MacroCompiler.polyline_path(points, timer)
+        self.backend.pause = 0.00
+        if deadline is not None:
+            self.inject_path(path, deadline)
+            return
+        step = timer / len(path)
+        for point in path:
+            self.sleep(step)
+            self.backend.move_to(point[0], point[1])
+
+    def paced_human_movement(self, x, y, timer, deadline):
+        """
+        Human movement against a deadline, waits until the last max_travel seconds and spreads the tweened points evenly up to it.
         """
-        if timer > 0.7:
-            time.sleep(timer - 0.6)
-            timer = timer - (timer - 0.7)
+        if timer > self.max_travel:
+            self.scheduler.wait_until(deadline - self.max_travel)
+            timer = PlaybackScheduler.time_left(deadline)
         number_of_points = math.floor(timer / 0.03)
 
+        self.backend.pause = 0.00
         if number_of_points > 5:
-            curve = GenerateCurve(x, y)
-            tweened_curve = NoiseAndTween(curve.points, target_points=number_of_points)
-            for point in tweened_curve.tweened_points:
-                pg.PAUSE = 0.02
-                pg.moveTo(point[0], point[1])
+            self.inject_path(self.trajectory(x, y, number_of_points), deadline)
         else:
-            pg.moveTo(x, y, timer, pg.easeOutQuad)
+            self.timed_move(x, y, max(timer, 0.0), pytweening.easeOutQuad)
 
 
-def main(file_path, file_name, movement_type, number_of_plays, max_random_px, fail_safe):
-    r = MacroPlayer(file_path, file_name, movement_type, number_of_plays, max_random_px, fail_safe)
-    r.run()
+def main(file_path, file_name, movement_type, number_of_plays, max_random_px, fail_safe, timing, precompile, seed,
+         plan_cache, lookahead, frame_rate, speed, max_gap, min_gap, trajectory_variants, trajectory_file, trace, hotkeys,
+         start_at, end_at):
+    if hotkeys:
+        # The asyncio player always plays a precompiled plan on absolute deadlines at its own frame rate
+        unsupported = [option for option, given in (("--trace", trace is not None), ("--lookahead", lookahead > 0),
+                                                    ("--timing relative", timing == "relative")) if given]
+        if unsupported:
+            raise ValueError("--hotkeys can not be combined with {}.".format(", ".join(unsupported)))
+    timing = timing if timing is not None else "relative"
+    r = MacroPlayer(file_path, file_name, movement_type, number_of_plays, max_random_px, fail_safe, timing, precompile,
+                    seed, plan_cache, lookahead, frame_rate=frame_rate, speed=speed, max_gap=max_gap, min_gap=min_gap,
+                    trajectory_variants=trajectory_variants, trajectory_file=trajectory_file, trace=trace,
+                    start_at=start_at, end_at=end_at)
+    if hotkeys:
+        # Imported here as AsyncPlayer builds on MacroPlayer
+        from AsyncPlayer import AsyncPlayer, MacroTimeline
+        AsyncPlayer([MacroTimeline(r, frame_rate=frame_rate if frame_rate > 0 else 125)]).run()
+    else:
+        r.run()
 
 
 if __name__ == "__main__":
@@ -169,7 +573,28 @@ if __name__ == "__main__":
     argParser.add_argument("--max_random_px", type=str, required=False, help="String - File name for saved macro input")
     argParser.add_argument('--fail_safe', action='store_true', help="Flag - Keeps pyautogui fail safes")
     argParser.add_argument('--no_fail_safe', dest='fail_safe', action='store_false', help="Flag - Turns off pyautogui fail safes (NOT RECOMMENDED)")
-    argParser.set_defaults(movement_type='human',number_of_plays=1, max_random_px=10, fail_safe=True)
+    argParser.add_argument("--timing", type=str, required=False, help="String - Determine how timers are waited on must be 'relative' or 'absolute', defaults to 'relative'")
+    argParser.add_argument('--precompile', action='store_true', help="Flag - Compiles all movements before playback starts, uses absolute timing")
+    argParser.add_argument("--seed", type=int, required=False, help="Integer - Seed for all playback randomness so runs are reproducible, precompiled plans with a seed are cached")
+    argParser.add_argument("--plan_cache", type=str, required=False, help="String - Directory compiled plans are cached in")
+    argParser.add_argument("--lookahead", type=int, required=False, help="Integer - Number of events to generate movements for ahead of playback, 0 turns it off")
+    argParser.add_argument("--frame_rate", type=int, required=False, help="Integer - Frames per second timed movements are injected at, eg 125, 250 or 500, 0 uses pyautogui moveTo")
+    argParser.add_argument("--speed", type=float, required=False, help="Float - Playback speed factor, 2 plays twice as fast")
+    argParser.add_argument("--max_gap", type=float, required=False, help="Float - Max seconds waited between events, 0 turns it off")
+    argParser.add_argument("--min_gap", type=float, required=False, help="Float - Min seconds waited between events, 0 turns it off")
+    argParser.add_argument("--trajectory_variants", type=int, required=False, help="Integer - Number of cached variants of each human movement, 0 generates every movement")
+    argParser.add_argument("--trajectory_file", type=str, required=False, help="String - File the human movement cache is saved to and loaded from")
+    argParser.add_argument("--trace", type=str, required=False, help="String - Trace file per event timings are written to, a timing summary is printed after playback")
+    argParser.add_argument('--hotkeys', action='store_true', help="Flag - Plays with the asyncio player, F9 pauses and resumes, F10 skips the current wait and F12 aborts. Can not be combined with --trace, --lookahead or --timing relative")
+    argParser.add_argument("--start_at", type=str, required=False, help="String - Position to play from, seconds, '[[h:]m:]s' or '#N' for event N, held keys and the cursor are restored")
+    argParser.add_argument("--end_at", type=str, required=False, help="String - Position to stop playing at, seconds, '[[h:]m:]s' or '#N' for event N")
+    argParser.set_defaults(movement_type='human',number_of_plays=1, max_random_px=10, fail_safe=True, timing=None,
+                           precompile=False, seed=None, plan_cache=None, lookahead=0, frame_rate=0, speed=1.0, max_gap=0.0,
+                           min_gap=0.0, trajectory_variants=0, trajectory_file=None, trace=None, hotkeys=False,
+                           start_at=None, end_at=None)
     args = argParser.parse_args()
 
-    main(args.save_path, args.save_file, args.movement_type,args.number_of_plays, args.max_random_px, args.fail_safe)
+    main(args.save_path, args.save_file, args.movement_type,args.number_of_plays, args.max_random_px, args.fail_safe, args.timing,
+         args.precompile, args.seed, args.plan_cache, args.lookahead,
+         args.frame_rate, args.speed, args.max_gap, args.min_gap, args.trajectory_variants, args.trajectory_file,
+         args.trace, args.hotkeys, args.start_at, args.end_at)
@@ -0,0 +1,82 @@
+import json
+from BinaryMacro import BinaryMacro
+
+
+class MacroReader:
+    def __init__(self, path):
+        """
+        Reads macro events from a save file without loading the whole file, iterating gives each event dict in order.
+        JSON Lines files written by MacroWriter, older files holding a single JSON array and binary files
+        written by BinaryMacro are supported, the format is detected from the start of the file.
+        --------
+        Args:
+        --path: String, path to macro save file
+        """
+        self.path = path
+        self.format = self.detect_format(path)
+
+    @staticmethod
+    def detect_format(path):
+        """
+        Returns "binary" for binary macro files, "json" if file holds a JSON array, otherwise "jsonl"
+        """
+        if BinaryMacro.is_binary(path):
+            return "binary"
+        with open(path, "r") as macro_file:
+            while True:
+                char = macro_file.read(1)
+                if char == "" or not char.isspace():
+                    break
+        return "json" if char == "[" else "jsonl"
+
+    def __iter__(self):
+        """
+        Yields events one at a time, JSON Lines files are parsed lazily line by line and binary files read through mmap
+        """
+        if self.format == "binary":
+            with BinaryMacro(self.path) as binary_macro:
+                yield from binary_macro.iter_events()
+            return
+        with open(self.path, "r") as macro_file:
+            if self.format == "json":
+                yield from json.load(macro_file)
+                return
+            for line in macro_file:
+                if not line.strip():
+                    continue
+                # A recording killed mid write can leave a partial last line, which is skipped
+                if not line.endswith("\n"):
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        pass
+                    return
+                yield json.loads(line)
+
+    def iter_from(self, offset=None):
+        """
+        Yields (byte offset, event) of each event from the one starting at byte offset, the first event when None.
+        Only JSON Lines and binary files can be read from an offset, a JSON array has to be parsed whole
+        """
+        if self.format == "json":
+            raise ValueError("{} holds a single JSON array, convert it with ConvertMacro.py to read it from an offset".format(self.path))
+        if self.format == "binary":
+            with BinaryMacro(self.path) as binary_macro:
+                yield from binary_macro.iter_offsets(offset)
+            return
+        offset = offset or 0
+        with open(self.path, "rb") as macro_file:
+            macro_file.seek(offset)
+            for line in macro_file:
+                start = offset
+                offset += len(line)
+                if not line.strip():
+                    continue
+                # Same as __iter__, a partial last line left by a killed recording is skipped
+                if not line.endswith(b"\n"):
+                    try:
+                        yield start, json.loads(line)
+                    except json.JSONDecodeError:
+                        pass
+                    return
+                yield start, json.loads(line)
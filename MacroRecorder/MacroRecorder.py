@@ -1,15 +1,29 @@
+import time
 import argparse
 import keyboard
-import json
-from SimpleTimer import SimpleTimer
+from EventCapture import EventCapture
+from MacroWriter import MacroWriter
+from PathSimplifier import PathSimplifier
+from MacroCatalog import MacroCatalog
+from BinaryMacro import ACTIONS
+from ScreenCheckpoint import ScreenCheckpoint
 from pynput import mouse
 from pynput import keyboard
 from pynput.mouse import Listener as MouseListener
 from pynput.keyboard import Listener as KeyboardListener
 
+# Event codes pushed by the listener callbacks
+KEY_PRESS = 0
+KEY_RELEASE = 1
+MOUSE_PRESS = 2
+MOUSE_RELEASE = 3
+MOUSE_MOVE = 4
+CHECKPOINT = 5
+
 
 class MacroRecorder:
-    def __init__(self, save_path, save_file, mouse_movement=False):
+    def __init__(self, save_path, save_file, mouse_movement=False, flush_events=256, flush_interval=1.0, fsync="batch",
+                 path_tolerance=2.0, time_tolerance=0.05, checkpoint_key="f8", checkpoint_size=32, catalog=True):
         """
         Class records macros on a windows PC, both keyboard and mouse inputs.
         Init variables, default list is empty and mouse movements are not recorded by default
@@ -19,11 +33,33 @@ class MacroRecorder:
         --save_path: String, path to directory where output will be saved
         --save_file: String, file name of save file
         --mouse_movement: Boolean, Determines if we record mouse movements when recording. Default is False/Off
+        --flush_events: Int, events are streamed to the save file in batches of this size
+        --flush_interval: Float, max seconds an event waits before being written to the save file
+        --fsync: String, when written events are forced to disk. Values are, "batch", "close", "never"
+        --path_tolerance: Float, recorded mouse movements are simplified to stay within this many pixels of the raw path, 0 keeps every movement
+        --time_tolerance: Float, simplified mouse movements stay within this many seconds of the raw path timing
+        --checkpoint_key: String, name of the pynput Key that records a "wait_for" checkpoint of the screen around the cursor,
+            playback waits for that region to look the same instead of the recorded wait before it
+        --checkpoint_size: Int, width and height in pixels of checkpoint regions, at most 64
+        --catalog: Boolean, adds the saved macro to the MacroCatalog of save_path so it can be found by its statistics
         """
-        self.macro_json_list = []
+        if not hasattr(keyboard.Key, checkpoint_key):
+            raise ValueError("checkpoint_key must be a pynput Key name such as 'f8'.")
+        # Only the last event, to skip held key repeats, and running counts for the summary on save are kept in memory,
+        # the recording itself is streamed to the save file
+        self.last_json = None
+        self.action_counts = dict.fromkeys(ACTIONS, 0)
+        self.bounding_box = None
         self.save_path = save_path
         self.save_file = save_file
         self.mouse_movement = mouse_movement
+        self.flush_events = flush_events
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.simplifier = PathSimplifier(path_tolerance, time_tolerance)
+        self.checkpoint_key = getattr(keyboard.Key, checkpoint_key)
+        self.checkpoint_size = checkpoint_size
+        self.catalog = catalog
 
     def __init_controller(self):
         """
@@ -31,12 +67,23 @@ class MacroRecorder:
         """
         self.mouse_controller = mouse.Controller()
 
-    def __init_timer(self):
+    def __init_writer(self):
+        """
+        Creates and starts writer streaming events to the save file
+        """
+        self.writer = MacroWriter(self.save_path + '/{}.txt'.format(self.save_file), flush_events=self.flush_events,
+                                  flush_interval=self.flush_interval, fsync=self.fsync)
+        self.writer.start()
+
+    def __init_capture(self):
         """
-        Starts timer
+        Creates and starts worker thread processing events pushed by the listener callbacks
         """
-        self.timer = SimpleTimer()
-        self.timer.start()
+        self.capture = EventCapture(self.process_event)
+        # Events are saved with their time in ns from here at full precision, deltas between them are only derived
+        # when exporting so rounding never adds up over a recording
+        self.start_ns = time.perf_counter_ns()
+        self.capture.start()
 
     def __init_listener(self):
         """
@@ -52,22 +99,84 @@ class MacroRecorder:
         self.k_listener.join()
         self.m_listener.join()
 
+    # Listener callbacks run on the pynput listener threads, slow callbacks delay or drop OS input events,
+    # so they only push a timestamp, event code, key/button and the cursor position at the time to the capture worker.
     def on_press(self, key):
         """
-        Logic for dealing with keyboard key presses
+        Keyboard key press callback
         """
-        # Exit for program        
+        # Exit for program
         if key == keyboard.Key.esc:
             self.quit()
             return
+        x_pos, y_pos = self.mouse_controller.position
+        if key == self.checkpoint_key:
+            self.capture.push((time.perf_counter_ns(), CHECKPOINT, None, x_pos, y_pos))
+            return
+        self.capture.push((time.perf_counter_ns(), KEY_PRESS, key, x_pos, y_pos))
 
-        # Assign local variables
-        last_json = None
-        same_last_action = False
+    def on_release(self, key):
+        """
+        Keyboard key release callback
+        """
+        if key == self.checkpoint_key:
+            return
+        x_pos, y_pos = self.mouse_controller.position
+        self.capture.push((time.perf_counter_ns(), KEY_RELEASE, key, x_pos, y_pos))
 
-        # If there has been atleast 1 previous action, retrieve it
-        if self.macro_json_list:
-            last_json = self.macro_json_list[-1]
+    def on_click(self, x, y, button, pressed):
+        """
+        Mouse button press and release callback
+        """
+        self.capture.push((time.perf_counter_ns(), MOUSE_PRESS if pressed else MOUSE_RELEASE, button, x, y))
+
+    def on_move(self, x, y):
+        """
+        Mouse movement callback, only registered if mouse_movement is set to True
+        """
+        self.capture.push((time.perf_counter_ns(), MOUSE_MOVE, None, x, y))
+
+    def process_event(self, event):
+        """
+        Runs on the capture worker thread, passes pushed event on to the logic for its event code
+        """
+        timestamp, code, value, x, y = event
+        # Buffered movements happened before this event so are recorded first
+        if code != MOUSE_MOVE:
+            self.record_moves(self.simplifier.flush())
+        if code == KEY_PRESS:
+            self.process_press(value, x, y, timestamp)
+        elif code == KEY_RELEASE:
+            self.process_release(value, x, y, timestamp)
+        elif code == MOUSE_MOVE:
+            self.process_move(x, y, timestamp)
+        elif code == CHECKPOINT:
+            self.process_checkpoint(x, y, timestamp)
+        else:
+            self.process_click(x, y, value, code == MOUSE_PRESS, timestamp)
+
+    def record(self, json_obj, timestamp):
+        """
+        Sets the event's "time_ns", the perf_counter_ns timestamp as ns from the start of recording, then passes it
+        to the writer and adds it to the counts summarised on save
+        """
+        # Timestamps are taken on the listener threads, an event can be pushed just after a later one
+        time_ns = max(timestamp - self.start_ns, self.last_json["time_ns"] if self.last_json is not None else 0)
+        json_obj["time_ns"] = time_ns
+        self.last_json = json_obj
+        self.action_counts[json_obj["action"]] += 1
+        x, y = json_obj["x"], json_obj["y"]
+        box = self.bounding_box
+        self.bounding_box = (x, y, x, y) if box is None else (min(box[0], x), min(box[1], y), max(box[2], x), max(box[3], y))
+        self.writer.write(json_obj)
+
+    def process_press(self, key, x_pos, y_pos, timestamp):
+        """
+        Logic for dealing with keyboard key presses
+        """
+        # Assign local variables, last_json is None until there has been atleast 1 previous action
+        last_json = self.last_json
+        same_last_action = False
 
         # Keys which have "char" attr are dealt with here, eg letters and numbers
         if hasattr(key, "char"):
@@ -80,21 +189,16 @@ class MacroRecorder:
                 if last_action == "pressed_key" and last_key == key.char:
                     same_last_action = True
 
-            # If the last action is different, we record newest action.			
+            # If the last action is different, we record newest action.
             if same_last_action is False:
-                x_pos, y_pos = self.mouse_controller.position
-                timer = round(self.timer.current_time(), 2)
-                self.timer.stop()
                 number_rep = ord(key.char)
                 if number_rep < 27:
-                    json_obj = {"action": "pressed_key", "key": chr(number_rep + 96), "x": x_pos, "y": y_pos,
-                                "timer": timer}
+                    json_obj = {"action": "pressed_key", "key": chr(number_rep + 96), "x": x_pos, "y": y_pos}
                 else:
-                    json_obj = {"action": "pressed_key", "key": key.char, "x": x_pos, "y": y_pos, "timer": timer}
-                self.macro_json_list.append(json_obj)
-                self.__init_timer()
+                    json_obj = {"action": "pressed_key", "key": key.char, "x": x_pos, "y": y_pos}
+                self.record(json_obj, timestamp)
 
-        # Keys which have "name" attr are dealt with here, eg special keys such as ctrl, alt, shift and space. Otherwise same as "char" above	
+        # Keys which have "name" attr are dealt with here, eg special keys such as ctrl, alt, shift and space. Otherwise same as "char" above
         if hasattr(key, "name"):
             # If we are holding down a key the press will be repeatedly heard by listener, we can skip such cases as we record button releases
             if (not (last_json is None)) and ("action" in last_json) and ("key" in last_json):
@@ -105,67 +209,60 @@ class MacroRecorder:
                 if last_action == "pressed_key" and last_key == str(key):
                     same_last_action = True
 
-            # If the last action is different, we record newest action.			
+            # If the last action is different, we record newest action.
             if same_last_action is False:
-                x_pos, y_pos = self.mouse_controller.position
-                timer = round(self.timer.current_time(), 2)
-                self.timer.stop()
-                json_obj = {"action": "pressed_key", "key": str(key), "x": x_pos, "y": y_pos, "timer": timer}
-                self.macro_json_list.append(json_obj)
-                self.__init_timer()
+                json_obj = {"action": "pressed_key", "key": str(key), "x": x_pos, "y": y_pos}
+                self.record(json_obj, timestamp)
 
-    def on_release(self, key):
+    def process_release(self, key, x_pos, y_pos, timestamp):
         """
         Logic for dealing with keyboard key releases
         """
         # Deals with release of "char" keys, such as letters and numbers
         if hasattr(key, "char"):
-            x_pos, y_pos = self.mouse_controller.position
-            current_time = round(self.timer.current_time(), 2)
-            self.timer.stop()
             number_rep = ord(key.char)
             if number_rep < 27:
-                json_obj = {"action": "released_key", "key": chr(number_rep + 96), "x": x_pos, "y": y_pos,
-                            "timer": current_time}
+                json_obj = {"action": "released_key", "key": chr(number_rep + 96), "x": x_pos, "y": y_pos}
             else:
-                json_obj = {"action": "released_key", "key": key.char, "x": x_pos, "y": y_pos, "timer": current_time}
-            self.macro_json_list.append(json_obj)
-            self.__init_timer()
+                json_obj = {"action": "released_key", "key": key.char, "x": x_pos, "y": y_pos}
+            self.record(json_obj, timestamp)
 
         # Deals with release of "name" keys, such as ctrl, alt, shift and space. Otherwise same as "char" above
         if hasattr(key, "name"):
-            x_pos, y_pos = self.mouse_controller.position
-            current_time = round(self.timer.current_time(), 2)
-            self.timer.stop()
-            json_obj = {"action": "released_key", "key": str(key), "x": x_pos, "y": y_pos, "timer": current_time}
-            self.macro_json_list.append(json_obj)
-            self.__init_timer()
+            json_obj = {"action": "released_key", "key": str(key), "x": x_pos, "y": y_pos}
+            self.record(json_obj, timestamp)
 
-    def on_click(self, x, y, button, pressed):
+    def process_click(self, x, y, button, pressed, timestamp):
         """
         Logic for dealing with mouse button presses and releases
         """
-        current_time = round(self.timer.current_time(), 2)
-        self.timer.stop()
-        json_obj = {"action": "pressed" if pressed else "released", "button": str(button), "x": x, "y": y,
-                    "timer": current_time}
-        self.macro_json_list.append(json_obj)
-        self.__init_timer()
+        json_obj = {"action": "pressed" if pressed else "released", "button": str(button), "x": x, "y": y}
+        self.record(json_obj, timestamp)
 
-    def on_move(self, x, y):
+    def process_move(self, x, y, timestamp):
         """
         Logic for dealing with mouse movements, only recorded if mouse_movement is set to True
         """
         if self.mouse_movement:
-            current_time = round(self.timer.current_time(), 2)
-            # We only record mouse movements every 0.1 seconds to help prevent massive recording files
-            if current_time > 0.1:
-                self.timer.stop()
-                json_obj = {"action": "moved", "x": x, "y": y, "timer": current_time}
-                self.macro_json_list.append(json_obj)
-                self.__init_timer()
-            else:
-                pass
+            # Movements are simplified rather than throttled to help prevent massive recording files
+            self.record_moves(self.simplifier.add(x, y, timestamp))
+
+    def process_checkpoint(self, x_pos, y_pos, timestamp):
+        """
+        Captures the screen region around the cursor as a "wait_for" checkpoint
+        """
+        checkpoint = ScreenCheckpoint.capture(x_pos, y_pos, self.checkpoint_size)
+        json_obj = {"action": "wait_for", "checkpoint": checkpoint.to_dict(), "x": x_pos, "y": y_pos}
+        self.record(json_obj, timestamp)
+        print("Checkpoint recorded at {}".format(checkpoint.region))
+
+    def record_moves(self, moves):
+        """
+        Records the (x, y, timestamp) movements kept by the path simplifier
+        """
+        for x, y, timestamp in moves:
+            json_obj = {"action": "moved", "x": x, "y": y}
+            self.record(json_obj, timestamp)
 
     def run(self):
         """
@@ -173,33 +270,55 @@ class MacroRecorder:
         """
         # Mouse Controller object
         self.__init_controller()
-        # Create timer object and start timer
-        self.__init_timer()
+        # Writer streaming events to save file
+        self.__init_writer()
+        # Start worker thread processing captured events
+        self.__init_capture()
         # Set up, start and join listeners for Keyboard and Mouse inputs
         self.__init_listener()
 
     def quit(self):
         """
-        Stops recording and any active timers
+        Stops recording, events captured before Esc are processed before saving
         """
-        if hasattr(self, "m_listener") and hasattr(self, "k_listener") and hasattr(self, "timer"):
+        if hasattr(self, "m_listener") and hasattr(self, "k_listener") and hasattr(self, "capture"):
+            self.capture.stop()
+            self.record_moves(self.simplifier.flush())
             self.save()
             self.m_listener.stop()
             self.k_listener.stop()
-            self.timer.stop()
         else:
             raise Exception("Recorder is not currently running, used the .run() method to begin recording")
 
     def save(self):
         """
-        Saves Json file with keystokes/button presses
+        Writes remaining keystokes/button presses and closes the JSON Lines save file
+        """
+        self.writer.close()
+        print("Recorded {}".format(self.summary()))
+        if self.catalog:
+            # The recording is not kept in memory, the catalog reads the saved file back once
+            catalog = MacroCatalog(self.save_path)
+            catalog.update('{}.txt'.format(self.save_file))
+            catalog.close()
+        if self.mouse_movement:
+            self.simplifier.report()
+
+
+    def summary(self):
+        """
+        Returns one line description of the recorded events, in the same form as MacroEvents.summary
         """
-        with open(self.save_path + '/{}.txt'.format(self.save_file), 'w+') as outfile:
-            json.dump(self.macro_json_list, outfile)
+        count = sum(self.action_counts.values())
+        duration = self.last_json["time_ns"] / 1e9 if self.last_json is not None else 0.0
+        counts = ", ".join("{} {}".format(count, action) for action, count in self.action_counts.items() if count)
+        return "{} events over {:.2f} s ({}), bounding box {}".format(count, duration, counts or "none", self.bounding_box)
 
 
-def main(file_path, file_name, mouse_movement):
-    r = MacroRecorder(file_path, file_name, mouse_movement)
+def main(file_path, file_name, mouse_movement, flush_events, flush_interval, fsync, path_tolerance, time_tolerance,
+         checkpoint_key, checkpoint_size, catalog):
+    r = MacroRecorder(file_path, file_name, mouse_movement, flush_events, flush_interval, fsync, path_tolerance,
+                      time_tolerance, checkpoint_key, checkpoint_size, catalog)
     r.run()
 
 
@@ -211,7 +330,20 @@ if __name__ == "__main__":
                            help="Flag - Allows individual mouse movements to be recorded")
     argParser.add_argument('--no_mouse_movement', dest='mouse_movement', action='store_false',
                            help="Flag - Does not record mouse movements, mouse still moves on key/mouse presses/releases (Recommended option)")
-    argParser.set_defaults(mouse_movement=False)
+    argParser.add_argument("--flush_events", type=int, required=False, help="Integer - Number of events written to save file at once")
+    argParser.add_argument("--flush_interval", type=float, required=False, help="Float - Max seconds before recorded events are written to save file")
+    argParser.add_argument("--fsync", type=str, required=False, help="String - When writes are forced to disk must be 'batch', 'close' or 'never'")
+    argParser.add_argument("--path_tolerance", type=float, required=False, help="Float - Max pixels simplified mouse movements can stray from the recorded path, 0 keeps every movement")
+    argParser.add_argument("--time_tolerance", type=float, required=False, help="Float - Max seconds simplified mouse movements can stray from the recorded timing")
+    argParser.add_argument("--checkpoint_key", type=str, required=False, help="String - Key that records a screen checkpoint playback waits for, eg 'f8'")
+    argParser.add_argument("--checkpoint_size", type=int, required=False, help="Integer - Width and height in pixels of checkpoint screen regions, max 64")
+    argParser.add_argument('--catalog', action='store_true',
+                           help="Flag - Adds the saved macro to the catalog of the save directory (Default)")
+    argParser.add_argument('--no_catalog', dest='catalog', action='store_false',
+                           help="Flag - Does not add the saved macro to the catalog of the save directory")
+    argParser.set_defaults(mouse_movement=False, flush_events=256, flush_interval=1.0, fsync="batch", path_tolerance=2.0,
+                           time_tolerance=0.05, checkpoint_key="f8", checkpoint_size=32, catalog=True)
     args = argParser.parse_args()
 
-    main(args.save_path, args.save_file, args.mouse_movement)
\ No newline at end of file
+    main(args.save_path, args.save_file, args.mouse_movement, args.flush_events, args.flush_interval, args.fsync,
+         args.path_tolerance, args.time_tolerance, args.checkpoint_key, args.checkpoint_size, args.catalog)
\ No newline at end of file
@@ -0,0 +1,213 @@
+import io
+import os
+import time
+import shutil
+import argparse
+import subprocess
+import contextlib
+import multiprocessing
+from collections import namedtuple
+
+# display: X display the job plays on, eg ":99", None for the headless RecordingBackend
+RunnerJob = namedtuple("RunnerJob", ["macro_file", "display", "plays"])
+
+
+def run_job(job, movement_type="instant", timing="absolute", max_random_px=10):
+    """
+    Plays one job in the current process and returns dict of its results. Runs in a fresh worker process,
+    DISPLAY is set before MacroPlayer is imported so pyautogui and pynput bind to the job's display.
+    """
+    if job.display is not None:
+        os.environ["DISPLAY"] = job.display
+    from MacroPlayer import MacroPlayer
+    from OutputBackend import RecordingBackend
+    result = {"macro_file": job.macro_file, "display": job.display, "plays": job.plays, "events": 0, "duration": 0.0,
+              "events_per_second": 0.0, "error": None, "started": time.time()}
+    start = time.perf_counter()
+    try:
+        backend = RecordingBackend(simulate_duration=False) if job.display is None else None
+        save_path, save_file = os.path.split(job.macro_file)
+        player = MacroPlayer(save_path, save_file, movement_type, job.plays, max_random_px, timing=timing,
+                             backend=backend)
+        with contextlib.redirect_stdout(io.StringIO()):
+            player.run()
+        result["events"] = len(player.data) * job.plays
+    except Exception as error:
+        result["error"] = "{}: {}".format(type(error).__name__, error)
+    result["duration"] = time.perf_counter() - start
+    result["finished"] = time.time()
+    if result["duration"] > 0:
+        result["events_per_second"] = result["events"] / result["duration"]
+    return result
+
+
+def run_display_jobs(jobs, movement_type="instant", timing="absolute", max_random_px=10):
+    """
+    Plays jobs that share one X display one after another in the current process and returns list of their results,
+    a display has a single cursor and keyboard focus so only one macro can play on it at a time
+    """
+    return [run_job(job, movement_type, timing, max_random_px) for job in jobs]
+
+
+class XvfbLauncher:
+    def __init__(self, count, first_display=99, screen="1920x1080x24", timeout=10.0):
+        """
+        Starts count local Xvfb virtual displays so macros can be played without real monitors.
+        Use as a with block, or call start() and stop(). self.displays holds the display names, eg ":99".
+        --------
+        Args:
+        --count: Int, number of displays to start
+        --first_display: Int, number of the first display, the rest follow on from it
+        --screen: String, WIDTHxHEIGHTxDEPTH of each display
+        --timeout: Float, max seconds to wait for a display to accept connections
+        """
+        self.count = count
+        self.first_display = first_display
+        self.screen = screen
+        self.timeout = timeout
+        self.displays = []
+        self.processes = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """
+        Starts the displays and waits until each one's X socket exists
+        """
+        if shutil.which("Xvfb") is None:
+            raise Exception("Xvfb was not found, install it (eg apt install xvfb) to launch virtual displays")
+        for number in range(self.first_display, self.first_display + self.count):
+            display = ":{}".format(number)
+            self.processes.append(subprocess.Popen(["Xvfb", display, "-screen", "0", self.screen, "-nolisten", "tcp"],
+                                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            self.displays.append(display)
+        deadline = time.perf_counter() + self.timeout
+        for number, process in zip(range(self.first_display, self.first_display + self.count), self.processes):
+            while not os.path.exists("/tmp/.X11-unix/X{}".format(number)):
+                if process.poll() is not None or time.perf_counter() > deadline:
+                    self.stop()
+                    raise Exception("Xvfb display :{} failed to start".format(number))
+                time.sleep(0.01)
+        return self
+
+    def stop(self):
+        """
+        Terminates all started displays
+        """
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait()
+        self.processes = []
+        self.displays = []
+
+
+class MacroRunner:
+    def __init__(self, jobs, processes=None, movement_type="instant", timing="absolute", max_random_px=10):
+        """
+        Plays a list of RunnerJobs in parallel with a process pool. Jobs are grouped by X display and each display gets
+        one worker playing its jobs in order, so two macros never share a cursor. Headless jobs each get their own worker.
+        Workers are never reused, pyautogui and pynput bind to a display when imported.
+        --------
+        Args:
+        --jobs: List, RunnerJobs to play
+        --processes: Int, number of worker processes, defaults to one per display, or the number of cores when any job
+            is headless. More processes than displays is rejected unless some jobs are headless
+        --movement_type: String, "instant", "simple" or "human", see MacroPlayer
+        --timing: String, "relative" or "absolute", see MacroPlayer
+        --max_random_px: Int, see MacroPlayer
+        """
+        self.jobs = list(jobs)
+        displays = {job.display for job in self.jobs if job.display is not None}
+        headless = any(job.display is None for job in self.jobs)
+        if processes is None:
+            processes = os.cpu_count() if headless or not displays else len(displays)
+        elif displays and not headless and processes > len(displays):
+            raise ValueError("processes must be at most the number of displays, {}, as each display plays one job at a "
+                             "time.".format(len(displays)))
+        self.processes = processes
+        self.movement_type = movement_type
+        self.timing = timing
+        self.max_random_px = max_random_px
+        self.results = []
+        self.wall = 0.0
+
+    def run(self):
+        """
+        Plays all jobs and returns list of result dicts in job order
+        """
+        context = multiprocessing.get_context("spawn")
+        settings = (self.movement_type, self.timing, self.max_random_px)
+        groups = {}
+        for index, job in enumerate(self.jobs):
+            # Headless jobs need no display so each is its own group
+            groups.setdefault(job.display if job.display is not None else ("headless", index), []).append(index)
+        results = [None] * len(self.jobs)
+        start = time.perf_counter()
+        with context.Pool(self.processes, maxtasksperchild=1) as pool:
+            pending = [(indexes, pool.apply_async(run_display_jobs, ([self.jobs[index] for index in indexes],) + settings))
+                       for indexes in groups.values()]
+            for indexes, group_results in pending:
+                for index, result in zip(indexes, group_results.get()):
+                    results[index] = result
+        self.wall = time.perf_counter() - start
+        self.results = results
+        return self.results
+
+    def report(self):
+        """
+        Prints duration, events per second and errors of every job and the totals
+        """
+        print("{:>30} {:>9} {:>6} {:>9} {:>13} {:>11}  {}".format("macro", "display", "plays", "events", "duration (s)",
+                                                                  "events/s", "error"))
+        for result in self.results:
+            print("{:>30} {:>9} {:>6} {:>9} {:>13.3f} {:>11.0f}  {}".format(
+                os.path.basename(result["macro_file"])[-30:], str(result["display"]), result["plays"], result["events"],
+                result["duration"], result["events_per_second"], result["error"] or ""))
+        events = sum(result["events"] for result in self.results)
+        failures = sum(1 for result in self.results if result["error"] is not None)
+        print("{} jobs on {} processes, {} failed, {} events in {:.3f} s, {:.0f} events/s overall".format(
+            len(self.results), self.processes, failures, events, self.wall, events / self.wall if self.wall > 0 else 0.0))
+
+
+def main(macro_files, displays, xvfb, plays, processes, movement_type, timing, headless):
+    launcher = None
+    if headless:
+        displays = [None]
+    elif xvfb > 0:
+        launcher = XvfbLauncher(xvfb).start()
+        displays = launcher.displays
+    elif not displays:
+        displays = [os.environ.get("DISPLAY", ":0")]
+    try:
+        # Macros are assigned to displays in turn, each display plays its macros one after another
+        jobs = [RunnerJob(os.path.abspath(macro_file), displays[index % len(displays)], plays)
+                for index, macro_file in enumerate(macro_files)]
+        runner = MacroRunner(jobs, processes, movement_type, timing)
+        runner.run()
+        runner.report()
+    finally:
+        if launcher is not None:
+            launcher.stop()
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("--macro_file", type=str, nargs="+", required=True, help="String - Paths of macro files to play, one job each")
+    argParser.add_argument("--displays", type=str, nargs="+", required=False, help="String - X displays jobs are shared between, eg ':99' ':100'")
+    argParser.add_argument("--xvfb", type=int, required=False, help="Integer - Launches this many local Xvfb displays and shares jobs between them")
+    argParser.add_argument("--number_of_plays", type=int, required=False, help="Integer - Number of times each job plays its macro")
+    argParser.add_argument("--processes", type=int, required=False, help="Integer - Number of worker processes, defaults to one per display and can not be more unless headless")
+    argParser.add_argument("--movement_type", type=str, required=False, help="String - Determine mouse movement type must be 'instant','simple' or 'human'")
+    argParser.add_argument("--timing", type=str, required=False, help="String - Determine how timers are waited on must be 'relative' or 'absolute'")
+    argParser.add_argument('--headless', action='store_true', help="Flag - Plays through the headless recording backend, no display needed")
+    argParser.set_defaults(displays=None, xvfb=0, number_of_plays=1, processes=None, movement_type='instant',
+                           timing='absolute', headless=False)
+    args = argParser.parse_args()
+
+    main(args.macro_file, args.displays, args.xvfb, args.number_of_plays, args.processes, args.movement_type, args.timing,
+         args.headless)
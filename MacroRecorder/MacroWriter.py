@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import queue
+import threading
+
+
+class MacroWriter:
+    def __init__(self, path, queue_size=10000, flush_events=256, flush_interval=1.0, fsync="batch"):
+        """
+        Streams macro events to a JSON Lines file from a background thread, one event per line.
+        Events are written in batches once flush_events have queued or flush_interval seconds have passed,
+        so a crash or kill only loses the last unflushed batch.
+        --------
+        Args:
+        --path: String, file events are written to, overwritten if it exists
+        --queue_size: Int, max events waiting to be written, bounds memory if the disk falls behind
+        --flush_events: Int, number of events that triggers a write
+        --flush_interval: Float, max seconds an event waits before being written
+        --fsync: String, when written batches are forced to disk. Values are, "batch", "close", "never"
+        """
+        valid_fsync = {"batch", "close", "never"}
+        if fsync not in valid_fsync:
+            raise ValueError("fsync must be one of %r." % valid_fsync)
+
+        self.path = path
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.flush_events = max(1, flush_events)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.events_written = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.file = None
+
+    def start(self):
+        """
+        Opens output file and starts writer thread
+        """
+        self.file = open(self.path, "w+")
+        self.thread.start()
+
+    def write(self, event):
+        """
+        Queues event to be written, blocks only if the queue is full
+        """
+        self.queue.put(event)
+
+    def run(self):
+        """
+        Writer thread, collects events into batches and writes them until close() queues None
+        """
+        batch = []
+        last_flush = time.perf_counter()
+        running = True
+        while running:
+            timeout = max(0.0, self.flush_interval - (time.perf_counter() - last_flush))
+            try:
+                event = self.queue.get(timeout=timeout)
+                if event is None:
+                    running = False
+                else:
+                    batch.append(event)
+            except queue.Empty:
+                pass
+
+            if batch and (not running or len(batch) >= self.flush_events or
+                          time.perf_counter() - last_flush >= self.flush_interval):
+                self.flush(batch)
+                batch = []
+            if not batch:
+                last_flush = time.perf_counter()
+
+    def flush(self, batch):
+        """
+        Writes batch of events as lines in one call
+        """
+        self.file.write("".join(json.dumps(event) + "\n" for event in batch))
+        self.file.flush()
+        if self.fsync == "batch":
+            os.fsync(self.file.fileno())
+        self.events_written += len(batch)
+
+    def close(self):
+        """
+        Writes remaining events and closes output file
+        """
+        self.queue.put(None)
+        self.thread.join()
+        self.file.flush()
+        if self.fsync != "never":
+            os.fsync(self.file.fileno())
+        self.file.close()
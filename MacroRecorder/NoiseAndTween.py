@@ -5,15 +5,22 @@ import random
 
 class NoiseAndTween:
 
-    def __init__(self, points, mean=15, std=7, frequency=0.7, target_points=10):
+    def __init__(self, points=None, mean=15, std=7, frequency=0.7, target_points=10, curve=None):
         """
 		Class adds noise and fixes the number of coordinates in a list
+		If a GenerateCurve made with dense=False is passed as curve, the tween is mapped straight to curve progress
+		so only the target points are evaluated and noised, points is not needed in that case
 		"""
         self.mean = mean
         self.std = std
         self.frequency = frequency
-        self.points_with_noise_points = self.add_noise_to_points(points)
-        self.tweened_points = self.tween_points(points, pytweening.easeOutQuad, target_points)
+        if curve is not None:
+            progress = self.tween_progress(pytweening.easeOutQuad, target_points, curve.points_count)
+            self.tweened_points = curve.sample_points(progress)
+            self.points_with_noise_points = self.add_noise_to_points(self.tweened_points)
+        else:
+            self.points_with_noise_points = self.add_noise_to_points(points)
+            self.tweened_points = self.tween_points(points, pytweening.easeOutQuad, target_points)
 
     def add_noise_to_points(self, points):
         """
@@ -52,4 +59,17 @@ class NoiseAndTween:
             tween_value = tween(float(i) / (targetPoints - 1))
             index = int(tween_value * (len(points) - 1))
             new_points.append(points[index])
-        return new_points
\ No newline at end of file
+        return new_points
+
+    @staticmethod
+    def tween_progress(tween, targetPoints, points_count):
+        """
+        Returns the progress along a curve of points_count points that tween_points would pick,
+        so the same points can be evaluated without building the whole curve
+        """
+        progress = []
+        for i in range(targetPoints):
+            tween_value = tween(float(i) / (targetPoints - 1))
+            index = int(tween_value * (points_count - 1))
+            progress.append(index / (points_count - 1))
+        return progress
@@ -0,0 +1,244 @@
+import time
+import pytweening
+import numpy as np
+from ScreenCheckpoint import grab_screen, screen_size
+
+
+class OutputBackend:
+    """
+    Interface MacroPlayer injects all cursor movement, key and mouse button inputs through.
+    Keys and buttons are resolved from their recorded names once with resolve_key/resolve_button
+    and the resolved values passed back to the press and release methods.
+    """
+    # Seconds to wait after each move_to call, same as pyautogui.PAUSE
+    pause = 0.0
+
+    @property
+    def cache_id(self):
+        """Name compiled plans are cached under, plans hold keys, buttons and positions resolved by one kind of backend"""
+        return type(self).__name__
+
+    def position(self):
+        """Returns current (x, y) cursor position"""
+        raise NotImplementedError
+
+    def move_to(self, x, y, duration=0.0, tween=pytweening.linear):
+        """Moves cursor to x, y over duration seconds following tween"""
+        raise NotImplementedError
+
+    def set_position(self, x, y):
+        """Sets cursor position directly with no tweening, pause or fail safe check, used by CursorInjector"""
+        raise NotImplementedError
+
+    def fail_safe_check(self):
+        """Raises an exception if the fail safe has been triggered"""
+        raise NotImplementedError
+
+    def grab_region(self, left, top, width, height):
+        """Returns (height, width, 3) uint8 RGB array of a screen region, used to check "wait_for" checkpoints"""
+        raise NotImplementedError
+
+    def screen_size(self):
+        """Returns (width, height) of the screen grab_region reads"""
+        raise NotImplementedError
+
+    def resolve_key(self, name):
+        """Returns key to press for a recorded key name, eg "a" or "Key.shift" """
+        raise NotImplementedError
+
+    def resolve_button(self, name):
+        """Returns button to press for a recorded button name, eg "Button.left" """
+        raise NotImplementedError
+
+    def key_press(self, key):
+        raise NotImplementedError
+
+    def key_release(self, key):
+        raise NotImplementedError
+
+    def mouse_press(self, button):
+        raise NotImplementedError
+
+    def mouse_release(self, button):
+        raise NotImplementedError
+
+    # Batched inputs for the primitives written by MacroOptimizer, backends override these when they can do better
+    # than one call per press and release
+    def tap(self, key):
+        """Presses and releases a key"""
+        self.key_press(key)
+        self.key_release(key)
+
+    def click(self, button):
+        """Presses and releases a mouse button"""
+        self.mouse_press(button)
+        self.mouse_release(button)
+
+    def type_text(self, text):
+        """Types a string of plain characters"""
+        for char in text:
+            self.tap(char)
+
+
+class PyAutoGuiBackend(OutputBackend):
+    def __init__(self, fail_safe=True):
+        """
+        Injects inputs into the desktop with pyautogui and pynput.
+        They are imported here as both need a display to import, so headless backends can be used without one.
+        --------
+        Args:
+        --fail_safe: Boolean, Will keep standard fail safes for pyautogui
+        """
+        import pyautogui
+        from pynput.mouse import Button, Controller as MouseController
+        from pynput.keyboard import Key, Controller as KeyboardController
+        self.pg = pyautogui
+        self.pg.FAILSAFE = fail_safe
+        self.Button = Button
+        self.mouse = MouseController()
+        self.keyboard = KeyboardController()
+        self.special_keys = {"Key.shift": Key.shift, "Key.shift_l": Key.shift_r,
+                             "Key.tab": Key.tab, "Key.caps_lock": Key.caps_lock, "Key.ctrl_l": Key.ctrl_l,
+                             "Key.ctrl_r": Key.ctrl_r, "Key.ctrl": Key.ctrl, "Key.alt": Key.alt, "Key.alt_l": Key.alt_l,
+                             "Key.alt_r": Key.alt_r, "Key.cmd": Key.cmd, "Key.cmd_r": Key.cmd_r, "Key.cmd_l": Key.cmd_l,
+                             "Key.enter": Key.enter, "Key.backspace": Key.backspace, "Key.f20": Key.f20,
+                             "Key.f19": Key.f19, "Key.f18": Key.f18, "Key.f17": Key.f17, "Key.f16": Key.f16,
+                             "Key.f15": Key.f15, "Key.f14": Key.f14, "Key.f13": Key.f13, "Key.f12": Key.f12,
+                             "Key.f11": Key.f11, "Key.f10": Key.f10, "Key.f9": Key.f9, "Key.f8": Key.f8,
+                             "Key.f7": Key.f7, "Key.f6": Key.f6, "Key.f5": Key.f5, "Key.f4": Key.f4, "Key.f3": Key.f3,
+                             "Key.f2": Key.f2, "Key.f1": Key.f1, "Key.media_volume_up": Key.media_volume_up,
+                             "Key.media_volume_down": Key.media_volume_down,
+                             "Key.media_volume_mute": Key.media_volume_mute,
+                             "Key.media_play_pause": Key.media_play_pause, "Key.right": Key.right, "Key.down": Key.down, "Key.left": Key.left, "Key.up": Key.up,
+                             "Key.page_up": Key.page_up, "Key.page_down": Key.page_down, "Key.home": Key.home,
+                             "Key.end": Key.end, "Key.delete": Key.delete, "Key.space": Key.space}
+
+    @property
+    def pause(self):
+        return self.pg.PAUSE
+
+    @pause.setter
+    def pause(self, value):
+        self.pg.PAUSE = value
+
+    def position(self):
+        return self.pg.position()
+
+    def move_to(self, x, y, duration=0.0, tween=pytweening.linear):
+        self.pg.moveTo(x, y, duration, tween)
+
+    def set_position(self, x, y):
+        self.mouse.position = (x, y)
+
+    def fail_safe_check(self):
+        self.pg.failSafeCheck()
+
+    def grab_region(self, left, top, width, height):
+        return grab_screen(left, top, width, height)
+
+    def screen_size(self):
+        return screen_size()
+
+    def resolve_key(self, name):
+        return name if 'Key.' not in name else self.special_keys[name]
+
+    def resolve_button(self, name):
+        return getattr(self.Button, name.split(".")[1])
+
+    def key_press(self, key):
+        self.keyboard.press(key)
+
+    def key_release(self, key):
+        self.keyboard.release(key)
+
+    def mouse_press(self, button):
+        self.mouse.press(button)
+
+    def mouse_release(self, button):
+        self.mouse.release(button)
+
+    def tap(self, key):
+        self.keyboard.tap(key)
+
+    def click(self, button):
+        self.mouse.click(button)
+
+    def type_text(self, text):
+        self.keyboard.type(text)
+
+
+class RecordingBackend(OutputBackend):
+    def __init__(self, start=(0, 0), simulate_duration=True, screen_size=(1920, 1080)):
+        """
+        Fake backend for running without a desktop, logs a (perf_counter time, kind, x, y, value) tuple
+        for every injected move, key and button input. Keys and buttons resolve to their recorded names.
+        Screen regions are grabbed from self.screen, a (height, width, 3) array tests can draw into.
+        --------
+        Args:
+        --start: Tuple, starting (x, y) cursor position
+        --simulate_duration: Boolean, sleeps for the duration of moves and the pause after them like pyautogui would,
+        total time slept is kept in self.simulated
+        --screen_size: Tuple, (width, height) of the fake screen
+        """
+        self.screen = np.zeros((screen_size[1], screen_size[0], 3), dtype=np.uint8)
+        self.pause = 0.0
+        self.simulated = 0.0
+        self.cursor = tuple(start)
+        self.simulate_duration = simulate_duration
+        self.log = []
+
+    def position(self):
+        return self.cursor
+
+    def move_to(self, x, y, duration=0.0, tween=pytweening.linear):
+        if self.simulate_duration and duration > 0:
+            self.sleep(duration)
+        self.cursor = (round(x), round(y))
+        self.log.append((time.perf_counter(), "move", self.cursor[0], self.cursor[1], duration))
+        if self.simulate_duration and self.pause > 0:
+            self.sleep(self.pause)
+
+    def set_position(self, x, y):
+        self.cursor = (x, y)
+        self.log.append((time.perf_counter(), "move", x, y, 0.0))
+
+    def fail_safe_check(self):
+        pass
+
+    def grab_region(self, left, top, width, height):
+        return self.screen[top:top + height, left:left + width].copy()
+
+    def screen_size(self):
+        return self.screen.shape[1], self.screen.shape[0]
+
+    def sleep(self, seconds):
+        start = time.perf_counter()
+        time.sleep(seconds)
+        self.simulated += time.perf_counter() - start
+
+    def resolve_key(self, name):
+        return name
+
+    def resolve_button(self, name):
+        return name
+
+    def key_press(self, key):
+        self.log.append((time.perf_counter(), "key_press", self.cursor[0], self.cursor[1], key))
+
+    def key_release(self, key):
+        self.log.append((time.perf_counter(), "key_release", self.cursor[0], self.cursor[1], key))
+
+    def mouse_press(self, button):
+        self.log.append((time.perf_counter(), "mouse_press", self.cursor[0], self.cursor[1], button))
+
+    def mouse_release(self, button):
+        self.log.append((time.perf_counter(), "mouse_release", self.cursor[0], self.cursor[1], button))
+
+    def tap(self, key):
+        self.log.append((time.perf_counter(), "tap", self.cursor[0], self.cursor[1], key))
+
+    def click(self, button):
+        self.log.append((time.perf_counter(), "click", self.cursor[0], self.cursor[1], button))
+
+    def type_text(self, text):
+        self.log.append((time.perf_counter(), "type", self.cursor[0], self.cursor[1], text))
@@ -0,0 +1,103 @@
+import numpy as np
+
+
+class PathSimplifier:
+    def __init__(self, tolerance_px=2.0, tolerance_s=0.05, max_points=5000):
+        """
+        Simplifies the raw stream of mouse moves with Ramer-Douglas-Peucker, keeping only the points needed to replay
+        the path within tolerance_px of its shape and tolerance_s of its timing. Moves are buffered until flush() is called,
+        which the recorder does whenever a non move event arrives, or until max_points have buffered.
+        --------
+        Args:
+        --tolerance_px: Float, max distance in pixels a dropped point can be from the simplified path, 0 keeps every point
+        --tolerance_s: Float, max seconds the simplified path can reach a dropped point early or late, 0 only checks distance
+        --max_points: Int, max raw moves buffered before they are simplified, bounds memory on long drags
+        """
+        self.tolerance_px = tolerance_px
+        self.tolerance_s = tolerance_s
+        self.max_points = max(3, max_points)
+        self.points = []
+        # Last kept point of a full buffer, it starts the next buffer so the path stays connected
+        self.anchor = None
+        self.raw_points = 0
+        self.kept_points = 0
+        self.max_deviation_px = 0.0
+        self.max_time_error_s = 0.0
+
+    def add(self, x, y, timestamp):
+        """
+        Buffers a raw move, returns list of kept (x, y, timestamp) moves if the buffer was full, otherwise an empty list
+        """
+        self.points.append((x, y, timestamp))
+        self.raw_points += 1
+        if len(self.points) < self.max_points:
+            return []
+        kept = self.flush()
+        self.anchor = kept[-1]
+        return kept
+
+    def flush(self):
+        """
+        Simplifies buffered moves and returns the kept (x, y, timestamp) moves in order
+        """
+        points = self.points
+        self.points = []
+        anchor = self.anchor
+        self.anchor = None
+        if anchor is not None:
+            points = [anchor] + points
+        if len(points) < 3 or self.tolerance_px <= 0:
+            kept = points
+        else:
+            keep = self.simplify(np.array(points, dtype=np.float64))
+            kept = [point for point, is_kept in zip(points, keep) if is_kept]
+        if anchor is not None:
+            kept = kept[1:]
+        self.kept_points += len(kept)
+        return kept
+
+    def simplify(self, points):
+        """
+        Iterative Ramer-Douglas-Peucker over an (n, 3) array of x, y and timestamp in ns, returns boolean mask of kept points.
+        Each dropped point is scored by distance from the segment between kept points and by how early or late
+        the segment's linear timing passes it, a segment is split at its worst point while any score is out of tolerance.
+        """
+        x, y = points[:, 0], points[:, 1]
+        t = (points[:, 2] - points[0, 2]) / 1e9
+        keep = np.zeros(len(points), dtype=bool)
+        keep[0] = keep[-1] = True
+        stack = [(0, len(points) - 1)]
+        while stack:
+            start, end = stack.pop()
+            if end - start < 2:
+                continue
+            dx, dy = x[end] - x[start], y[end] - y[start]
+            px, py, pt = x[start + 1:end], y[start + 1:end], t[start + 1:end]
+            length_squared = dx * dx + dy * dy
+            if length_squared == 0:
+                progress = np.zeros(len(px))
+            else:
+                progress = np.clip(((px - x[start]) * dx + (py - y[start]) * dy) / length_squared, 0.0, 1.0)
+            deviation = np.hypot(x[start] + progress * dx - px, y[start] + progress * dy - py)
+            time_error = np.abs(t[start] + progress * (t[end] - t[start]) - pt)
+            score = deviation / self.tolerance_px
+            if self.tolerance_s > 0:
+                score = np.maximum(score, time_error / self.tolerance_s)
+            worst = int(np.argmax(score))
+            if score[worst] > 1:
+                split = start + 1 + worst
+                keep[split] = True
+                stack.append((start, split))
+                stack.append((split, end))
+            else:
+                self.max_deviation_px = max(self.max_deviation_px, float(deviation.max()))
+                self.max_time_error_s = max(self.max_time_error_s, float(time_error.max()))
+        return keep
+
+    def report(self):
+        """
+        Prints compression ratio and max deviation of the simplified path
+        """
+        ratio = self.raw_points / self.kept_points if self.kept_points else 1.0
+        print("Path compression: {} raw moves -> {} kept ({:.1f}x), max deviation {:.2f} px, max time error {:.3f} s".format(
+            self.raw_points, self.kept_points, ratio, self.max_deviation_px, self.max_time_error_s))
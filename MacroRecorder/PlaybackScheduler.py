@@ -0,0 +1,98 @@
+import time
+
+
+class PlaybackScheduler:
+    def __init__(self, spin_threshold=0.002):
+        """
+        Turns recorded per-event timers into absolute deadlines on the perf_counter clock.
+        Time spent moving the cursor and injecting inputs is absorbed by the next wait instead of adding up over a macro.
+        --------
+        Args:
+        --spin_threshold: Float, seconds before a deadline where we stop sleeping and busy-wait for sub-millisecond accuracy
+        """
+        self.spin_threshold = spin_threshold
+        self.deadline = None
+        self.lateness = []
+        self.waited = 0.0
+        # PlaybackTrace waits are reported to when instrumentation is on
+        self.trace = None
+
+    def start(self):
+        """
+        Starts the schedule from the current time and clears lateness records
+        """
+        self.deadline = time.perf_counter()
+        self.lateness = []
+        self.waited = 0.0
+
+    def next_deadline(self, timer):
+        """
+        Moves schedule on by the recorded timer of the next event and returns its absolute deadline
+        """
+        if self.deadline is None:
+            raise Exception("Scheduler is not running, use the .start() method first")
+        self.deadline += timer
+        return self.deadline
+
+    def resync(self, deadline):
+        """
+        Moves the schedule so the current deadline becomes deadline, used when a checkpoint matches before its timeout
+        """
+        self.deadline = deadline
+
+    @staticmethod
+    def time_left(deadline):
+        """
+        Seconds left until deadline, negative when deadline has passed
+        """
+        return deadline - time.perf_counter()
+
+    def wait_until(self, deadline):
+        """
+        Sleeps until shortly before deadline and then spins, sleep alone can overshoot by the OS timer resolution.
+        Time spent waiting is added to self.waited.
+        """
+        start = time.perf_counter()
+        while True:
+            now = time.perf_counter()
+            remaining = deadline - now
+            if remaining <= 0:
+                self.waited += now - start
+                if self.trace is not None:
+                    self.trace.slept(max(0.0, deadline - start), now - start)
+                return
+            if remaining > self.spin_threshold:
+                time.sleep(remaining - self.spin_threshold)
+
+    def mark(self, deadline, now=None):
+        """
+        Records how late an event fired against its deadline, now is the current time on the deadline's clock
+        when that is not perf_counter
+        """
+        self.lateness.append((time.perf_counter() if now is None else now) - deadline)
+
+    def statistics(self):
+        """
+        Returns dict of lateness statistics in milliseconds for all marked events
+        """
+        if not self.lateness:
+            return {"events": 0}
+        ordered = sorted(self.lateness)
+
+        def percentile(p):
+            return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+        return {"events": len(ordered), "mean_ms": sum(ordered) / len(ordered) * 1000, "p50_ms": percentile(50),
+                "p95_ms": percentile(95), "p99_ms": percentile(99), "max_ms": ordered[-1] * 1000,
+                "final_ms": self.lateness[-1] * 1000}
+
+    def report(self):
+        """
+        Prints lateness statistics
+        """
+        stats = self.statistics()
+        if stats["events"] == 0:
+            print("Timing: no events played")
+            return
+        print("Timing: {events} events, lateness mean {mean_ms:.3f} ms, p50 {p50_ms:.3f} ms, p95 {p95_ms:.3f} ms, "
+              "p99 {p99_ms:.3f} ms, max {max_ms:.3f} ms, final event {final_ms:.3f} ms".format(**stats))
@@ -0,0 +1,239 @@
+import json
+import time
+import struct
+import numpy as np
+import pytweening
+from BinaryMacro import ACTIONS
+from OutputBackend import OutputBackend
+
+# Trace file: magic, length of the JSON record dtype that follows, then fixed width records until end of file
+MAGIC = b"MRTRACE\x00"
+HEADER = struct.Struct("<8sI")
+
+STAGES = ("curve", "tween", "inject", "position", "sleep")
+# Compiled plan moves are traced as a "plan_move" action
+TRACE_ACTIONS = ACTIONS + ["plan_move"]
+MOVEMENTS = ["none", "instant", "simple", "human", "polyline"]
+
+# Times are in seconds. lateness: how late the event fired against its recorded time, compute: time taken by the event
+# not spent injecting or waiting, sleep: time slept past what was asked for
+TRACE_DTYPE = np.dtype([("index", "<u4"), ("play", "<u4"), ("action", "u1"), ("movement", "u1"), ("lateness", "<f4"),
+                        ("compute", "<f4")] + [(stage, "<f4") for stage in STAGES])
+
+
+class PlaybackTrace:
+    def __init__(self, path=None, chunk_size=4096):
+        """
+        Opt-in per-event instrumentation of playback. Each event gets a record of its lateness, compute cost and time spent
+        in each stage of STAGES, records are streamed to a compact binary trace file in chunks.
+        Callers time stages with add() between begin() and end().
+        --------
+        Args:
+        --path: String, trace file records are written to and read back from for the summary, so memory use does not
+        grow with playback. None keeps them in memory for the summary
+        --chunk_size: Int, records buffered before being written
+        """
+        self.path = path
+        self.file = None
+        if path is not None:
+            self.file = open(path, "wb")
+            descr = json.dumps(TRACE_DTYPE.descr).encode("utf-8")
+            self.file.write(HEADER.pack(MAGIC, len(descr)) + descr)
+            self.file.flush()
+        self.chunk = np.zeros(chunk_size, dtype=TRACE_DTYPE)
+        self.filled = 0
+        self.chunks = []
+        self.index = 0
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        self.waited = 0.0
+        self.start = 0.0
+        self.play = 0
+        self.action = 0
+
+    def begin(self, play, action):
+        """
+        Starts the record of the next event
+        """
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        self.waited = 0.0
+        self.play = play
+        self.action = TRACE_ACTIONS.index(action)
+        self.start = time.perf_counter()
+
+    def add(self, stage, seconds):
+        """
+        Adds seconds to a stage of the current event
+        """
+        self.stages[stage] += seconds
+
+    def slept(self, requested, actual):
+        """
+        Records a sleep or scheduler wait of the current event, the time past requested goes to the "sleep" stage
+        """
+        self.waited += actual
+        self.stages["sleep"] += max(0.0, actual - requested)
+
+    def end(self, movement, scheduled):
+        """
+        Finishes the current record, scheduled is the perf_counter time the event should have fired at
+        """
+        now = time.perf_counter()
+        stages = self.stages
+        compute = now - self.start - stages["inject"] - self.waited
+        self.chunk[self.filled] = (self.index, self.play, self.action, MOVEMENTS.index(movement), now - scheduled, compute,
+                                   *(stages[stage] for stage in STAGES))
+        self.index += 1
+        self.filled += 1
+        if self.filled == len(self.chunk):
+            self.flush()
+
+    def flush(self):
+        """
+        Writes buffered records to the trace file, or keeps them in memory when there is none
+        """
+        records = self.chunk[:self.filled]
+        if self.file is not None:
+            self.file.write(records.tobytes())
+            self.file.flush()
+        elif self.path is None:
+            self.chunks.append(records.copy())
+        self.filled = 0
+
+    def close(self):
+        """
+        Writes remaining records and closes the trace file
+        """
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def records(self):
+        """
+        Returns structured array of all records so far, read back from the trace file when there is one
+        """
+        written = [self.load(self.path)] if self.path is not None else self.chunks
+        return np.concatenate(written + [self.chunk[:self.filled]])
+
+    @staticmethod
+    def load(path):
+        """
+        Returns structured array of the records in a trace file, a partly written last record is ignored
+        """
+        with open(path, "rb") as trace_file:
+            data = trace_file.read()
+        magic, length = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("{} is not a playback trace file".format(path))
+        dtype = np.dtype([tuple(field) for field in json.loads(data[HEADER.size:HEADER.size + length].decode("utf-8"))])
+        body = data[HEADER.size + length:]
+        return np.frombuffer(body, dtype=dtype, count=len(body) // dtype.itemsize)
+
+    @staticmethod
+    def summary(records):
+        """
+        Returns list of per movement type dicts of event counts, lateness percentiles in ms, compute percentiles in us
+        and mean time per stage in us
+        """
+        rows = []
+        for code, movement in enumerate(MOVEMENTS):
+            selected = records[records["movement"] == code]
+            if len(selected) == 0:
+                continue
+            lateness = np.percentile(selected["lateness"], (50, 95, 99)) * 1000
+            compute = np.percentile(selected["compute"], (50, 95, 99)) * 1e6
+            row = {"movement": movement, "events": len(selected), "lateness_p50_ms": lateness[0],
+                   "lateness_p95_ms": lateness[1], "lateness_p99_ms": lateness[2],
+                   "lateness_max_ms": float(selected["lateness"].max()) * 1000, "compute_p50_us": compute[0],
+                   "compute_p95_us": compute[1], "compute_p99_us": compute[2]}
+            for stage in STAGES:
+                row[stage + "_us"] = float(selected[stage].mean()) * 1e6
+            rows.append(row)
+        return rows
+
+    def report(self):
+        """
+        Prints summary of all records per movement type
+        """
+        print("Trace: {} events{}".format(self.index, ", written to {}".format(self.path) if self.path else ""))
+        print("{:>9} {:>7} {:>28} {:>28} {:>46}".format("movement", "events", "lateness p50/p95/p99 (ms)",
+                                                       "compute p50/p95/p99 (us)", "mean curve/tween/inject/position/sleep (us)"))
+        for row in self.summary(self.records()):
+            print("{:>9} {:>7} {:>28} {:>28} {:>46}".format(
+                row["movement"], row["events"],
+                "{:.3f}/{:.3f}/{:.3f}".format(row["lateness_p50_ms"], row["lateness_p95_ms"], row["lateness_p99_ms"]),
+                "{:.1f}/{:.1f}/{:.1f}".format(row["compute_p50_us"], row["compute_p95_us"], row["compute_p99_us"]),
+                "/".join("{:.1f}".format(row[stage + "_us"]) for stage in STAGES)))
+
+
+class TracingBackend(OutputBackend):
+    def __init__(self, backend, trace):
+        """
+        Wraps an output backend, adding the time spent in position queries to the "position" stage
+        and in cursor moves and inputs to the "inject" stage of the current trace record
+        """
+        self.backend = backend
+        self.trace = trace
+
+    @property
+    def pause(self):
+        return self.backend.pause
+
+    @pause.setter
+    def pause(self, value):
+        self.backend.pause = value
+
+    @property
+    def cache_id(self):
+        return self.backend.cache_id
+
+    def timed(self, stage, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.trace.add(stage, time.perf_counter() - start)
+        return result
+
+    def position(self):
+        return self.timed("position", self.backend.position)
+
+    def move_to(self, x, y, duration=0.0, tween=pytweening.linear):
+        self.timed("inject", self.backend.move_to, x, y, duration, tween)
+
+    def set_position(self, x, y):
+        self.timed("inject", self.backend.set_position, x, y)
+
+    def fail_safe_check(self):
+        self.backend.fail_safe_check()
+
+    def grab_region(self, left, top, width, height):
+        return self.backend.grab_region(left, top, width, height)
+
+    def screen_size(self):
+        return self.backend.screen_size()
+
+    def resolve_key(self, name):
+        return self.backend.resolve_key(name)
+
+    def resolve_button(self, name):
+        return self.backend.resolve_button(name)
+
+    def key_press(self, key):
+        self.timed("inject", self.backend.key_press, key)
+
+    def key_release(self, key):
+        self.timed("inject", self.backend.key_release, key)
+
+    def mouse_press(self, button):
+        self.timed("inject", self.backend.mouse_press, button)
+
+    def mouse_release(self, button):
+        self.timed("inject", self.backend.mouse_release, button)
+
+    def tap(self, key):
+        self.timed("inject", self.backend.tap, key)
+
+    def click(self, button):
+        self.timed("inject", self.backend.click, button)
+
+    def type_text(self, text):
+        self.timed("inject", self.backend.type_text, text)
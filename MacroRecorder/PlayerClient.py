@@ -0,0 +1,107 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+
+# Same default as PlayerDaemon, not imported from it so the client stays free of numpy and pyautogui
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "macro_player_{}.sock".format(os.getuid() if hasattr(os, "getuid") else 0))
+
+
+class PlayerClient:
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=None):
+        """
+        Submits requests to a running PlayerDaemon. Only imports the standard library so starting it is cheap.
+        --------
+        Args:
+        --socket_path: String, path of the daemon's Unix socket
+        --timeout: Float, max seconds to wait for each status update, None waits as long as playback takes
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def request(self, message):
+        """
+        Sends a request and yields each status dict the daemon sends back
+        """
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(self.timeout)
+        try:
+            connection.connect(self.socket_path)
+            connection.sendall(json.dumps(message).encode("utf-8") + b"\n")
+            with connection.makefile("rb") as replies:
+                for line in replies:
+                    yield json.loads(line)
+        finally:
+            connection.close()
+
+    def play(self, macro_file, **options):
+        """
+        Plays a macro on the daemon, options are MacroPlayer arguments such as movement_type or seed.
+        The send time is included so the daemon can report trigger to first event latency
+        """
+        return self.request({"command": "play", "macro_file": os.path.abspath(macro_file), "options": options,
+                             "sent": time.monotonic()})
+
+    def status(self):
+        return next(self.request({"command": "status"}))
+
+    def shutdown(self):
+        return next(self.request({"command": "shutdown"}))
+
+
+def main(socket_path, macro_file, status, shutdown, options):
+    client = PlayerClient(socket_path)
+    if status:
+        print(json.dumps(client.status()))
+        return 0
+    if shutdown:
+        print(json.dumps(client.shutdown()))
+        return 0
+    failed = False
+    for message in client.play(macro_file, **options):
+        if message["status"] == "report":
+            print(message["line"])
+        elif message["status"] == "loaded":
+            print("Loaded {} events{} in {:.2f} ms".format(message["events"], " from cache" if message["cached"] else "",
+                                                         message["load_ms"]))
+        elif message["status"] == "finished":
+            print("Finished in {:.3f} s, queued {:.2f} ms".format(message["duration"], message["queued_ms"]))
+            if message["trigger_ms"] is not None:
+                print("First event {:.2f} ms after the request was sent, {:.2f} ms after the daemon received it".format(
+                    message["trigger_ms"], message["first_event_ms"]))
+        else:
+            print(message.get("error", message), file=sys.stderr)
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("--socket", type=str, required=False, help="String - Path of the player daemon's Unix socket")
+    argParser.add_argument("--macro_file", type=str, required=False, help="String - Path of the macro file to play")
+    argParser.add_argument('--status', action='store_true', help="Flag - Prints the daemon's status instead of playing")
+    argParser.add_argument('--shutdown', action='store_true', help="Flag - Stops the daemon instead of playing")
+    argParser.add_argument("--movement_type", type=str, required=False, help="String - Determine mouse movement type must be 'instant','simple' or 'human'")
+    argParser.add_argument("--number_of_plays", type=int, required=False, help="Integer - Number of times to play macro")
+    argParser.add_argument("--max_random_px", type=int, required=False, help="Integer - Max distance in pixels a human movement can end from the recorded coords")
+    argParser.add_argument("--timing", type=str, required=False, help="String - Determine how timers are waited on must be 'relative' or 'absolute'")
+    argParser.add_argument('--precompile', action='store_true', help="Flag - Compiles all movements before playback starts, uses absolute timing")
+    argParser.add_argument("--seed", type=int, required=False, help="Integer - Seed for all playback randomness, precompiled plans with a seed are cached by the daemon")
+    argParser.add_argument("--lookahead", type=int, required=False, help="Integer - Number of events to generate movements for ahead of playback, 0 turns it off")
+    argParser.add_argument("--speed", type=float, required=False, help="Float - Playback speed factor, 2 plays twice as fast")
+    argParser.add_argument("--start_at", type=str, required=False, help="String - Position to play from, seconds, '[[h:]m:]s' or '#N' for event N")
+    argParser.add_argument("--end_at", type=str, required=False, help="String - Position to stop playing at, seconds, '[[h:]m:]s' or '#N' for event N")
+    argParser.set_defaults(socket=DEFAULT_SOCKET, status=False, shutdown=False, precompile=False)
+    args = argParser.parse_args()
+    if args.macro_file is None and not (args.status or args.shutdown):
+        argParser.error("--macro_file is required to play")
+
+    # Only options given are sent, the daemon uses MacroPlayer's defaults for the rest
+    play_options = {name: getattr(args, name) for name in ("movement_type", "number_of_plays", "max_random_px", "timing",
+                                                           "seed", "lookahead", "speed", "start_at", "end_at") if getattr(args, name) is not None}
+    if args.precompile:
+        play_options["precompile"] = True
+    sys.exit(main(args.socket, args.macro_file, args.status, args.shutdown, play_options))
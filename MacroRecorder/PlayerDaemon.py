@@ -0,0 +1,212 @@
+import io
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+import contextlib
+import socketserver
+from collections import OrderedDict
+from MacroEvents import MacroEvents
+from MacroPlayer import MacroPlayer
+from MacroCompiler import PlanCache
+from PlaybackTrace import TracingBackend
+from OutputBackend import PyAutoGuiBackend, RecordingBackend
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "macro_player_{}.sock".format(os.getuid() if hasattr(os, "getuid") else 0))
+
+# MacroPlayer arguments a client may set for a run and the types they are converted to
+PLAY_OPTIONS = {"movement_type": str, "number_of_plays": int, "max_random_px": int, "timing": str, "precompile": bool,
+                "seed": int, "lookahead": int, "frame_rate": int, "speed": float, "max_gap": float, "min_gap": float,
+                "trajectory_variants": int, "trajectory_file": str, "trace": str, "start_at": str, "end_at": str}
+
+
+class FirstInputBackend(TracingBackend):
+    def __init__(self, backend):
+        """
+        Wraps an output backend, keeping the time.monotonic() time of the first cursor move or input injected through it
+        """
+        super().__init__(backend, None)
+        self.first_input = None
+
+    def timed(self, stage, function, *args):
+        if self.first_input is None and stage == "inject":
+            self.first_input = time.monotonic()
+        return function(*args)
+
+
+class PlayerDaemon:
+    def __init__(self, socket_path=DEFAULT_SOCKET, backend=None, fail_safe=True, max_macros=64, plan_cache=None,
+                 plan_memory=64):
+        """
+        Long running player serving play requests from PlayerClient over a local Unix socket, so pyautogui, numpy and
+        pynput are imported and the output backend with its key tables is built once rather than for every run.
+        Loaded macros are kept keyed by path, modification time and size, a changed file is loaded again.
+        Runs are played one at a time, further requests queue. Each request is one JSON line and every status
+        update sent back is one JSON line, see handle().
+        --------
+        Args:
+        --socket_path: String, path of the Unix socket to listen on
+        --backend: OutputBackend, inputs are injected through this, defaults to PyAutoGuiBackend
+        --fail_safe: Boolean, see MacroPlayer, only used for the default backend
+        --max_macros: Int, max loaded macros kept, the least recently used is dropped past this
+        --plan_cache: String, directory compiled plans are cached in, default is "plan_cache" next to each macro
+        --plan_memory: Int, number of compiled plans also kept in memory
+        """
+        self.socket_path = socket_path
+        self.backend = backend if backend is not None else PyAutoGuiBackend(fail_safe)
+        self.max_macros = max_macros
+        self.plan_cache_path = plan_cache
+        self.plan_memory = plan_memory
+        self.plan_caches = {}
+        self.macros = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.play_lock = threading.Lock()
+        self.started = time.monotonic()
+        self.runs = 0
+        self.server = None
+
+    def macro(self, macro_file):
+        """
+        Returns (MacroEvents, True when it came from the cache) for a macro file
+        """
+        stat = os.stat(macro_file)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self.cache_lock:
+            cached = self.macros.get(macro_file)
+            if cached is not None and cached[0] == key:
+                self.macros.move_to_end(macro_file)
+                return cached[1], True
+        events = MacroEvents.load(macro_file)
+        with self.cache_lock:
+            self.macros[macro_file] = (key, events)
+            self.macros.move_to_end(macro_file)
+            while len(self.macros) > self.max_macros:
+                self.macros.popitem(last=False)
+        return events, False
+
+    def plan_cache(self, save_path):
+        """
+        Returns the PlanCache shared by every run of macros in save_path
+        """
+        path = self.plan_cache_path if self.plan_cache_path is not None else os.path.join(save_path, "plan_cache")
+        with self.cache_lock:
+            if path not in self.plan_caches:
+                self.plan_caches[path] = PlanCache(path, self.plan_memory)
+            return self.plan_caches[path]
+
+    def play(self, request, send):
+        """
+        Plays a macro for a request, calling send with each status dict
+        """
+        received = time.monotonic()
+        macro_file = os.path.abspath(request["macro_file"])
+        options = {}
+        for name, value in request.get("options", {}).items():
+            if name not in PLAY_OPTIONS:
+                raise ValueError("option must be one of %r." % set(PLAY_OPTIONS))
+            options[name] = PLAY_OPTIONS[name](value) if value is not None else None
+        events, cached = self.macro(macro_file)
+        save_path, save_file = os.path.split(macro_file)
+        send({"status": "loaded", "cached": cached, "events": len(events),
+              "load_ms": (time.monotonic() - received) * 1000})
+
+        with self.play_lock:
+            queued = time.monotonic()
+            backend = FirstInputBackend(self.backend)
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                player = MacroPlayer(save_path, save_file, backend=backend, plan_cache=self.plan_cache(save_path),
+                                     events=events, **options)
+                player.run()
+            finished = time.monotonic()
+            self.runs += 1
+        for line in output.getvalue().splitlines():
+            send({"status": "report", "line": line})
+        result = {"status": "finished", "duration": finished - queued, "queued_ms": (queued - received) * 1000,
+                  "first_event_ms": None, "trigger_ms": None}
+        if backend.first_input is not None:
+            # Time from the daemon receiving the request, and from the client sending it, to the first injected input
+            result["first_event_ms"] = (backend.first_input - received) * 1000
+            if request.get("sent") is not None:
+                result["trigger_ms"] = (backend.first_input - request["sent"]) * 1000
+        send(result)
+
+    def status(self):
+        """
+        Returns dict describing the daemon
+        """
+        with self.cache_lock:
+            macros = list(self.macros)
+        return {"status": "running", "pid": os.getpid(), "uptime": time.monotonic() - self.started, "runs": self.runs,
+                "cached_macros": macros}
+
+    def handle(self, line, send):
+        """
+        Serves one request line. Requests are {"command": "play", "macro_file": path, "options": {...}, "sent": time.monotonic()},
+        {"command": "status"} or {"command": "shutdown"}. Errors are sent as {"status": "error", "error": message}
+        """
+        try:
+            request = json.loads(line)
+            command = request.get("command")
+            if command == "play":
+                self.play(request, send)
+            elif command == "status":
+                send(self.status())
+            elif command == "shutdown":
+                send({"status": "stopping"})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            else:
+                raise ValueError("command must be one of {'play', 'status', 'shutdown'}.")
+        except Exception as error:
+            send({"status": "error", "error": "{}: {}".format(type(error).__name__, error)})
+
+    def serve_forever(self):
+        """
+        Listens on the socket until a shutdown request, a stale socket file left by a killed daemon is replaced
+        """
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                if not line:
+                    return
+
+                def send(message):
+                    self.wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+                    self.wfile.flush()
+
+                daemon.handle(line, send)
+
+        self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        self.server.daemon_threads = True
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+
+def main(socket_path, fail_safe, headless, max_macros, plan_cache):
+    backend = RecordingBackend(simulate_duration=False) if headless else None
+    daemon = PlayerDaemon(socket_path, backend, fail_safe, max_macros, plan_cache)
+    print("Player daemon listening on {}".format(socket_path))
+    daemon.serve_forever()
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("--socket", type=str, required=False, help="String - Path of the Unix socket to listen on")
+    argParser.add_argument('--no_fail_safe', dest='fail_safe', action='store_false', help="Flag - Turns off pyautogui fail safes (NOT RECOMMENDED)")
+    argParser.add_argument('--headless', action='store_true', help="Flag - Plays through the headless recording backend, no display needed")
+    argParser.add_argument("--max_macros", type=int, required=False, help="Integer - Max number of loaded macros kept in memory")
+    argParser.add_argument("--plan_cache", type=str, required=False, help="String - Directory compiled plans are cached in")
+    argParser.set_defaults(socket=DEFAULT_SOCKET, fail_safe=True, headless=False, max_macros=64, plan_cache=None)
+    args = argParser.parse_args()
+
+    main(args.socket, args.fail_safe, args.headless, args.max_macros, args.plan_cache)
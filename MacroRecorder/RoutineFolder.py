@@ -0,0 +1,290 @@
+import os
+import time
+import argparse
+import numpy as np
+from MacroReader import MacroReader
+from MacroEvents import MacroEvents
+from BinaryMacro import write_binary, write_json
+
+# Rolling hash arithmetic wraps modulo 2 ** 64, the base is odd so it has an inverse and windows hash independently
+# of where they start
+HASH_BASE = 0x100000001B3
+HASH_MIX = np.uint64(0x9E3779B97F4A7C15)
+# Max values compared at once when checking the windows of a group, bounds memory for long windows
+CHECK_CHUNK = 1 << 21
+# Positions relative to the previous event get 20 bits each in a token, offset so they are never negative
+POSITION_BITS = 20
+POSITION_OFFSET = 1 << (POSITION_BITS - 1)
+POSITION_MASK = (1 << POSITION_BITS) - 1
+# The rest of a token numbers each distinct action and name
+HEAD_BITS = 64 - 2 * POSITION_BITS
+
+
+class RoutineFolder:
+    def __init__(self, min_length=4, max_length=256, min_calls=3, time_tolerance=0.05):
+        """
+        Finds runs of events repeated through a macro, such as the same form filled in for every row, and folds them
+        into routines defined once plus "call" events the player expands as it plays.
+        Events match when their action, key or button and position relative to the event before are the same, so a
+        repeat can be anywhere on screen, and every event of a repeat is within time_tolerance seconds of the routine's
+        timing from its first event. For each length from max_length down to min_length every window of events is hashed
+        with a rolling hash in one vectorised pass, groups of equal hashes are checked event by event and folded greedily,
+        largest first, then grown while every repeat is followed by the same event.
+        --------
+        Args:
+        --min_length: Int, fewest events in a routine
+        --max_length: Int, most events in a routine
+        --min_calls: Int, fewest times a run of events has to repeat to become a routine
+        --time_tolerance: Float, max seconds an event of a repeat can be from the routine's time for it
+        """
+        if min_length < 2 or max_length < min_length:
+            raise ValueError("min_length must be at least 2 and max_length at least min_length.")
+        if min_calls < 2:
+            raise ValueError("min_calls must be at least 2.")
+        self.min_length = min_length
+        self.max_length = max_length
+        self.min_calls = min_calls
+        self.time_tolerance_ns = round(time_tolerance * 1e9)
+        self.stats = {"events_in": 0, "events_out": 0, "routines": 0, "routine_events": 0, "calls": 0,
+                      "called_events": 0, "seconds": 0.0}
+
+    def lengths(self):
+        """
+        Returns window lengths tried, longest first. Long lengths are spaced out as repeats found are grown to their full length
+        """
+        lengths = []
+        length = self.max_length
+        while length > 16:
+            lengths.append(length)
+            length = int(length * 0.8)
+        lengths.extend(range(min(length, self.max_length), self.min_length - 1, -1))
+        return lengths
+
+    @staticmethod
+    def tokens(store):
+        """
+        Returns (head, full) uint64 arrays, head numbering each event's action and name and full adding its position
+        relative to the previous event. The first event of a repeat only has to match on head
+        """
+        count = store.count
+        kinds = (store.opcode[:count].astype(np.uint64) << np.uint64(32)) | store.name[:count].astype(np.uint64)
+        kinds, head = np.unique(kinds, return_inverse=True)
+        if len(kinds) > 1 << HEAD_BITS:
+            raise ValueError("RoutineFolder supports at most {} distinct actions and names.".format(1 << HEAD_BITS))
+        head = head.reshape(-1).astype(np.uint64)
+        relative = []
+        for column in (store.x[:count], store.y[:count]):
+            delta = np.diff(column.astype(np.int64), prepend=column[:1].astype(np.int64))
+            relative.append(((delta + POSITION_OFFSET) & POSITION_MASK).astype(np.uint64))
+        full = (((head << np.uint64(POSITION_BITS)) | relative[0]) << np.uint64(POSITION_BITS)) | relative[1]
+        return head, full
+
+    def find(self, store):
+        """
+        Returns (routines, calls) of a MacroEvents store, routines a list of (first event, length) of the repeat each
+        routine is taken from and calls a dict of first event of each repeat to (routine number, length)
+        """
+        count = store.count
+        times = store.time_ns[:count]
+        head, full = self.tokens(store)
+        # Prefix sums of every token scaled by the inverse power of its position, a window's hash is then one subtraction
+        # and multiplication by the power of its start, the same wherever the window is
+        powers = np.full(count, HASH_BASE, dtype=np.uint64)
+        inverse_powers = np.full(count, pow(HASH_BASE, -1, 2 ** 64), dtype=np.uint64)
+        powers[:1] = inverse_powers[:1] = 1
+        powers, inverse_powers = np.cumprod(powers, dtype=np.uint64), np.cumprod(inverse_powers, dtype=np.uint64)
+        prefix = np.concatenate((np.zeros(1, dtype=np.uint64), np.cumsum(full * HASH_MIX * inverse_powers, dtype=np.uint64)))
+        head_mixed = head * HASH_MIX + np.uint64(1)
+
+        covered = np.zeros(count, dtype=bool)
+        routines = []
+        calls = {}
+        for length in self.lengths():
+            if length * self.min_calls > count:
+                continue
+            # Windows holding an already folded event are left out, counted in O(1) each from a prefix sum
+            covered_sum = np.concatenate(([0], np.cumsum(covered)))
+            starts = np.flatnonzero(covered_sum[length:] - covered_sum[:-length] == 0)
+            if len(starts) < self.min_calls:
+                continue
+            hashes = (prefix[starts + length] - prefix[starts + 1]) * powers[starts + 1] * HASH_MIX + head_mixed[starts]
+            order = np.argsort(hashes)
+            boundaries = np.flatnonzero(np.diff(hashes[order])) + 1
+            group_starts = np.concatenate(([0], boundaries))
+            group_ends = np.concatenate((boundaries, [len(order)]))
+            sizes = group_ends - group_starts
+            repeated = np.flatnonzero(sizes >= self.min_calls)
+            for group in repeated[np.argsort(-sizes[repeated], kind="stable")]:
+                occurrences = np.sort(starts[order[group_starts[group]:group_ends[group]]])
+                # Folded runs are at least as long as this length, so a window overlaps one only if it starts or ends in it
+                occurrences = occurrences[~covered[occurrences] & ~covered[occurrences + length - 1]]
+                if len(occurrences) < self.min_calls:
+                    continue
+                kept = self.matching(occurrences, length, head, full, times)
+                if len(kept) < self.min_calls:
+                    continue
+                length_kept = self.grow(kept, length, full, times, covered)
+                if len(kept) * length_kept - (len(kept) + length_kept) <= 0:
+                    continue
+                for start in kept.tolist():
+                    calls[start] = (len(routines), length_kept)
+                    covered[start:start + length_kept] = True
+                routines.append((int(kept[0]), length_kept))
+        return routines, calls
+
+    def matching(self, occurrences, length, head, full, times):
+        """
+        Returns array of the occurrences that match the first one event by event and in timing, none overlapping another.
+        Occurrences are compared a chunk at a time as rows of a 2d array, so equal hashes of different events are caught.
+        Calls play with the first occurrence's timing, so one is also left out when played that way its last event would
+        come after the event following it and time would run backwards
+        """
+        count = len(full)
+        reference = occurrences[0]
+        window = np.arange(length)
+        reference_tokens = full[reference + window[1:]]
+        reference_offsets = times[reference + window] - times[reference]
+        matches = np.empty(len(occurrences), dtype=bool)
+        rows = max(1, CHECK_CHUNK // length)
+        for first in range(0, len(occurrences), rows):
+            chunk = occurrences[first:first + rows]
+            indexes = chunk[:, None] + window
+            offsets = times[indexes] - times[chunk][:, None]
+            following = chunk + length
+            fits = (following >= count) | (times[np.minimum(following, count - 1)] >= times[chunk] + reference_offsets[-1])
+            matches[first:first + rows] = ((head[chunk] == head[reference])
+                                           & (full[indexes[:, 1:]] == reference_tokens).all(axis=1)
+                                           & (np.abs(offsets - reference_offsets) <= self.time_tolerance_ns).all(axis=1)
+                                           & fits)
+        kept = []
+        end = -1
+        for start in occurrences[matches].tolist():
+            if start >= end:
+                kept.append(start)
+                end = start + length
+        return np.array(kept, dtype=np.int64)
+
+    def grow(self, kept, length, full, times, covered):
+        """
+        Returns length the repeats starting at kept can grow to, each adding the next event while all repeats are followed
+        by the same event in time, none runs into the next repeat or a folded event and, played with the first repeat's
+        timing, none ends after the event following it
+        """
+        count = len(full)
+        limits = np.append(kept[1:], count)
+        while length < self.max_length:
+            following = kept + length
+            if (following >= limits).any() or covered[following].any():
+                break
+            if (full[following] != full[following[0]]).any():
+                break
+            offsets = times[following] - times[kept]
+            if np.abs(offsets - offsets[0]).max() > self.time_tolerance_ns:
+                break
+            after = following + 1
+            inside = after < count
+            if (times[after[inside]] < times[kept[inside]] + offsets[0]).any():
+                break
+            length += 1
+        return length
+
+    def fold(self, store):
+        """
+        Returns list of event dicts of a MacroEvents store with repeats folded, "define" events of every routine first
+        """
+        start = time.perf_counter()
+        if store.routines:
+            # An already folded macro is expanded and folded again
+            store = MacroEvents.from_dicts(store.iter_dicts())
+        routines, calls = self.find(store)
+        events = []
+        for number, (first, length) in enumerate(routines):
+            anchor = store[first]
+            routine = []
+            for index in range(first, first + length):
+                event = store[index]
+                routine.append([event.action, event.name, event.x - anchor.x, event.y - anchor.y,
+                                event.time_ns - anchor.time_ns])
+            events.append({"action": "define", "routine": number, "events": routine, "x": 0, "y": 0, "time_ns": 0})
+        index = 0
+        while index < store.count:
+            event = store[index]
+            if index in calls:
+                number, length = calls[index]
+                events.append({"action": "call", "routine": number, "x": event.x, "y": event.y, "time_ns": event.time_ns})
+                index += length
+                continue
+            events.append(event.to_dict())
+            index += 1
+
+        stats = self.stats
+        stats["events_in"] += store.count
+        stats["events_out"] += len(events) - len(routines)
+        stats["routines"] += len(routines)
+        stats["routine_events"] += sum(length for _, length in routines)
+        stats["calls"] += len(calls)
+        stats["called_events"] += sum(length for _, length in calls.values())
+        stats["seconds"] += time.perf_counter() - start
+        return events
+
+    def report(self):
+        """
+        Prints how much folding compressed the macro
+        """
+        stats = self.stats
+        stored = stats["events_out"] + stats["routine_events"]
+        ratio = stats["events_in"] / stored if stored else 1.0
+        print("Folded {events_in} events to {events_out} and {routines} routines of {routine_events} events in "
+              "{:.2f} s, {:.2f}x fewer events stored".format(stats["seconds"], ratio, **stats))
+        print("  {calls} calls replace {called_events} events, the player expands them as it plays".format(**stats))
+
+    @staticmethod
+    def load_cost(path):
+        """
+        Returns (seconds taken to load a macro file, bytes of its columns and routines) for the player's MacroEvents
+        """
+        start = time.perf_counter()
+        store = MacroEvents.load(path)
+        seconds = time.perf_counter() - start
+        return seconds, store.nbytes() + sum(routine.nbytes() for routine in store.routines.values())
+
+
+def main(input_file, output_file, output_format, min_length, max_length, min_calls, time_tolerance, measure):
+    """
+    Folds repeats of a macro file of any supported format, written in the input's format unless output_format is given
+    """
+    reader = MacroReader(input_file)
+    folder = RoutineFolder(min_length, max_length, min_calls, time_tolerance)
+    events = folder.fold(MacroEvents.load(input_file))
+    output_format = output_format if output_format is not None else reader.format
+    if output_format == "binary":
+        write_binary(events, output_file)
+    else:
+        write_json(events, output_file, output_format)
+    folder.report()
+    before, after = os.path.getsize(input_file), os.path.getsize(output_file)
+    print("File: {} bytes ({}) -> {} bytes ({}), {:.2f}x smaller".format(before, reader.format, after, output_format,
+                                                                        before / after if after else 1.0))
+    if measure:
+        before_seconds, before_bytes = RoutineFolder.load_cost(input_file)
+        after_seconds, after_bytes = RoutineFolder.load_cost(output_file)
+        print("Load: {:.1f} ms -> {:.1f} ms, {} -> {} bytes held in memory".format(before_seconds * 1000, after_seconds * 1000,
+                                                                               before_bytes, after_bytes))
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("--input_file", type=str, required=True, help="String - Path to macro file to fold, any format")
+    argParser.add_argument("--output_file", type=str, required=True, help="String - Path to write folded macro to")
+    argParser.add_argument("--output_format", type=str, required=False, choices=["binary", "jsonl", "json"],
+                           help="String - Format to write must be 'binary', 'jsonl' or 'json', defaults to the input's format")
+    argParser.add_argument("--min_length", type=int, required=False, help="Integer - Fewest events in a routine")
+    argParser.add_argument("--max_length", type=int, required=False, help="Integer - Most events in a routine")
+    argParser.add_argument("--min_calls", type=int, required=False, help="Integer - Fewest repeats of a run of events to make it a routine")
+    argParser.add_argument("--time_tolerance", type=float, required=False, help="Float - Max seconds an event of a repeat can be from the routine's timing")
+    argParser.add_argument('--measure', action='store_true', help="Flag - Loads both macros and prints the change in load time and memory")
+    argParser.set_defaults(output_format=None, min_length=4, max_length=256, min_calls=3, time_tolerance=0.05, measure=False)
+    args = argParser.parse_args()
+
+    main(args.input_file, args.output_file, args.output_format, args.min_length, args.max_length, args.min_calls,
+         args.time_tolerance, args.measure)
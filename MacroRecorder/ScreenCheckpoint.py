@@ -0,0 +1,129 @@
+import sys
+import time
+import base64
+import hashlib
+import numpy as np
+
+# Largest width and height of a checkpoint region in pixels, keeps each capture and comparison cheap
+MAX_REGION = 64
+
+
+def x_root():
+    """
+    Returns root window of the X display, opened once with python-xlib
+    """
+    if not hasattr(x_root, "root"):
+        from Xlib import display
+        x_root.root = display.Display().screen().root
+    return x_root.root
+
+
+def screen_size():
+    """
+    Returns (width, height) of the screen in pixels
+    """
+    if sys.platform.startswith("linux"):
+        geometry = x_root().get_geometry()
+        return geometry.width, geometry.height
+    import pyautogui
+    return tuple(pyautogui.size())
+
+
+def grab_screen(left, top, width, height):
+    """
+    Returns (height, width, 3) uint8 RGB array of a screen region, which must be on screen.
+    On Linux only the region is read from the X server with python-xlib, which pynput already needs, so it also works
+    under Xvfb. Elsewhere pyautogui takes the screenshot.
+    """
+    if sys.platform.startswith("linux"):
+        from Xlib import X
+        raw = x_root().get_image(left, top, width, height, X.ZPixmap, 0xffffffff)
+        # Rows can be padded, pixels are BGRX on 32 bit and BGR on packed 24 bit visuals
+        pixels = np.frombuffer(raw.data, dtype=np.uint8)
+        row_bytes = len(pixels) // height
+        pixel_bytes = row_bytes // width
+        if pixel_bytes not in (3, 4) or len(pixels) != row_bytes * height:
+            raise ValueError("Screen checkpoints need a 24 or 32 bit X visual, got {} bytes per pixel".format(
+                len(pixels) / (width * height)))
+        return pixels.reshape(height, row_bytes)[:, :width * pixel_bytes].reshape(height, width, pixel_bytes)[:, :, 2::-1]
+    import pyautogui
+    return np.asarray(pyautogui.screenshot(region=(left, top, width, height)).convert("RGB"))
+
+
+class ScreenCheckpoint:
+    def __init__(self, region, template, tolerance=4.0):
+        """
+        Small screen region captured while recording that playback waits to see again before carrying on.
+        --------
+        Args:
+        --region: Tuple, (left, top, width, height) of the region, width and height at most MAX_REGION
+        --template: Array, (height, width, 3) uint8 RGB pixels of the region when recorded
+        --tolerance: Float, max mean absolute difference per channel, 0 to 255, for the region to count as matching
+        """
+        left, top, width, height = (int(value) for value in region)
+        if not (0 < width <= MAX_REGION and 0 < height <= MAX_REGION):
+            raise ValueError("Checkpoint regions must be between 1 and {} pixels wide and high".format(MAX_REGION))
+        self.region = (left, top, width, height)
+        self.template = np.ascontiguousarray(template, dtype=np.uint8).reshape(height, width, 3)
+        self.tolerance = tolerance
+        self.digest = hashlib.sha1(self.template.tobytes()).digest()
+
+    @staticmethod
+    def capture(x, y, size=32, tolerance=4.0, grab=grab_screen, screen=None):
+        """
+        Captures a size by size region centred on x, y as a checkpoint, moved inwards so it stays on screen near the edges.
+        screen is the (width, height) of the screen grab reads, the real screen's size by default
+        """
+        width, height = screen if screen is not None else screen_size()
+        size = max(1, min(int(size), MAX_REGION, width, height))
+        left = min(max(0, int(x) - size // 2), width - size)
+        top = min(max(0, int(y) - size // 2), height - size)
+        region = (left, top, size, size)
+        return ScreenCheckpoint(region, grab(*region), tolerance)
+
+    @staticmethod
+    def from_dict(checkpoint):
+        """
+        Returns checkpoint from the dict stored in a "wait_for" event
+        """
+        width, height = checkpoint["region"][2], checkpoint["region"][3]
+        template = np.frombuffer(base64.b64decode(checkpoint["template"]), dtype=np.uint8).reshape(height, width, 3)
+        return ScreenCheckpoint(checkpoint["region"], template, checkpoint.get("tolerance", 4.0))
+
+    def to_dict(self):
+        """
+        Returns dict stored in a "wait_for" event, the template is base64 encoded raw RGB
+        """
+        return {"region": list(self.region), "template": base64.b64encode(self.template.tobytes()).decode("ascii"),
+                "tolerance": self.tolerance}
+
+    def matches(self, pixels):
+        """
+        True when pixels are the template, or within tolerance of it
+        """
+        pixels = np.ascontiguousarray(pixels)
+        if hashlib.sha1(pixels.tobytes()).digest() == self.digest:
+            return True
+        if pixels.shape != self.template.shape:
+            return False
+        difference = np.abs(pixels.astype(np.int16) - self.template).mean()
+        return difference <= self.tolerance
+
+    def wait(self, grab, deadline, min_interval=0.005, max_interval=0.05):
+        """
+        Polls the region until it matches or the perf_counter deadline passes.
+        The interval between polls starts at min_interval and grows by half after each miss up to max_interval,
+        so fast responses are caught quickly and slow ones cost few captures. Never sleeps past the deadline.
+        Returns (perf_counter time matched or None on timeout, number of polls)
+        """
+        interval = min_interval
+        polls = 0
+        while True:
+            polls += 1
+            if self.matches(grab(*self.region)):
+                return time.perf_counter(), polls
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None, polls
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 1.5, max_interval)
@@ -0,0 +1,137 @@
+import io
+import os
+import math
+import argparse
+import contextlib
+import numpy as np
+from MacroReader import MacroReader
+from MacroEvents import MacroEvents
+from BinaryMacro import timed_events
+
+# Actions injected as a key or button input, and the RecordingBackend log entries they become
+INPUT_ACTIONS = {"pressed_key", "released_key", "pressed", "released", "tap", "click", "type"}
+INPUT_LOGS = {"key_press", "key_release", "mouse_press", "mouse_release", "tap", "click", "type"}
+
+
+class TimingValidator:
+    def __init__(self, quantum=0.01):
+        """
+        Reports the cumulative timing error of a recording, how far the time each event is saved at can be from when it
+        really happened, and of its playback, how far the time each input is injected at is from when it was recorded.
+        --------
+        Args:
+        --quantum: Float, seconds older recorders rounded each "timer" delta to
+        """
+        self.quantum = quantum
+
+    @staticmethod
+    def summary(errors):
+        """
+        Returns dict of statistics in milliseconds for an array of errors in seconds
+        """
+        if len(errors) == 0:
+            return {"events": 0}
+        absolute = np.abs(errors)
+        return {"events": len(errors), "mean_ms": float(absolute.mean()) * 1000, "max_ms": float(absolute.max()) * 1000,
+                "final_ms": float(errors[-1]) * 1000}
+
+    def delta_drift(self, times_ns):
+        """
+        Returns array of seconds each event would be off by had it been recorded as a delta from the previous event
+        rounded to quantum, the way older recorders saved them
+        """
+        deltas = np.diff(np.asarray(times_ns, dtype=np.int64), prepend=0) / 1e9
+        return np.cumsum(np.round(deltas / self.quantum) * self.quantum) - np.asarray(times_ns) / 1e9
+
+    def capture_error(self, path):
+        """
+        Returns dict describing the timing error of a macro file. Events saved with their absolute "time_ns" have none,
+        the drift the same recording would have carried as rounded deltas is given for comparison. For files of
+        rounded deltas only the bound and typical size of the error can be given, the real times were never saved
+        """
+        times_ns = []
+        timers = []
+        absolute = 0
+        for time_ns, event in timed_events(MacroReader(path)):
+            times_ns.append(time_ns)
+            if "time_ns" in event:
+                absolute += 1
+            else:
+                timers.append(event["timer"])
+        result = {"events": len(times_ns), "absolute": absolute, "duration": times_ns[-1] / 1e9 if times_ns else 0.0}
+        if absolute == len(times_ns):
+            result["error"] = self.summary(np.zeros(len(times_ns)))
+            result["delta_drift"] = self.summary(self.delta_drift(times_ns))
+            return result
+        steps = np.asarray(timers) / self.quantum
+        result["rounded"] = bool(np.all(np.abs(steps - np.rint(steps)) < 1e-6))
+        if result["rounded"]:
+            # Each delta is off by up to half a quantum, uniformly, so the error adds up like a random walk
+            result["bound_ms"] = len(timers) * self.quantum / 2 * 1000
+            result["typical_ms"] = math.sqrt(len(timers)) * self.quantum / math.sqrt(12) * 1000
+        return result
+
+    @staticmethod
+    def playback_error(path, movement_type="instant", timing="absolute"):
+        """
+        Plays a macro headless and returns array of seconds each injected input was off from its recorded time,
+        both measured from the first input so the time taken to start playback is not counted
+        """
+        # Imported here so checking a recording does not load the player
+        from MacroPlayer import MacroPlayer
+        from OutputBackend import RecordingBackend
+        events = MacroEvents.load(path)
+        recorded = np.array([event.time_ns for event in events if event.action in INPUT_ACTIONS], dtype=np.int64) / 1e9
+        backend = RecordingBackend(simulate_duration=False)
+        save_path, save_file = os.path.split(os.path.abspath(path))
+        player = MacroPlayer(save_path, save_file, movement_type, timing=timing, backend=backend, events=events)
+        with contextlib.redirect_stdout(io.StringIO()):
+            player.run()
+        injected = np.array([entry[0] for entry in backend.log if entry[1] in INPUT_LOGS])
+        if len(injected) != len(recorded):
+            raise ValueError("{} inputs were injected for {} recorded".format(len(injected), len(recorded)))
+        if len(recorded) == 0:
+            return recorded
+        return (injected - injected[0]) - (recorded - recorded[0])
+
+    def report(self, path, play=False, movement_type="instant", timing="absolute"):
+        """
+        Prints the timing error of a recording and, when play is set, of its playback
+        """
+        capture = self.capture_error(path)
+        print("{}: {} events over {:.2f} s, {} with absolute times".format(path, capture["events"], capture["duration"],
+                                                                         capture["absolute"]))
+        if "error" in capture:
+            print("Capture: no cumulative error, times are saved in ns from the start of recording")
+            if capture["delta_drift"]["events"]:
+                print("  As deltas rounded to {:g} s the recording would drift by {final_ms:+.1f} ms by its last event, "
+                      "max {max_ms:.1f} ms, mean {mean_ms:.1f} ms".format(self.quantum, **capture["delta_drift"]))
+        elif capture["rounded"]:
+            print("Capture: deltas rounded to {:g} s, cumulative error up to {:.1f} ms, typically {:.1f} ms by the last "
+                  "event".format(self.quantum, capture["bound_ms"], capture["typical_ms"]))
+        else:
+            print("Capture: deltas saved unrounded, cumulative error is below float precision")
+        if play:
+            stats = self.summary(self.playback_error(path, movement_type, timing))
+            if stats["events"] == 0:
+                print("Playback: no inputs to compare")
+                return
+            print("Playback ({} timing): {events} inputs, error against recorded times mean {mean_ms:.3f} ms, "
+                  "max {max_ms:.3f} ms, last input {final_ms:+.3f} ms".format(timing, **stats))
+
+
+def main(macro_file, quantum, play, movement_type, timing):
+    TimingValidator(quantum).report(macro_file, play, movement_type, timing)
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("--macro_file", type=str, required=True, help="String - Path to macro file to check, any format")
+    argParser.add_argument("--quantum", type=float, required=False, help="Float - Seconds older recordings rounded each delta to")
+    argParser.add_argument('--play', action='store_true', help="Flag - Also plays the macro headless, taking as long as it lasts, and compares input times against the recording")
+    argParser.add_argument("--movement_type", type=str, required=False, help="String - Mouse movement type played with must be 'instant','simple' or 'human'")
+    argParser.add_argument("--timing", type=str, required=False, help="String - How timers are waited on when playing must be 'relative' or 'absolute'")
+    argParser.set_defaults(quantum=0.01, play=False, movement_type="instant", timing="absolute")
+    args = argParser.parse_args()
+
+    main(args.macro_file, args.quantum, args.play, args.movement_type, args.timing)
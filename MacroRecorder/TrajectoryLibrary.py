@@ -0,0 +1,151 @@
+import os
+import time
+import pickle
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from GenerateCurve import GenerateCurve
+from NoiseAndTween import NoiseAndTween
+
+# Bump when the stored trajectory layout or generation changes so old library files are not reused
+LIBRARY_VERSION = 1
+
+
+class TrajectoryLibrary:
+    def __init__(self, variants=4, quantum=8, max_entries=4096, seed=None, path=None):
+        """
+        Cache of human movement trajectories keyed by quantised (dx, dy, number of points, variant).
+        Trajectories are stored normalised to their start and end, as progress along and distance across the straight line
+        in units of its length, so one entry is translated and stretched onto any move with about the same offset.
+        Each move picks one of variants trajectories for its key at random, so repeated moves still vary between plays.
+        Variant trajectories are generated from a seed derived from seed and their key, so a seeded library is reproducible
+        and generating one never disturbs the global random state.
+        --------
+        Args:
+        --variants: Int, number of different trajectories kept per quantised move
+        --quantum: Int, pixels dx and dy are rounded to for the key
+        --max_entries: Int, max trajectories held, the least recently used is evicted past this
+        --seed: Int, seed for variant generation and choice, random when None
+        --path: String, file the library is loaded from and saved to, None keeps it in memory only
+        """
+        self.variants = max(1, variants)
+        self.quantum = max(1, quantum)
+        self.max_entries = max_entries
+        self.seed = seed
+        self.path = path
+        self.random = random.Random(seed)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path is not None:
+            self.load()
+
+    @staticmethod
+    def generate(start, end, number_of_points, trace=None):
+        """
+        Returns (number_of_points, 2) array of a new human movement from start to end using the global random state.
+        Time taken is added to the "curve" and "tween" stages of a PlaybackTrace when one is given.
+        """
+        if trace is None:
+            curve = GenerateCurve(end[0], end[1], start=start, dense=False)
+            return np.asarray(NoiseAndTween(curve=curve, target_points=number_of_points).tweened_points, dtype=np.float64)
+        started = time.perf_counter()
+        curve = GenerateCurve(end[0], end[1], start=start, dense=False)
+        curved = time.perf_counter()
+        points = np.asarray(NoiseAndTween(curve=curve, target_points=number_of_points).tweened_points, dtype=np.float64)
+        trace.add("curve", curved - started)
+        trace.add("tween", time.perf_counter() - curved)
+        return points
+
+    def points(self, start, end, number_of_points):
+        """
+        Returns (number_of_points, 2) array of a human movement from start to end, from the library when possible
+        """
+        dx, dy = end[0] - start[0], end[1] - start[1]
+        key = (int(round(dx / self.quantum)), int(round(dy / self.quantum)), number_of_points)
+        if key[0] == 0 and key[1] == 0:
+            # Too short to normalise, these are cheap to generate
+            return self.generate(start, end, number_of_points)
+        with self.lock:
+            key = key + (self.random.randrange(self.variants),)
+            normalised = self.entries.get(key)
+            if normalised is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            else:
+                self.misses += 1
+                normalised = self.generate_variant(key)
+                self.entries[key] = normalised
+                if len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+        # Along the line scales with (dx, dy), across it with the perpendicular (-dy, dx)
+        points = normalised @ np.array([[dx, dy], [-dy, dx]], dtype=np.float64)
+        points[:, 0] += start[0]
+        points[:, 1] += start[1]
+        return points
+
+    def generate_variant(self, key):
+        """
+        Generates the normalised trajectory of a key from its own seed, restoring the global random states afterwards
+        """
+        qdx, qdy, number_of_points, variant = key
+        digest = hashlib.sha1(repr((self.seed, key)).encode("utf-8")).digest()
+        variant_seed = int.from_bytes(digest[:8], "little")
+        random_state = random.getstate()
+        np_random_state = np.random.get_state()
+        random.seed(variant_seed)
+        np.random.seed(variant_seed % 2 ** 32)
+        try:
+            dx, dy = qdx * self.quantum, qdy * self.quantum
+            points = self.generate((0, 0), (dx, dy), number_of_points)
+        finally:
+            random.setstate(random_state)
+            np.random.set_state(np_random_state)
+        length_squared = float(dx * dx + dy * dy)
+        along = (points[:, 0] * dx + points[:, 1] * dy) / length_squared
+        across = (points[:, 1] * dx - points[:, 0] * dy) / length_squared
+        return np.column_stack((along, across))
+
+    def load(self):
+        """
+        Loads trajectories saved by a library with the same quantum and seed, any other file is ignored
+        """
+        if self.path is None or not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as library_file:
+            stored = pickle.load(library_file)
+        if (stored.get("version"), stored.get("quantum"), stored.get("seed")) != (LIBRARY_VERSION, self.quantum, self.seed):
+            return
+        with self.lock:
+            self.entries.update(stored["entries"])
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def save(self):
+        """
+        Writes trajectories to self.path, through a temporary file so a killed run never leaves a partial library
+        """
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            stored = {"version": LIBRARY_VERSION, "quantum": self.quantum, "seed": self.seed, "entries": dict(self.entries)}
+        with open(self.path + ".tmp", "wb") as library_file:
+            pickle.dump(stored, library_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(self.path + ".tmp", self.path)
+
+    def report(self):
+        """
+        Prints hit rate and size of the library
+        """
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups * 100 if lookups else 0.0
+        print("Trajectory library: {} lookups, {} hits ({:.1f}%), {} generated, {} evicted, {} held".format(
+            lookups, self.hits, rate, self.misses, self.evictions, len(self.entries)))